@@ -0,0 +1,87 @@
+"""
+JWT authentication that avoids a user lookup on every request.
+
+Resolved users are kept in the ``AUTH_USER_CACHE_ALIAS`` cache (a per-worker
+LRU by default) under a key made of the user id and a version token. The
+tokens live in the ``AUTH_USER_VERSION_CACHE_ALIAS`` cache, which all workers
+share (a DatabaseCache), so a request costs one small cache read instead of a
+user lookup. Any change to the user row replaces its token (see
+accounts.signals), which makes every worker's cached copy unreachable at once;
+a deactivated, deleted or re-passworded user is not served from cache again.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def _cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+def _versions():
+    return caches[getattr(settings, 'AUTH_USER_VERSION_CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_id):
+    return f"auth:user-version:{user_id}"
+
+
+def _user_key(user_id, version):
+    return f"auth:user:{user_id}:v{version}"
+
+
+def _current_version(user_id):
+    versions = _versions()
+    key = _version_key(user_id)
+    version = versions.get(key)
+    if version is None:
+        # Never set, or culled: a fresh token cannot match a stale cached copy
+        versions.add(key, uuid.uuid4().hex, timeout=None)
+        version = versions.get(key)
+    return version
+
+
+def invalidate_cached_user(user_id) -> None:
+    """Make every worker's cached copy of this user unreachable."""
+    def bump():
+        _versions().set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+    bump()
+    # Again once the change commits, in case a request cached the old row meanwhile
+    transaction.on_commit(bump)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """Drop-in replacement for simplejwt's JWTAuthentication with a user cache."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cache = _cache()
+        key = _user_key(user_id, _current_version(user_id))
+        user = cache.get(key)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(key, user, timeout=getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60))
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
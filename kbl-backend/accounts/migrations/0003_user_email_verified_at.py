@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_avatar_user_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_verified_at',
+            field=models.DateTimeField(blank=True, help_text='When the user proved ownership of their email address', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_email_verified_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_thumbnails',
+            field=models.JSONField(blank=True, default=dict, help_text='{"<px>": {"webp": name, "jpeg": name}}, filled in by the process_avatars worker'),
+        ),
+    ]
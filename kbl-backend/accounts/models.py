@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -7,6 +8,11 @@ class User(AbstractUser):
     phone = models.CharField(max_length=32, blank=True)
     title = models.CharField(max_length=120, blank=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    avatar_thumbnails = models.JSONField(
+        default=dict, blank=True,
+        help_text='{"<px>": {"webp": name, "jpeg": name}}, filled in by the process_avatars worker',
+    )
+    email_verified_at = models.DateTimeField(null=True, blank=True, help_text='When the user proved ownership of their email address')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
@@ -14,4 +20,22 @@ class User(AbstractUser):
     class Meta:
         db_table = 'userprofile'
 
+    @property
+    def is_email_verified(self) -> bool:
+        return self.email_verified_at is not None
 
+    def mark_email_verified(self, when=None) -> bool:
+        """
+        Record email verification with a single conditional UPDATE.
+
+        Returns True if this call verified the user, False if they already were.
+        """
+        from .authentication import invalidate_cached_user
+
+        when = when or timezone.now()
+        updated = type(self).objects.filter(pk=self.pk, email_verified_at__isnull=True).update(email_verified_at=when)
+        if updated:
+            self.email_verified_at = when
+            # update() skips post_save, so drop the cached auth user explicitly
+            invalidate_cached_user(self.pk)
+        return bool(updated)
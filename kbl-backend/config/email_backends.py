@@ -1,34 +1,179 @@
 """
 Custom email backends for Django
 """
+import base64
 import logging
-import os
+import threading
+from email.utils import parseaddr
+
+import requests
+from django.conf import settings
 from django.core.mail.backends.base import BaseEmailBackend
-from django.core.mail.message import EmailMessage, EmailMultiAlternatives
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Email, Content, HtmlContent, PlainTextContent
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+# SendGrid v3 accepts at most 1000 personalizations, and 1000 recipients in total, per request
+SENDGRID_MAX_RECIPIENTS = 1000
+
+_sessions = threading.local()
+
+
+def _get_session() -> requests.Session:
+    """Return this thread's pooled HTTP session, creating it on first use."""
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _sessions.session = session
+    return session
+
+
+class SendGridBatchError(Exception):
+    """
+    Raised when some of the messages passed to send_messages could not be sent.
+
+    ``failed_messages`` maps each unsent message to its error, so callers can
+    retry just those; the rest were accepted by SendGrid.
+    """
+
+    def __init__(self, failed_messages, sent):
+        self.failed_messages = failed_messages
+        self.sent = sent
+        super().__init__(f"{len(failed_messages)} message(s) could not be sent via SendGrid")
+
+
+def _address(value):
+    name, email = parseaddr(value)
+    entry = {'email': email or value}
+    if name:
+        entry['name'] = name
+    return entry
+
 
 class SendGridEmailBackend(BaseEmailBackend):
     """
-    SendGrid email backend using the SendGrid Python SDK
+    SendGrid email backend talking to the v3 Web API over a pooled HTTP session.
+
+    Messages in one send_messages call that share sender, subject, bodies and
+    attachments are sent as a single API request with one personalization per
+    message, so a batch of identical notifications costs one round trip.
     """
-    
-    def __init__(self, fail_silently=False, **kwargs):
+
+    # send_messages raises SendGridBatchError naming exactly the failed messages
+    supports_partial_failures = True
+
+    def __init__(self, fail_silently=False, api_key=None, **kwargs):
         super().__init__(fail_silently=fail_silently, **kwargs)
-        self.api_key = os.getenv('SENDGRID_API_KEY', '')
-        self.from_email = os.getenv('DEFAULT_FROM_EMAIL', '')
-        self.from_name = os.getenv('DEFAULT_FROM_NAME', 'Kigali Business Lab')
-        
+        self.api_key = api_key or getattr(settings, 'SENDGRID_API_KEY', None) or ''
+        self.api_url = getattr(settings, 'SENDGRID_API_BASE_URL', 'https://api.sendgrid.com').rstrip('/') + '/v3/mail/send'
+        self.timeout = getattr(settings, 'SENDGRID_TIMEOUT', 10)
+        self.sandbox_mode = getattr(settings, 'SENDGRID_SANDBOX_MODE', False)
+        self.from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', '') or 'noreply@kigalibusinesslab.rw'
+        self.from_name = getattr(settings, 'DEFAULT_FROM_NAME', 'Kigali Business Lab')
+
         if not self.api_key:
             logger.warning("SENDGRID_API_KEY not set. SendGrid backend will fail.")
-        
-        if not self.from_email:
-            logger.warning("DEFAULT_FROM_EMAIL not set. Using default.")
-            self.from_email = 'noreply@kigalibusinesslab.rw'
-    
+
+    def _content_key(self, message):
+        """Everything in the request body except the recipients."""
+        html_content = None
+        for content, mimetype in getattr(message, 'alternatives', None) or []:
+            if mimetype == 'text/html':
+                html_content = content
+        attachments = tuple(
+            (filename, content if isinstance(content, bytes) else str(content).encode('utf-8'), mimetype)
+            for filename, content, mimetype in message.attachments
+        )
+        return (
+            message.from_email or self.from_email,
+            message.subject,
+            message.body or '',
+            html_content,
+            tuple(message.reply_to),
+            tuple(sorted(message.extra_headers.items())),
+            attachments,
+        )
+
+    def _payload(self, key, personalizations):
+        from_email, subject, text_content, html_content, reply_to, headers, attachments = key
+        sender = _address(from_email)
+        sender.setdefault('name', self.from_name)
+        content = []
+        if text_content:
+            content.append({'type': 'text/plain', 'value': text_content})
+        if html_content:
+            content.append({'type': 'text/html', 'value': html_content})
+        payload = {
+            'personalizations': personalizations,
+            'from': sender,
+            'subject': subject,
+            'content': content,
+        }
+        if reply_to:
+            payload['reply_to'] = _address(reply_to[0])
+        if headers:
+            payload['headers'] = dict(headers)
+        if attachments:
+            payload['attachments'] = [
+                {
+                    'filename': filename,
+                    'content': base64.b64encode(data).decode('ascii'),
+                    'type': mimetype or 'application/octet-stream',
+                }
+                for filename, data, mimetype in attachments
+            ]
+        if self.sandbox_mode:
+            payload['mail_settings'] = {'sandbox_mode': {'enable': True}}
+        return payload
+
+    def _post(self, payload):
+        response = _get_session().post(
+            self.api_url,
+            json=payload,
+            headers={'Authorization': f'Bearer {self.api_key}'},
+            timeout=self.timeout,
+        )
+        if not 200 <= response.status_code < 300:
+            raise Exception(f"SendGrid API error: {response.status_code} - {response.text[:500]}")
+
+    def _batches(self, email_messages, failed):
+        """
+        Yield (content key, [(message, personalization), ...]) request batches.
+
+        Messages that cannot be sent at all are recorded in ``failed`` instead.
+        """
+        groups = {}
+        for message in email_messages:
+            if not message.recipients():
+                logger.warning("No recipients in email message")
+                failed[message] = 'No recipients in email message'
+                continue
+            if not (message.body or getattr(message, 'alternatives', None)):
+                logger.warning(f"No content found in email message to {message.to}")
+                failed[message] = 'No content in email message'
+                continue
+            personalization = {}
+            for field in ('to', 'cc', 'bcc'):
+                addresses = getattr(message, field)
+                if addresses:
+                    personalization[field] = [_address(a) for a in addresses]
+            groups.setdefault(self._content_key(message), []).append((message, personalization))
+
+        for key, entries in groups.items():
+            batch, recipients = [], 0
+            for message, personalization in entries:
+                count = len(message.recipients())
+                if batch and recipients + count > SENDGRID_MAX_RECIPIENTS:
+                    yield key, batch
+                    batch, recipients = [], 0
+                batch.append((message, personalization))
+                recipients += count
+            if batch:
+                yield key, batch
+
     def send_messages(self, email_messages):
         """
         Send one or more EmailMessage objects and return the number of emails sent.
@@ -37,96 +182,23 @@ class SendGridEmailBackend(BaseEmailBackend):
             if not self.fail_silently:
                 raise ValueError("SENDGRID_API_KEY is required for SendGrid backend")
             return 0
-        
+
         if not email_messages:
             return 0
-        
+
         num_sent = 0
-        sg = SendGridAPIClient(api_key=self.api_key)
-        
-        for message in email_messages:
+        failed = {}
+        for key, batch in self._batches(email_messages, failed):
             try:
-                # Extract email details
-                to_emails = message.to
-                if not to_emails:
-                    logger.warning("No recipients in email message")
-                    continue
-                
-                # Use message.from_email if set, otherwise use default
-                from_email = message.from_email or self.from_email
-                
-                # Create SendGrid Mail object
-                mail = Mail(
-                    from_email=Email(from_email, self.from_name),
-                    to_emails=to_emails,
-                    subject=message.subject
-                )
-                
-                # Handle email content
-                # Check if message has HTML content
-                html_content = None
-                text_content = None
-                
-                if isinstance(message, EmailMultiAlternatives):
-                    for content, mimetype in message.alternatives:
-                        if mimetype == 'text/html':
-                            html_content = content
-                        elif mimetype == 'text/plain':
-                            text_content = content
-                
-                # Use body as text content if no alternatives
-                if not text_content and message.body:
-                    text_content = message.body
-                
-                # Set content
-                if html_content:
-                    mail.content = HtmlContent(html_content)
-                    if text_content:
-                        # SendGrid will automatically create plain text from HTML if only HTML is provided
-                        # But we can add both
-                        pass
-                elif text_content:
-                    mail.content = PlainTextContent(text_content)
-                else:
-                    logger.warning(f"No content found in email message to {to_emails}")
-                    continue
-                
-                # Add text content as alternative if HTML is present
-                if html_content and text_content:
-                    # SendGrid prefers HTML, but we'll set both
-                    mail.content = HtmlContent(html_content)
-                    # Note: SendGrid will use HTML as primary, text as fallback
-                
-                # Handle CC and BCC
-                if hasattr(message, 'cc') and message.cc:
-                    mail.cc = message.cc
-                
-                if hasattr(message, 'bcc') and message.bcc:
-                    mail.bcc = message.bcc
-                
-                # Handle reply-to
-                if hasattr(message, 'reply_to') and message.reply_to:
-                    mail.reply_to = Email(message.reply_to[0] if isinstance(message.reply_to, list) else message.reply_to)
-                
-                # Send email
-                response = sg.send(mail)
-                
-                # Check response status
-                if response.status_code >= 200 and response.status_code < 300:
-                    num_sent += 1
-                    logger.info(f"✅ Successfully sent email via SendGrid to {to_emails}")
-                else:
-                    logger.error(f"❌ SendGrid returned status {response.status_code}: {response.body}")
-                    if not self.fail_silently:
-                        raise Exception(f"SendGrid API error: {response.status_code} - {response.body}")
-            
+                self._post(self._payload(key, [personalization for _, personalization in batch]))
             except Exception as e:
-                logger.error(f"❌ Failed to send email via SendGrid to {to_emails if 'to_emails' in locals() else 'unknown'}: {str(e)}", exc_info=True)
-                if not self.fail_silently:
-                    raise
-        
-        return num_sent
-
-
-
+                logger.error(f"❌ Failed to send {len(batch)} email(s) via SendGrid: {str(e)}", exc_info=True)
+                for message, _ in batch:
+                    failed[message] = str(e)
+            else:
+                num_sent += len(batch)
+                logger.info(f"✅ Sent {len(batch)} email(s) via SendGrid in one request: {key[1]}")
 
+        if failed and not self.fail_silently:
+            raise SendGridBatchError(failed, num_sent)
+        return num_sent
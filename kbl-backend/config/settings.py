@@ -124,17 +124,70 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    # Proxies in front of gunicorn (Render's router, or nginx in docker-compose).
+    # Throttles key on the client address that many hops back in
+    # X-Forwarded-For; without it they key on the whole client-supplied header.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '1')),
+    'DEFAULT_THROTTLE_RATES': {
+        # Scopes used by diagnostic.throttling on the password-hashing endpoints
+        'auth_login': os.getenv('THROTTLE_AUTH_LOGIN', '20/min'),
+        'auth_login_email': os.getenv('THROTTLE_AUTH_LOGIN_EMAIL', '10/min'),
+        'auth_register': os.getenv('THROTTLE_AUTH_REGISTER', '10/hour'),
+        'auth_password': os.getenv('THROTTLE_AUTH_PASSWORD', '10/hour'),
+        'invitation_accept': os.getenv('THROTTLE_INVITATION_ACCEPT', '20/hour'),
+    },
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
 
 # JWT Settings
+# Caches
+# 'auth_users' holds resolved users for accounts.authentication.CachedJWTAuthentication.
+# Local memory is a per-worker LRU; its entries are keyed by the per-user
+# version tokens in 'auth_versions', which accounts.signals replaces on change.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'auth_users': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth-users',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('AUTH_USER_CACHE_MAX_ENTRIES', '5000'))},
+    },
+    # Shared by all workers so an invalidation reaches every worker's
+    # 'auth_users' cache; stored in the throttle table under its own prefix
+    'auth_versions': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'throttle_cache',
+        'KEY_PREFIX': 'auth',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    # Shared by all workers so auth throttles count every attempt; the table
+    # is created by diagnostic migration 0010
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'throttle_cache',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+AUTH_USER_CACHE_ALIAS = 'auth_users'
+AUTH_USER_VERSION_CACHE_ALIAS = 'auth_versions'
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', '60'))
+THROTTLE_CACHE_ALIAS = 'throttle'
+
+# Password hashing concurrency (diagnostic.throttling.limit_password_hashing).
+# Keep the host-wide cap below the gunicorn worker count so at least one
+# worker is always free for regular API traffic.
+PASSWORD_HASHING_MAX_CONCURRENCY = int(os.getenv('PASSWORD_HASHING_MAX_CONCURRENCY', '2'))
+PASSWORD_HASHING_MAX_CONCURRENCY_PER_WORKER = int(os.getenv('PASSWORD_HASHING_MAX_CONCURRENCY_PER_WORKER', '1'))
+PASSWORD_HASHING_WAIT_SECONDS = float(os.getenv('PASSWORD_HASHING_WAIT_SECONDS', '2'))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=2),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=14),
@@ -208,8 +261,12 @@ if csrf_origins_env:
     CSRF_TRUSTED_ORIGINS.extend([origin.strip() for origin in csrf_origins_env.split(',') if origin.strip()])
 
 # SendGrid Email Configuration (Only SendGrid)
-EMAIL_BACKEND = "sendgrid_backend.SendgridBackend"
+# Pooled v3 API client that batches identical messages (config/email_backends.py)
+EMAIL_BACKEND = "config.email_backends.SendGridEmailBackend"
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
+# Point at a stub server for local benchmarks and tests
+SENDGRID_API_BASE_URL = os.getenv('SENDGRID_API_BASE_URL', 'https://api.sendgrid.com')
+SENDGRID_TIMEOUT = float(os.getenv('SENDGRID_TIMEOUT', '10'))
 # CRITICAL: Set to False in production to send real emails
 # If True, emails only go to verified recipients in SendGrid
 SENDGRID_SANDBOX_MODE_IN_DEBUG = False
@@ -275,6 +332,26 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploaded files are stored once per distinct content (see diagnostic.storage)
+STORAGES = {
+    'default': {'BACKEND': 'diagnostic.storage.ContentAddressedStorage'},
+    # What Django 5 already used: it no longer reads STATICFILES_STORAGE
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Hash uploads while they stream in, so storage need not read them again
+FILE_UPLOAD_HANDLERS = [
+    'diagnostic.storage.HashingMemoryFileUploadHandler',
+    'diagnostic.storage.HashingTemporaryFileUploadHandler',
+]
+# How diagnostic.media.serve_media hands file bodies to the front server:
+# 'accel' (nginx X-Accel-Redirect), 'sendfile' (Apache/lighttpd X-Sendfile)
+# or empty to stream from Django
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', '')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Lifetime of the signed download links handed out by the API, in seconds
+MEDIA_URL_MAX_AGE = int(os.getenv('MEDIA_URL_MAX_AGE', str(6 * 60 * 60)))
+# Chunked upload sessions expire this many seconds after their last chunk
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 60 * 60)))
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
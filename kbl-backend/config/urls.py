@@ -16,8 +16,6 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.conf import settings
-from django.conf.urls.static import static
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
@@ -35,53 +33,45 @@ schema_view = get_schema_view(
 # Health check endpoint
 def health_check(request):
     from django.http import JsonResponse
-    return JsonResponse({'status': 'ok'}, status=200)
+    from diagnostic.throttling import metrics_snapshot
+    # Auth throttling counters are per worker
+    return JsonResponse({'status': 'ok', 'auth_throttling': metrics_snapshot()}, status=200)
 
 # Migration status endpoint (for debugging)
 def migration_status(request):
+    """Answered from the per-worker schema capability registry, not the catalog."""
     from django.http import JsonResponse
-    from django.db import connection
+    from diagnostic import capabilities
+    
+    if request.GET.get('refresh') == '1':
+        # A refresh re-runs the catalog probes; anonymous callers could use it
+        # to load the database, so it takes a staff (admin) session
+        if not request.user.is_staff:
+            return JsonResponse({'detail': 'Refreshing requires a staff session'}, status=403)
+        capabilities.invalidate()
+    caps = capabilities.get_capabilities()
     
     status = {
-        'database_connected': False,
-        'team_members_table_exists': False,
-        'migrations_applied': True
+        'database_connected': caps['database_connected'],
+        'team_members_table_exists': 'team_members' in caps['tables'],
+        'migrations_applied': caps['database_connected'] and not caps['pending_migrations'],
+        'applied_migrations': caps['applied_migrations'],
+        'pending_migrations': caps['pending_migrations'],
+        'probed_at': caps['probed_at'],
     }
     
-    try:
-        # Check database connection
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-            status['database_connected'] = True
-            
-            # Check if team_members table exists
-            cursor.execute("""
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'team_members'
-            """)
-            status['team_members_table_exists'] = cursor.fetchone() is not None
-            
-            # Check other important tables
-            important_tables = [
-                'diagnostic_enterprise',
-                'diagnostic_question',
-                'accounts_user',
-                'diagnostic_teammember'
-            ]
-            for table in important_tables:
-                cursor.execute("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = %s
-                """, [table])
-                status[table] = cursor.fetchone() is not None
-                
-    except Exception as e:
-        status['error'] = str(e)
-        status['migrations_applied'] = False
+    # Check other important tables
+    important_tables = [
+        'diagnostic_enterprise',
+        'diagnostic_question',
+        'accounts_user',
+        'diagnostic_teammember'
+    ]
+    for table in important_tables:
+        status[table] = table in caps['tables']
+    
+    if caps['error']:
+        status['error'] = caps['error']
     
     return JsonResponse(status, status=200)
 
@@ -96,15 +86,9 @@ urlpatterns = [
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
 
-# Serve media files in both development and production
-# In production, consider using a CDN or object storage service
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-else:
-    # In production, serve media files through Django (for Render)
-    # For better performance, consider using AWS S3, Cloudinary, or similar
-    from django.views.static import serve
-    from django.urls import re_path
-    urlpatterns += [
-        re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
-    ]
+# Media files go through a permission check; the file body itself is sent by
+# nginx (X-Accel-Redirect) when MEDIA_OFFLOAD is set, see diagnostic.media
+from diagnostic.media import serve_media
+urlpatterns += [
+    re_path(r'^media/(?P<path>.*)$', serve_media, name='media'),
+]
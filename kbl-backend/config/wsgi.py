@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Probe the schema once per worker so requests never hit information_schema
+from diagnostic.capabilities import warm  # noqa: E402
+
+warm()
+
+# Compile the email templates up front rather than on the first send
+from diagnostic.email_templates import compile_all  # noqa: E402
+
+compile_all()
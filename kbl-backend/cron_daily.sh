@@ -0,0 +1,33 @@
+#!/bin/bash
+# Daily scheduled jobs for Render cron
+# Each job is independent; a failure is logged but does not stop the rest
+
+echo "=========================================="
+echo "Running KBL daily jobs"
+echo "=========================================="
+
+echo ""
+echo "Sending action item digests..."
+python manage.py send_action_digests || echo "⚠ Action item digests failed"
+
+echo ""
+echo "Pruning expired JWT tokens..."
+python manage.py prune_tokens || echo "⚠ Token pruning failed"
+
+echo ""
+echo "Sweeping expired OTPs..."
+python manage.py sweep_otps || echo "⚠ OTP sweep failed"
+
+echo ""
+echo "Pruning finished outbox emails..."
+python manage.py prune_outbox || echo "⚠ Outbox pruning failed"
+
+# Weekly progress reports go out on Mondays
+if [ "$(date +%u)" = "1" ]; then
+    echo ""
+    echo "Queueing weekly progress reports..."
+    python manage.py send_weekly_reports || echo "⚠ Weekly progress reports failed"
+fi
+
+# sweep_uploads and gc_media need the media disk, which only the web service
+# has; start.sh runs them there
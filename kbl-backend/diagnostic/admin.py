@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Question, Enterprise, QuestionResponse, ScoreSummary, Attachment
+from .models import Category, Question, Enterprise, QuestionResponse, ScoreSummary, Attachment, EmailOutbox, StoredBlob, UploadSession, AvatarThumbnailJob, EnterpriseReport
 
 
 @admin.register(Category)
@@ -31,8 +31,8 @@ class QuestionResponseAdmin(admin.ModelAdmin):
 
 @admin.register(ScoreSummary)
 class ScoreSummaryAdmin(admin.ModelAdmin):
-    list_display = ("id", "enterprise", "overall_percentage", "calculated_at")
-    readonly_fields = ("calculated_at",)
+    list_display = ("id", "enterprise", "overall_percentage", "version", "calculated_at")
+    readonly_fields = ("calculated_at", "version")
 
 
 @admin.register(Attachment)
@@ -40,4 +40,43 @@ class AttachmentAdmin(admin.ModelAdmin):
     list_display = ("id", "response", "file", "uploaded_at")
     list_filter = ("uploaded_at",)
 
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "subject", "status", "attempts", "next_attempt_at", "sent_at", "created_at")
+    list_filter = ("status", "kind")
+    search_fields = ("subject", "to")
+    readonly_fields = ("created_at", "updated_at", "sent_at", "last_error")
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "target", "filename", "size", "status", "expires_at", "created_at")
+    list_filter = ("status", "target")
+    search_fields = ("filename", "user__email")
+    readonly_fields = ("received_chunks", "created_at", "updated_at")
+
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ("name", "size", "ref_count", "created_at")
+    search_fields = ("name", "sha256")
+    readonly_fields = ("name", "sha256", "size", "ref_count", "created_at", "updated_at")
+
+
+@admin.register(AvatarThumbnailJob)
+class AvatarThumbnailJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "status", "attempts", "created_at", "updated_at")
+    list_filter = ("status",)
+    search_fields = ("user__email",)
+    readonly_fields = ("source", "last_error", "created_at", "updated_at")
+
+
+@admin.register(EnterpriseReport)
+class EnterpriseReportAdmin(admin.ModelAdmin):
+    list_display = ("id", "enterprise", "version", "status", "attempts", "updated_at")
+    list_filter = ("status",)
+    search_fields = ("enterprise__name",)
+    readonly_fields = ("html", "pdf", "last_error", "created_at", "updated_at")
+
 # Register your models here.
@@ -0,0 +1,249 @@
+"""
+Avatar processing.
+
+``AvatarUploadView`` only checks that the upload is an image Pillow can read
+of at most ``MAX_UPLOAD_PIXELS`` (``validate_image``, a header check) and
+queues an ``AvatarThumbnailJob``.
+The ``process_avatars`` worker then decodes the image once, applies its EXIF
+orientation and writes, without any metadata:
+
+* square WebP and JPEG thumbnails at ``THUMBNAIL_SIZES``;
+* a re-encoded original of at most ``MAX_SOURCE_SIZE`` pixels, which replaces
+  the upload so location and camera data in EXIF are not served.
+
+Thumbnail names are kept in ``User.avatar_thumbnails``; ``avatar_url`` picks
+the smallest thumbnail at least as large as the size asked for and falls back
+to the original until the worker has run.
+"""
+import io
+import logging
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import AvatarThumbnailJob
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (32, 64, 256)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+MAX_SOURCE_SIZE = 1024
+MAX_UPLOAD_PIXELS = 25_000_000
+MAX_ATTEMPTS = 3
+RETRY_DELAY = timedelta(minutes=1)
+
+User = get_user_model()
+
+
+class InvalidImage(Exception):
+    """The upload is not an image Pillow can decode safely."""
+
+
+def validate_image(file):
+    """
+    Cheap header-only check that ``file`` is a readable image of at most
+    ``MAX_UPLOAD_PIXELS``; rewinds the file.
+    """
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+            if width * height > MAX_UPLOAD_PIXELS:
+                raise InvalidImage(f'Image is {width}x{height}, at most {MAX_UPLOAD_PIXELS // 1_000_000} megapixels are allowed')
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError) as e:
+        raise InvalidImage(str(e) or 'Unreadable image')
+    finally:
+        file.seek(0)
+
+
+def _open(data):
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEG can decode straight at a reduced scale, which is most of the work for big photos
+        image.draft('RGB', (MAX_SOURCE_SIZE, MAX_SOURCE_SIZE))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError) as e:
+        raise InvalidImage(str(e) or 'Unreadable image')
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    return image.convert('RGBA' if has_alpha else 'RGB'), has_alpha
+
+
+def _encode(image, fmt, options):
+    if fmt == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    # No exif/icc arguments: the output carries no metadata
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def render_avatar(data):
+    """
+    Return ``(source_bytes, source_ext, {size: {fmt: bytes}})`` for an uploaded image.
+
+    The source is re-encoded PNG when it has transparency, JPEG otherwise.
+    """
+    image, has_alpha = _open(data)
+    source = image.copy()
+    source.thumbnail((MAX_SOURCE_SIZE, MAX_SOURCE_SIZE), Image.LANCZOS)
+    if has_alpha:
+        source_bytes, source_ext = _encode(source, 'PNG', {'optimize': True}), 'png'
+    else:
+        source_bytes, source_ext = _encode(source, 'JPEG', THUMBNAIL_FORMATS['jpeg'][1]), 'jpg'
+
+    thumbnails = {}
+    # Largest first, each resized from the previous one: cheaper than always from the source
+    current = source
+    for size in sorted(THUMBNAIL_SIZES, reverse=True):
+        current = ImageOps.fit(current, (size, size), Image.LANCZOS)
+        thumbnails[size] = {
+            key: _encode(current, fmt, options) for key, (fmt, options) in THUMBNAIL_FORMATS.items()
+        }
+    return source_bytes, source_ext, thumbnails
+
+
+def _release(names):
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: [default_storage.delete(name) for name in names])
+
+
+def thumbnail_names(user):
+    return [name for formats in (user.avatar_thumbnails or {}).values() for name in formats.values()]
+
+
+def release_thumbnails(user):
+    """Drop the user's thumbnails; the caller saves ``avatar_thumbnails``."""
+    _release(thumbnail_names(user))
+    user.avatar_thumbnails = {}
+
+
+def queue_thumbnails(user):
+    """Queue processing of the user's current avatar, replacing any pending job."""
+    AvatarThumbnailJob.objects.filter(user=user, status=AvatarThumbnailJob.STATUS_PENDING).update(
+        status=AvatarThumbnailJob.STATUS_DONE, last_error='Superseded by a newer upload', updated_at=timezone.now(),
+    )
+    return AvatarThumbnailJob.objects.create(user=user, source=user.avatar.name)
+
+
+def _process(job):
+    user = job.user
+    if user.avatar.name != job.source:
+        return 'superseded'
+    with default_storage.open(job.source, 'rb') as handle:
+        data = handle.read()
+    source_bytes, source_ext, rendered = render_avatar(data)
+
+    stem = f"avatars/{user.pk}"
+    new_source = default_storage.save(f"{stem}.{source_ext}", ContentFile(source_bytes))
+    thumbnails = {
+        str(size): {
+            key: default_storage.save(f"{stem}_{size}.{'jpg' if key == 'jpeg' else key}", ContentFile(encoded))
+            for key, encoded in formats.items()
+        }
+        for size, formats in rendered.items()
+    }
+    old_thumbnails = thumbnail_names(user)
+
+    # Only if the avatar is still the one this job was queued for
+    updated = User.objects.filter(pk=user.pk, avatar=job.source).update(
+        avatar=new_source, avatar_thumbnails=thumbnails,
+    )
+    if not updated:
+        _release([new_source, *(name for formats in thumbnails.values() for name in formats.values())])
+        return 'superseded'
+    _release([job.source, *old_thumbnails])
+
+    from accounts.authentication import invalidate_cached_user
+
+    # update() skips post_save, so drop the cached auth user explicitly. That
+    # only reaches this process's cache; the avatar views re-read the row
+    invalidate_cached_user(user.pk)
+    return 'done'
+
+
+def process_due(batch_size=20):
+    """
+    Claim up to ``batch_size`` due pending jobs and generate their thumbnails.
+
+    A failed attempt is retried ``RETRY_DELAY`` times its attempt number later.
+
+    Returns counts of ``done``, ``retrying`` and ``failed`` jobs; all zero means
+    nothing was pending.
+    """
+    counts = {'done': 0, 'retrying': 0, 'failed': 0}
+    with transaction.atomic():
+        jobs = list(
+            AvatarThumbnailJob.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('user')
+            .filter(status=AvatarThumbnailJob.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('created_at')[:batch_size]
+        )
+        for job in jobs:
+            job.attempts += 1
+            try:
+                with transaction.atomic():
+                    outcome = _process(job)
+            except InvalidImage as e:
+                job.status = AvatarThumbnailJob.STATUS_FAILED
+                job.last_error = f'Invalid image: {e}'[:2000]
+                counts['failed'] += 1
+                logger.warning(f"Avatar job #{job.pk} for user {job.user_id}: {job.last_error}")
+            except Exception as e:
+                job.last_error = f'{type(e).__name__}: {e}'[:2000]
+                if job.attempts >= MAX_ATTEMPTS:
+                    job.status = AvatarThumbnailJob.STATUS_FAILED
+                    counts['failed'] += 1
+                    logger.error(f"Giving up on avatar job #{job.pk} after {job.attempts} attempt(s): {job.last_error}")
+                else:
+                    job.next_attempt_at = timezone.now() + RETRY_DELAY * job.attempts
+                    counts['retrying'] += 1
+                    logger.warning(f"Avatar job #{job.pk} attempt {job.attempts} failed, retrying: {job.last_error}")
+            else:
+                job.status = AvatarThumbnailJob.STATUS_DONE
+                job.last_error = '' if outcome == 'done' else 'Superseded by a newer upload'
+                counts['done'] += 1
+            job.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at', 'updated_at'])
+    return counts
+
+
+def is_avatar_file(name):
+    """Whether ``name`` is some user's avatar or avatar thumbnail (both are public)."""
+    matches = Q(avatar=name)
+    for size in THUMBNAIL_SIZES:
+        for key in THUMBNAIL_FORMATS:
+            # contains (jsonb @>), since a numeric key path would be read as an array index
+            matches |= Q(avatar_thumbnails__contains={str(size): {key: name}})
+    return User.objects.filter(matches).exists()
+
+
+def avatar_url(request, user, size=256, fmt='webp'):
+    """Absolute URL of the user's avatar at ``size`` px, or '' without an avatar."""
+    if not user.avatar:
+        return ''
+    thumbnails = user.avatar_thumbnails or {}
+    fitting = [int(px) for px in thumbnails if int(px) >= size]
+    name = thumbnails[str(min(fitting))].get(fmt) if fitting else None
+    url = default_storage.url(name) if name else user.avatar.url
+    return url if url.startswith('http') else request.build_absolute_uri(url)
+
+
+def avatar_urls(request, user):
+    """``{"<px>": {"webp": url, "jpeg": url}}`` for every generated thumbnail."""
+    return {
+        px: {key: request.build_absolute_uri(default_storage.url(name)) for key, name in formats.items()}
+        for px, formats in (user.avatar_thumbnails or {}).items()
+    } if user.avatar else {}
@@ -0,0 +1,86 @@
+"""
+Per-process registry of what the database schema currently supports.
+
+The schema only changes when ``migrate`` runs, so instead of querying
+information_schema on every request we probe the catalog once per worker
+(warmed from config/wsgi.py) and keep the result in memory. The registry is
+invalidated by the post_migrate signal (see diagnostic.signals) so a process
+that ran migrations re-probes on next use. Other workers pick up the new
+schema when they restart, which every deploy does after migrating.
+"""
+import logging
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# A failed probe (e.g. database not reachable yet) is retried after this many seconds
+FAILED_PROBE_RETRY_SECONDS = 30
+
+_lock = threading.Lock()
+_state = None
+
+
+def _probe(using=DEFAULT_DB_ALIAS):
+    from django.db.migrations.executor import MigrationExecutor
+
+    connection = connections[using]
+    state = {
+        'database_connected': False,
+        'tables': frozenset(),
+        'applied_migrations': 0,
+        'pending_migrations': [],
+        'probed_at': time.time(),
+        'error': None,
+    }
+    try:
+        state['tables'] = frozenset(connection.introspection.table_names())
+        state['database_connected'] = True
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        state['applied_migrations'] = len(executor.loader.applied_migrations)
+        state['pending_migrations'] = [f"{m.app_label}.{m.name}" for m, backwards in plan if not backwards]
+    except Exception as e:
+        logger.warning(f"Schema capability probe failed: {str(e)}")
+        state['error'] = str(e)
+    return state
+
+
+def _is_usable(state):
+    if state is None:
+        return False
+    return state['database_connected'] or time.time() - state['probed_at'] < FAILED_PROBE_RETRY_SECONDS
+
+
+def get_capabilities():
+    """Return the cached capability state, probing the database if needed."""
+    global _state
+    state = _state
+    if _is_usable(state):
+        return state
+    with _lock:
+        if not _is_usable(_state):
+            _state = _probe()
+        return _state
+
+
+def has_table(table_name: str) -> bool:
+    return table_name in get_capabilities()['tables']
+
+
+def invalidate():
+    """Drop the cached state; the next lookup probes the database again."""
+    global _state
+    with _lock:
+        _state = None
+
+
+def warm():
+    """Probe eagerly at worker startup. Never raises."""
+    try:
+        invalidate()
+        get_capabilities()
+    except Exception as e:
+        logger.warning(f"Could not warm schema capabilities: {str(e)}")
@@ -0,0 +1,142 @@
+"""
+Registry of the transactional emails the app sends.
+
+Each email type names a subject (an inline template string) and its plain-text
+and HTML templates. The templates are compiled once per worker process, on
+first use or from ``compile_all`` at startup, and both variants are rendered
+from the same context. ``render_emails``/``build_emails`` render a whole batch
+against the compiled templates, so bulk sends (invitations, digests) parse
+nothing per message.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.template import Context, engines
+
+
+@dataclass(frozen=True)
+class EmailTemplate:
+    subject: str
+    text_template: str
+    html_template: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class RenderedEmail:
+    subject: str
+    body: str
+    html_body: str = ''
+
+
+EMAIL_TEMPLATES: Dict[str, EmailTemplate] = {
+    'verification': EmailTemplate(
+        subject='Verify your email address for Kigali Business Lab',
+        text_template='emails/verify_email.txt',
+        html_template='emails/verify_email.html',
+    ),
+    'team_invitation': EmailTemplate(
+        subject="You've been invited to join {{ enterprise_name }} on Kigali Business Lab",
+        text_template='emails/team_invitation.txt',
+        html_template='emails/team_invitation.html',
+    ),
+    'password_reset': EmailTemplate(
+        subject='Password reset instructions',
+        text_template='emails/password_reset.txt',
+    ),
+    'email_otp': EmailTemplate(
+        subject='Your verification code',
+        text_template='emails/email_otp.txt',
+    ),
+    'test_notification': EmailTemplate(
+        subject='Test Notification from Kigali Business Lab',
+        text_template='emails/test_notification.txt',
+        html_template='emails/test_notification.html',
+    ),
+    'action_digest': EmailTemplate(
+        subject=(
+            '{% if overdue_total %}{{ overdue_total }} overdue action item(s) need attention'
+            '{% else %}Action items due soon{% endif %}'
+        ),
+        text_template='emails/action_digest.txt',
+        html_template='emails/action_digest.html',
+    ),
+    'weekly_report': EmailTemplate(
+        subject='Your weekly progress report for {{ enterprise_name }}',
+        text_template='emails/weekly_report.txt',
+        html_template='emails/weekly_report.html',
+    ),
+}
+
+_lock = threading.Lock()
+_compiled = {}
+
+
+def _compile(kind: str):
+    compiled = _compiled.get(kind)
+    if compiled is not None:
+        return compiled
+    spec = EMAIL_TEMPLATES[kind]
+    with _lock:
+        if kind not in _compiled:
+            engine = engines['django'].engine
+            _compiled[kind] = (
+                engine.from_string(spec.subject),
+                engine.get_template(spec.text_template),
+                engine.get_template(spec.html_template) if spec.html_template else None,
+            )
+        return _compiled[kind]
+
+
+def compile_all() -> None:
+    """Compile every registered template now rather than on first send."""
+    for kind in EMAIL_TEMPLATES:
+        _compile(kind)
+
+
+def render_emails(kind: str, contexts: Iterable[dict]) -> List[RenderedEmail]:
+    """Render subject, text and HTML for each context with the compiled templates."""
+    subject_template, text_template, html_template = _compile(kind)
+    plain = Context(autoescape=False)
+    html = Context()
+    rendered = []
+    for values in contexts:
+        with plain.push(values):
+            # Subjects must be a single line
+            subject = ' '.join(subject_template.render(plain).split())
+            body = text_template.render(plain).strip() + '\n'
+        html_body = ''
+        if html_template is not None:
+            with html.push(values):
+                html_body = html_template.render(html)
+        rendered.append(RenderedEmail(subject=subject, body=body, html_body=html_body))
+    return rendered
+
+
+def render_email(kind: str, context: dict) -> RenderedEmail:
+    return render_emails(kind, [context])[0]
+
+
+def build_emails(kind: str, items: Iterable[Tuple[object, dict]], from_email: Optional[str] = None) -> List[dict]:
+    """
+    Render ``(to, context)`` pairs into ``enqueue_email`` keyword arguments.
+
+    ``to`` is an address or a list of addresses.
+    """
+    items = list(items)
+    rendered = render_emails(kind, (context for _, context in items))
+    return [
+        {
+            'to': [to] if isinstance(to, str) else list(to),
+            'subject': email.subject,
+            'body': email.body,
+            'html_body': email.html_body,
+            'from_email': from_email,
+            'kind': kind,
+        }
+        for (to, _), email in zip(items, rendered)
+    ]
+
+
+def build_email(kind: str, to, context: dict, from_email: Optional[str] = None) -> dict:
+    return build_emails(kind, [(to, context)], from_email=from_email)[0]
@@ -0,0 +1,102 @@
+"""
+Management command to resolve legacy ``ActionItem.assigned_to`` emails into
+``assigned_to_user``.
+
+Safe to interrupt and re-run: resolved rows drop out of the scan, and
+``--start-after`` lets a run pick up from the last id it reported.
+"""
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Lower
+
+from diagnostic.models import ActionItem, Enterprise, TeamMember
+from diagnostic.reports import bump_report_version
+
+
+class Command(BaseCommand):
+    help = "Link legacy assigned_to emails on action items to user accounts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of action items to scan per batch (default: 500)',
+        )
+        parser.add_argument(
+            '--start-after',
+            type=int,
+            default=0,
+            help='Resume from the first action item id greater than this value',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be linked without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        last_id = options['start_after']
+        dry_run = options['dry_run']
+
+        scanned = 0
+        linked = 0
+        while True:
+            batch = list(
+                ActionItem.objects
+                .filter(pk__gt=last_id, assigned_to_user__isnull=True, assigned_to__contains='@')
+                .order_by('pk')
+                .values_list('id', 'enterprise_id', 'assigned_to')[:batch_size]
+            )
+            if not batch:
+                break
+
+            last_id = batch[-1][0]
+            scanned += len(batch)
+
+            # Only link to people who actually belong to the item's enterprise:
+            # its owner, or a team member who has accepted the invitation.
+            enterprise_ids = {enterprise_id for _, enterprise_id, _ in batch if enterprise_id}
+            emails = {assigned_to.strip().lower() for _, _, assigned_to in batch}
+            candidates = {}
+            for enterprise_id, email, user_id in (
+                TeamMember.objects
+                .annotate(email_lower=Lower('email'))
+                .filter(enterprise_id__in=enterprise_ids, email_lower__in=emails, user__isnull=False)
+                .values_list('enterprise_id', 'email_lower', 'user_id')
+            ):
+                candidates[(enterprise_id, email)] = user_id
+            for enterprise_id, email, user_id in (
+                Enterprise.objects
+                .annotate(owner_email=Lower('owner__email'))
+                .filter(pk__in=enterprise_ids, owner_email__in=emails)
+                .values_list('id', 'owner_email', 'owner_id')
+            ):
+                candidates[(enterprise_id, email)] = user_id
+
+            ids_by_user = {}
+            linked_enterprise_ids = set()
+            for item_id, enterprise_id, assigned_to in batch:
+                user_id = candidates.get((enterprise_id, assigned_to.strip().lower()))
+                if user_id:
+                    ids_by_user.setdefault(user_id, []).append(item_id)
+                    linked_enterprise_ids.add(enterprise_id)
+
+            batch_linked = sum(len(ids) for ids in ids_by_user.values())
+            if not dry_run:
+                for user_id, ids in ids_by_user.items():
+                    ActionItem.objects.filter(
+                        pk__in=ids, assigned_to_user__isnull=True
+                    ).update(assigned_to_user_id=user_id)
+                # Reports show assignees; update() skips the signals that invalidate them
+                bump_report_version(linked_enterprise_ids)
+            linked += batch_linked
+
+            self.stdout.write(
+                f"Scanned up to id {last_id}: linked {batch_linked} of {len(batch)} item(s)"
+            )
+
+        verb = 'Would link' if dry_run else 'Linked'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {linked} of {scanned} legacy assignment(s). Last id: {last_id}"
+        ))
@@ -0,0 +1,126 @@
+"""
+Management command that compares the Python and Postgres-assembled board
+payloads on a synthetic board. All fixture rows are created inside a
+transaction that is rolled back at the end.
+"""
+import json
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from diagnostic.models import ActionItem, Enterprise
+from diagnostic.views import ActionItemViewSet
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark the board endpoint with Python vs Postgres JSON assembly"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cards',
+            type=int,
+            default=1000,
+            help='Number of cards on the synthetic board (default: 1000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='Timed requests per mode (default: 10)',
+        )
+
+    def seed(self, cards):
+        owner = User.objects.create_user(
+            username='board-benchmark', email='board-benchmark@example.invalid', password=None,
+        )
+        enterprise = Enterprise.objects.create(owner=owner, name='Board Benchmark')
+        members = [
+            User.objects.create_user(
+                username=f'board-benchmark-{i}', email=f'member{i}@example.invalid', password=None,
+                first_name=f'Member{i}', last_name='Bench' if i % 2 else '',
+            )
+            for i in range(10)
+        ]
+        statuses = [ActionItem.STATUS_TODO, ActionItem.STATUS_INPROGRESS, ActionItem.STATUS_COMPLETED]
+        today = timezone.localdate()
+        ActionItem.objects.bulk_create([
+            ActionItem(
+                owner=owner,
+                enterprise=enterprise,
+                title=f'Benchmark card {i}',
+                source='benchmark',
+                status=statuses[i % 3],
+                order=i,
+                due_date=today + timedelta(days=i % 30) if i % 4 else None,
+                assigned_to_user=members[i % 10] if i % 3 else None,
+                assigned_to='' if i % 3 else f'first.last{i}@example.invalid',
+                progress_percentage=i % 101,
+            )
+            for i in range(cards)
+        ], batch_size=1000)
+        return owner
+
+    def run_mode(self, view, owner, query, repeat):
+        factory = APIRequestFactory()
+        timings = []
+        body = b''
+        queries = 0
+        for _ in range(repeat):
+            request = factory.get('/api/action-items/board/', query)
+            force_authenticate(request, user=owner)
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = view(request)
+                if getattr(response, 'streaming', False):
+                    body = b''.join(response.streaming_content)
+                else:
+                    response.render()
+                    body = response.content
+                timings.append(time.perf_counter() - start)
+            queries = len(ctx.captured_queries)
+        timings.sort()
+        return {
+            'median_ms': timings[len(timings) // 2] * 1000,
+            'min_ms': timings[0] * 1000,
+            'queries': queries,
+            'bytes': len(body),
+            'payload': json.loads(body),
+        }
+
+    def handle(self, *args, **options):
+        cards = max(1, options['cards'])
+        repeat = max(1, options['repeat'])
+        view = ActionItemViewSet.as_view({'get': 'board'})
+
+        try:
+            with transaction.atomic():
+                owner = self.seed(cards)
+                python_path = self.run_mode(view, owner, {}, repeat)
+                db_path = self.run_mode(view, owner, {'assemble': 'db'}, repeat)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"Board with {cards} cards, {repeat} requests per mode")
+        for label, result in (('python', python_path), ('db', db_path)):
+            self.stdout.write(
+                f"  {label:<7} median {result['median_ms']:8.2f} ms  "
+                f"min {result['min_ms']:8.2f} ms  "
+                f"{result['queries']} queries  {result['bytes']} bytes"
+            )
+        if python_path['payload'] == db_path['payload']:
+            self.stdout.write(self.style.SUCCESS("Payloads match"))
+        else:
+            self.stdout.write(self.style.ERROR("Payloads differ"))
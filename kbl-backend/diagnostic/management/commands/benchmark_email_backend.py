@@ -0,0 +1,148 @@
+"""
+Management command that measures SendGrid backend send throughput against a
+local stub of the v3 mail/send API, comparing one SDK client and request per
+message with the pooled, batching config.email_backends backend.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.mail import EmailMultiAlternatives
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+
+class _StubSendGrid(BaseHTTPRequestHandler):
+    """Accepts POST /v3/mail/send like SendGrid does (202, empty body)."""
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    lock = threading.Lock()
+    requests = 0
+    personalizations = 0
+    connections = set()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            type(self).requests += 1
+            type(self).personalizations += len(payload.get('personalizations', []))
+            type(self).connections.add(self.client_address)
+        status = 202 if self.path == '/v3/mail/send' and payload.get('personalizations') else 400
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.requests = 0
+            cls.personalizations = 0
+            cls.connections = set()
+
+
+class Command(BaseCommand):
+    help = "Benchmark SendGrid email delivery against a local stub API server"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=500,
+            help='Number of messages to send per mode (default: 500)',
+        )
+        parser.add_argument(
+            '--distinct',
+            type=int,
+            default=5,
+            help='Number of distinct message bodies among them (default: 5)',
+        )
+        parser.add_argument(
+            '--latency-ms',
+            type=float,
+            default=20.0,
+            help='Simulated API latency per request in milliseconds (default: 20)',
+        )
+
+    def build_messages(self, count, distinct):
+        messages = []
+        for i in range(count):
+            variant = i % max(1, distinct)
+            message = EmailMultiAlternatives(
+                subject=f'Benchmark notice {variant}',
+                body=f'Plain body {variant}',
+                from_email='bench@example.invalid',
+                to=[f'recipient{i}@example.invalid'],
+            )
+            message.attach_alternative(f'<p>HTML body {variant}</p>', 'text/html')
+            messages.append(message)
+        return messages
+
+    def send_per_message(self, base_url, messages):
+        """The previous behaviour: a fresh SDK client and one request per message."""
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Email, HtmlContent, Mail
+
+        sent = 0
+        sg = SendGridAPIClient(api_key='benchmark', host=base_url)
+        for message in messages:
+            mail = Mail(
+                from_email=Email(message.from_email, 'Kigali Business Lab'),
+                to_emails=message.to,
+                subject=message.subject,
+            )
+            mail.content = HtmlContent(message.alternatives[0][0])
+            if 200 <= sg.send(mail).status_code < 300:
+                sent += 1
+        return sent
+
+    def send_batched(self, base_url, messages):
+        from config.email_backends import SendGridEmailBackend
+
+        with override_settings(SENDGRID_API_BASE_URL=base_url, SENDGRID_API_KEY='benchmark'):
+            return SendGridEmailBackend().send_messages(messages)
+
+    def run_mode(self, label, send, base_url, messages):
+        _StubSendGrid.reset()
+        started = time.perf_counter()
+        sent = send(base_url, messages)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:<12} sent {sent:>5} in {elapsed * 1000:8.1f} ms "
+            f"({sent / elapsed if elapsed else 0:8.1f} msg/s), "
+            f"{_StubSendGrid.requests} request(s), {len(_StubSendGrid.connections)} connection(s)"
+        )
+        return elapsed
+
+    def handle(self, *args, **options):
+        count = max(1, options['messages'])
+        _StubSendGrid.latency = max(0.0, options['latency_ms']) / 1000
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _StubSendGrid)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        self.stdout.write(
+            f"Stub SendGrid at {base_url}, {count} messages, {options['distinct']} distinct, "
+            f"{options['latency_ms']:.0f} ms latency"
+        )
+
+        try:
+            per_message = self.run_mode(
+                'per-message', self.send_per_message, base_url, self.build_messages(count, options['distinct']),
+            )
+            batched = self.run_mode(
+                'batched', self.send_batched, base_url, self.build_messages(count, options['distinct']),
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {per_message / batched:.1f}x"))
@@ -0,0 +1,222 @@
+"""
+Management command that finds files under MEDIA_ROOT that no database row
+refers to and deletes or quarantines them.
+
+The tree is walked with ``os.scandir``; candidate paths are checked against
+the DB ``--chunk-size`` at a time with one ``IN`` query per referencing
+column (attachments, action documents, avatars, reports) plus one for avatar
+thumbnails. Files younger than ``--min-age-hours`` are left alone, since an
+upload may have written its file but not yet committed its row. Unreferenced
+content-addressed blobs are re-checked and removed, with their StoredBlob
+row, while holding the row locks storage saves take; a blob whose row still
+counts references and changed within ``--min-age-hours`` is kept, since its
+referencing row may not be committed yet.
+
+``uploads/`` belongs to ``sweep_uploads`` and is not walked. Without
+``--delete`` or ``--quarantine`` the command only reports. It must run where
+MEDIA_ROOT is the web service's media directory.
+"""
+import itertools
+import os
+import shutil
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from diagnostic.models import ActionItemDocument, Attachment, EnterpriseReport, StoredBlob
+from diagnostic.storage import CAS_PREFIX, is_blob
+
+# (model, file field) pairs whose values are paths relative to MEDIA_ROOT
+FILE_REFERENCES = [
+    (Attachment, 'file'),
+    (ActionItemDocument, 'file'),
+    (get_user_model(), 'avatar'),
+    (EnterpriseReport, 'html'),
+    (EnterpriseReport, 'pdf'),
+]
+
+# Thumbnail names sit two levels down in User.avatar_thumbnails ({"64": {"webp": name}})
+THUMBNAILS_SQL = f"""
+    SELECT DISTINCT names.name
+    FROM {get_user_model()._meta.db_table} u
+    CROSS JOIN LATERAL jsonb_each(u.avatar_thumbnails) sizes
+    CROSS JOIN LATERAL jsonb_each_text(sizes.value) AS names(format, name)
+    WHERE u.avatar_thumbnails <> '{{}}'::jsonb AND names.name = ANY(%s)
+"""
+
+SKIPPED_DIRS = ('uploads',)
+
+
+class Command(BaseCommand):
+    help = "Delete or quarantine media files that no database row refers to"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Paths checked against the database per query (default: 1000)',
+        )
+        parser.add_argument(
+            '--min-age-hours',
+            type=float,
+            default=24,
+            help='Leave files modified more recently than this alone (default: 24)',
+        )
+        action = parser.add_mutually_exclusive_group()
+        action.add_argument(
+            '--delete',
+            action='store_true',
+            help='Delete orphaned files',
+        )
+        action.add_argument(
+            '--quarantine',
+            metavar='DIR',
+            help='Move orphaned files into DIR (outside MEDIA_ROOT), keeping their relative paths',
+        )
+
+    def walk(self, root, skip):
+        """Yield (relative path, DirEntry) for every regular file under root."""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.path not in skip:
+                                stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield os.path.relpath(entry.path, root).replace(os.sep, '/'), entry
+            except FileNotFoundError:
+                continue
+
+    def referenced(self, paths):
+        """The subset of ``paths`` some row refers to."""
+        found = set()
+        for model, field in FILE_REFERENCES:
+            found.update(model.objects.filter(**{f'{field}__in': paths}).values_list(field, flat=True))
+        with connection.cursor() as cursor:
+            cursor.execute(THUMBNAILS_SQL, [list(paths)])
+            found.update(row[0] for row in cursor.fetchall())
+        return found
+
+    def release_blobs(self, root, names, quarantine, cutoff):
+        """
+        Dispose of unreferenced blobs and their StoredBlob rows; return the
+        names that must be kept.
+
+        A blob is kept if a row refers to it, or if it still counts references
+        and its row changed after ``cutoff``: storage commits a new reference
+        before the attachment or document that holds it is inserted.
+        """
+        if not names:
+            return []
+        with transaction.atomic():
+            # Untracked blobs get a row too, so every name has a lock to hold
+            StoredBlob.objects.bulk_create(
+                [StoredBlob(name=name, sha256=os.path.basename(name).split('.')[0]) for name in names],
+                ignore_conflicts=True,
+            )
+            # The lock storage._save takes before it checks for the file, so
+            # no upload can claim a blob between the re-check and the unlink
+            locked = StoredBlob.objects.select_for_update().filter(name__in=names)
+            kept = self.referenced(names)
+            kept.update(locked.filter(ref_count__gt=0, updated_at__gte=cutoff).values_list('name', flat=True))
+            released = [name for name in names if name not in kept]
+            StoredBlob.objects.filter(name__in=released).delete()
+            for name in released:
+                try:
+                    self.dispose(root, name, quarantine)
+                except FileNotFoundError:
+                    pass
+        return [name for name in names if name in kept]
+
+    def dispose(self, root, path, quarantine):
+        source = os.path.join(root, path)
+        if quarantine:
+            target = os.path.join(quarantine, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(source, target)
+        else:
+            os.remove(source)
+
+    def prune_empty_dirs(self, root, directories):
+        """Remove the given directories and their parents up to root, where empty."""
+        for directory in sorted(directories, key=len, reverse=True):
+            while directory:
+                try:
+                    os.rmdir(os.path.join(root, directory))
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+
+    def handle(self, *args, **options):
+        root = os.path.realpath(str(settings.MEDIA_ROOT))
+        if not os.path.isdir(root):
+            raise CommandError(f"MEDIA_ROOT {root} does not exist")
+        quarantine = options['quarantine']
+        if quarantine:
+            quarantine = os.path.realpath(quarantine)
+            if quarantine == root or quarantine.startswith(root + os.sep):
+                raise CommandError('--quarantine must be outside MEDIA_ROOT')
+        act = options['delete'] or bool(quarantine)
+        chunk_size = max(1, options['chunk_size'])
+        cutoff = time.time() - options['min_age_hours'] * 3600
+        row_cutoff = timezone.now() - timedelta(hours=options['min_age_hours'])
+        skip = {os.path.join(root, name) for name in SKIPPED_DIRS}
+        spool_dir = os.path.join(root, CAS_PREFIX, 'tmp')
+
+        scanned = scanned_bytes = orphans = orphan_bytes = 0
+        emptied = set()
+        candidates = (
+            (path, entry) for path, entry in self.walk(root, skip)
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff
+        )
+        while True:
+            chunk = list(itertools.islice(candidates, chunk_size))
+            if not chunk:
+                break
+            sizes = {path: entry.stat(follow_symlinks=False).st_size for path, entry in chunk}
+            scanned += len(chunk)
+            scanned_bytes += sum(sizes.values())
+            # Spool files left by interrupted saves are never referenced
+            paths = [path for path, entry in chunk if not entry.path.startswith(spool_dir + os.sep)]
+            referenced = self.referenced(paths) if paths else set()
+            unreferenced = [path for path in sizes if path not in referenced]
+            blobs = set()
+            if act:
+                blobs = {path for path in unreferenced if path in paths and is_blob(path)}
+                kept = self.release_blobs(root, sorted(blobs), quarantine, row_cutoff)
+                unreferenced = [path for path in unreferenced if path not in kept]
+
+            orphans += len(unreferenced)
+            orphan_bytes += sum(sizes[path] for path in unreferenced)
+            for path in unreferenced:
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f"  orphan: {path} ({sizes[path]} bytes)")
+                if act:
+                    if path not in blobs:
+                        try:
+                            self.dispose(root, path, quarantine)
+                        except FileNotFoundError:
+                            pass
+                    emptied.add(os.path.dirname(path))
+
+        if act:
+            self.prune_empty_dirs(root, emptied)
+            verb = 'Quarantined' if quarantine else 'Deleted'
+            self.stdout.write(self.style.SUCCESS(
+                f"Scanned {scanned} file(s) ({scanned_bytes} bytes); "
+                f"{verb} {orphans} orphaned file(s), reclaiming {orphan_bytes} bytes"
+            ))
+        else:
+            self.stdout.write(
+                f"Scanned {scanned} file(s) ({scanned_bytes} bytes); {orphans} orphaned file(s) "
+                f"({orphan_bytes} bytes) would be reclaimed with --delete or --quarantine DIR"
+            )
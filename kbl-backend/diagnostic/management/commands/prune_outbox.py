@@ -0,0 +1,49 @@
+"""
+Management command to delete delivered and failed emails from the outbox.
+
+Outbox bodies carry OTP codes, verification links and password reset links,
+so finished rows are only kept for ``--days`` days for troubleshooting.
+Pending rows are never touched.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from diagnostic.models import EmailOutbox
+from diagnostic.outbox import prune_finished
+
+
+class Command(BaseCommand):
+    help = "Delete sent and failed outbox emails older than a few days"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Keep finished emails for this many days (default: 7)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows to delete per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many emails would be deleted without deleting anything',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=max(0, options['days']))
+        if options['dry_run']:
+            count = EmailOutbox.objects.filter(
+                status__in=[EmailOutbox.STATUS_SENT, EmailOutbox.STATUS_FAILED], updated_at__lt=cutoff,
+            ).count()
+            self.stdout.write(f"{count} finished outbox email(s) would be deleted")
+            return
+
+        deleted = prune_finished(cutoff, batch_size=max(1, options['batch_size']))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} finished outbox email(s)"))
@@ -0,0 +1,85 @@
+"""
+Management command to delete expired JWT refresh tokens from the
+token_blacklist tables.
+
+Unlike simplejwt's ``flushexpiredtokens``, which removes everything in one
+statement, this works through the table in small batches, each in its own
+short transaction, so it never holds long row locks on a table that every
+token refresh writes to. Safe to interrupt and re-run.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding and blacklisted JWT tokens in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of outstanding tokens to delete per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=1,
+            help='Only prune tokens that expired at least this many hours ago (default: 1)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Seconds to sleep between batches to leave room for other writers (default: 0.05)',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=0,
+            help='Stop after this many batches; 0 means run until done',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many tokens would be pruned without deleting anything',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        cutoff = timezone.now() - timedelta(hours=max(0, options['grace_hours']))
+        expired = OutstandingToken.objects.filter(expires_at__lt=cutoff)
+
+        if options['dry_run']:
+            outstanding = expired.count()
+            blacklisted = BlacklistedToken.objects.filter(token__expires_at__lt=cutoff).count()
+            self.stdout.write(self.style.SUCCESS(
+                f"Would prune {outstanding} outstanding and {blacklisted} blacklisted token(s) expired before {cutoff:%Y-%m-%d %H:%M}"
+            ))
+            return
+
+        batches = 0
+        outstanding_deleted = 0
+        blacklisted_deleted = 0
+        while True:
+            # Walks the expires_at index; each batch only locks the rows it deletes
+            ids = list(expired.order_by('expires_at').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                blacklisted_deleted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                outstanding_deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+            batches += 1
+            if options['max_batches'] and batches >= options['max_batches']:
+                break
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {outstanding_deleted} outstanding and {blacklisted_deleted} blacklisted token(s) in {batches} batch(es)"
+        ))
@@ -0,0 +1,72 @@
+"""
+Management command that renders enterprise reports queued by report downloads.
+
+Runs as a long-lived worker by default, polling for pending reports;
+``--once`` renders what is currently queued and exits. It must run where
+MEDIA_ROOT is the web service's media directory. Several workers can run at
+once: reports are claimed with SKIP LOCKED.
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from diagnostic.reports import process_due
+
+
+class Command(BaseCommand):
+    help = "Render queued enterprise reports to HTML and PDF"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5,
+            help='Number of reports to claim and render per batch (default: 5)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when nothing is queued (default: 2)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process everything currently queued, then exit',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        poll_interval = max(0.1, options['poll_interval'])
+        self._stopping = False
+
+        def stop(signum, frame):
+            self._stopping = True
+
+        if not options['once']:
+            signal.signal(signal.SIGTERM, stop)
+            signal.signal(signal.SIGINT, stop)
+            self.stdout.write(f"Report worker started (batch size {batch_size})")
+
+        totals = {'done': 0, 'retrying': 0, 'failed': 0}
+        while not self._stopping:
+            counts = process_due(batch_size=batch_size)
+            for key, value in counts.items():
+                totals[key] += value
+
+            if any(counts.values()):
+                self.stdout.write(
+                    f"Rendered {counts['done']}, retrying {counts['retrying']}, failed {counts['failed']}"
+                )
+                continue
+            if options['once']:
+                break
+            time.sleep(poll_interval)
+            # Drop connections the database closed while we were idle
+            close_old_connections()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reports: rendered {totals['done']}, retrying {totals['retrying']}, failed {totals['failed']}"
+        ))
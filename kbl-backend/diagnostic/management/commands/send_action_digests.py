@@ -0,0 +1,155 @@
+"""
+Management command that emails each owner and assignee a digest of their
+overdue and soon-due action items. Meant to run once a day from cron.
+
+Items are streamed from a single query ordered by recipient, so only one
+recipient's items and one batch of messages are held in memory at a time.
+Digests go to the email outbox with a dedupe key per recipient and day, so
+re-running the command the same day queues nothing twice.
+"""
+import itertools
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import CharField, F, Value
+from django.utils import timezone
+
+from diagnostic.email_templates import build_emails
+from diagnostic.models import ActionItem, EmailOutbox
+from diagnostic.outbox import enqueue_emails
+
+ITEM_FIELDS = ('id', 'title', 'priority', 'status', 'due_date')
+
+
+class Command(BaseCommand):
+    help = "Email owners and assignees a digest of overdue and upcoming action items"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days-ahead',
+            type=int,
+            default=3,
+            help='Include items due within this many days (default: 3)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of digests queued per insert (default: 50)',
+        )
+        parser.add_argument(
+            '--max-items',
+            type=int,
+            default=25,
+            help='Maximum items listed in one digest (default: 25)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Build digests without queueing them',
+        )
+
+    def digest_rows(self, today, horizon):
+        """One row per (recipient, item), ordered by recipient then due date."""
+        due = (
+            ActionItem.objects
+            .filter(due_date__isnull=False, due_date__lte=horizon)
+            .exclude(status=ActionItem.STATUS_COMPLETED)
+        )
+        as_owner = (
+            due
+            .filter(owner__is_active=True)
+            .exclude(owner__notification_preferences__email_notifications=False)
+            .values(
+                *ITEM_FIELDS,
+                enterprise_name=F('enterprise__name'),
+                recipient_id=F('owner_id'),
+                recipient_email=F('owner__email'),
+                recipient_first_name=F('owner__first_name'),
+                role=Value('owner', output_field=CharField()),
+            )
+        )
+        as_assignee = (
+            due
+            .filter(assigned_to_user__isnull=False, assigned_to_user__is_active=True)
+            .exclude(assigned_to_user=F('owner'))
+            .exclude(assigned_to_user__notification_preferences__email_notifications=False)
+            .values(
+                *ITEM_FIELDS,
+                enterprise_name=F('enterprise__name'),
+                recipient_id=F('assigned_to_user_id'),
+                recipient_email=F('assigned_to_user__email'),
+                recipient_first_name=F('assigned_to_user__first_name'),
+                role=Value('assignee', output_field=CharField()),
+            )
+        )
+        return as_owner.union(as_assignee, all=True).order_by('recipient_id', 'due_date', 'id')
+
+    def build_digest(self, rows, today, max_items):
+        first = rows[0]
+        overdue = [r for r in rows if r['due_date'] < today]
+        upcoming = [r for r in rows if r['due_date'] >= today]
+        overdue_total = len(overdue)
+        omitted = max(0, len(rows) - max_items)
+        overdue = overdue[:max_items]
+        upcoming = upcoming[:max_items - len(overdue)]
+
+        frontend_url = getattr(settings, 'FRONTEND_URL', '').rstrip('/')
+        is_owner = any(r['role'] == 'owner' for r in rows)
+        context = {
+            'recipient_name': first['recipient_first_name'] or first['recipient_email'],
+            'overdue': overdue,
+            'upcoming': upcoming,
+            'overdue_total': overdue_total,
+            'omitted': omitted,
+            'action_url': f"{frontend_url}/action-plan" if is_owner else f"{frontend_url}/team-portal",
+        }
+        return first['recipient_email'], context
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        horizon = today + timedelta(days=max(0, options['days_ahead']))
+        batch_size = max(1, options['batch_size'])
+        max_items = max(1, options['max_items'])
+        dry_run = options['dry_run']
+        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
+
+        rows = self.digest_rows(today, horizon).iterator(chunk_size=2000)
+
+        built = 0
+        queued = 0
+        skipped = 0
+        batch = []
+
+        def flush():
+            nonlocal queued, skipped
+            if not batch:
+                return
+            seen = set(
+                EmailOutbox.objects
+                .filter(dedupe_key__in=[key for key, _ in batch])
+                .values_list('dedupe_key', flat=True)
+            )
+            fresh = [(key, item) for key, item in batch if key not in seen]
+            messages = build_emails('action_digest', (item for _, item in fresh), from_email=from_email)
+            for (key, _), message in zip(fresh, messages):
+                message['dedupe_key'] = key
+            if not dry_run:
+                # A concurrent run may have queued some of these since the check
+                enqueue_emails(messages, ignore_conflicts=True)
+            queued += len(messages)
+            skipped += len(batch) - len(fresh)
+            batch.clear()
+
+        for recipient_id, group in itertools.groupby(rows, key=lambda r: r['recipient_id']):
+            batch.append((f"action_digest:{recipient_id}:{today.isoformat()}", self.build_digest(list(group), today, max_items)))
+            built += 1
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+        action = 'Would queue' if dry_run else 'Queued'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {queued} of {built} digest(s); {skipped} were already queued today"
+        ))
@@ -0,0 +1,71 @@
+"""
+Management command that delivers queued emails from the EmailOutbox table.
+
+Runs as a long-lived worker by default, polling for due rows; ``--once``
+drains what is currently due and exits (useful from cron or by hand).
+Several workers can run at once: rows are claimed with SKIP LOCKED.
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from diagnostic.outbox import deliver_due
+
+
+class Command(BaseCommand):
+    help = "Deliver pending emails from the outbox, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of emails to claim and send per batch (default: 50)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait when nothing is due (default: 5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send everything currently due, then exit',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        poll_interval = max(0.1, options['poll_interval'])
+        self._stopping = False
+
+        def stop(signum, frame):
+            self._stopping = True
+
+        if not options['once']:
+            signal.signal(signal.SIGTERM, stop)
+            signal.signal(signal.SIGINT, stop)
+            self.stdout.write(f"Outbox worker started (batch size {batch_size})")
+
+        totals = {'sent': 0, 'retrying': 0, 'failed': 0}
+        while not self._stopping:
+            counts = deliver_due(batch_size=batch_size)
+            for key, value in counts.items():
+                totals[key] += value
+
+            if any(counts.values()):
+                self.stdout.write(
+                    f"Sent {counts['sent']}, retrying {counts['retrying']}, failed {counts['failed']}"
+                )
+                continue
+            if options['once']:
+                break
+            time.sleep(poll_interval)
+            # Drop connections the database closed while we were idle
+            close_old_connections()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Outbox: sent {totals['sent']}, retrying {totals['retrying']}, failed {totals['failed']}"
+        ))
@@ -0,0 +1,219 @@
+"""
+Management command that queues each opted-in enterprise owner a weekly
+progress report: score change, assessments taken and action item activity.
+Meant to run once a week from cron.
+
+Recipients are streamed from a server-side cursor in chunks. For each chunk
+the weekly figures come from three grouped queries (score baselines, session
+counts, action item counts) rather than per-user lookups. Rendering happens
+in a process pool while the next chunk is queried, and rendered emails go to
+the outbox with one insert per chunk. At most ``--workers * 2`` chunks are in
+flight, so memory stays bounded however many users there are.
+"""
+import itertools
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from diagnostic.email_templates import build_emails, compile_all
+from diagnostic.models import ActionItem, AssessmentSession, ScoreSummary
+from diagnostic.outbox import enqueue_emails
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def _render_chunk(items, from_email):
+    """Pool worker: render one chunk of (address, context) pairs."""
+    return build_emails('weekly_report', items, from_email=from_email)
+
+
+def _percent(value):
+    return float(value) if value is not None else None
+
+
+class Command(BaseCommand):
+    help = "Queue weekly progress reports for users who opted in"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Length of the reporting period in days (default: 7)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Users per chunk, for both the cursor and the outbox insert (default: 1000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=max(0, min(4, (os.cpu_count() or 1) - 1)),
+            help='Rendering processes; 0 renders inline (default: one per spare CPU, up to 4)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Compute and render the reports without queueing them',
+        )
+
+    def recipients(self):
+        # No preference row means the defaults apply, and both flags default to on
+        opted_in = (
+            Q(notification_preferences__isnull=True)
+            | Q(notification_preferences__weekly_reports=True, notification_preferences__email_notifications=True)
+        )
+        return (
+            User.objects
+            .filter(opted_in, is_active=True, enterprise__isnull=False)
+            .values('id', 'email', 'first_name', 'enterprise__id', 'enterprise__name')
+            .order_by('id')
+        )
+
+    def weekly_figures(self, enterprise_ids, start, now):
+        """Return {enterprise_id: {...}} for the chunk using grouped queries."""
+        figures = {
+            eid: {'overall': None, 'baseline': None, 'assessments': 0,
+                  'completed': 0, 'created': 0, 'open': 0, 'overdue': 0}
+            for eid in enterprise_ids
+        }
+        for row in ScoreSummary.objects.filter(enterprise_id__in=enterprise_ids).values(
+            'enterprise_id', 'overall_percentage',
+        ):
+            figures[row['enterprise_id']]['overall'] = _percent(row['overall_percentage'])
+
+        # Latest score recorded before the period started (DISTINCT ON enterprise_id)
+        baselines = (
+            AssessmentSession.objects
+            .filter(enterprise_id__in=enterprise_ids, created_at__lt=start)
+            .order_by('enterprise_id', '-created_at')
+            .distinct('enterprise_id')
+            .values('enterprise_id', 'overall_percentage')
+        )
+        for row in baselines:
+            figures[row['enterprise_id']]['baseline'] = _percent(row['overall_percentage'])
+
+        sessions = (
+            AssessmentSession.objects
+            .filter(enterprise_id__in=enterprise_ids, created_at__gte=start, created_at__lt=now)
+            .values('enterprise_id')
+            .annotate(total=Count('id'))
+        )
+        for row in sessions:
+            figures[row['enterprise_id']]['assessments'] = row['total']
+
+        today = timezone.localdate()
+        not_done = ~Q(status=ActionItem.STATUS_COMPLETED)
+        actions = (
+            ActionItem.objects
+            .filter(enterprise_id__in=enterprise_ids)
+            .values('enterprise_id')
+            .annotate(
+                completed=Count('id', filter=Q(completed_at__gte=start, completed_at__lt=now)),
+                created=Count('id', filter=Q(created_at__gte=start, created_at__lt=now)),
+                open=Count('id', filter=not_done),
+                overdue=Count('id', filter=not_done & Q(due_date__lt=today)),
+            )
+        )
+        for row in actions:
+            enterprise_figures = figures[row.pop('enterprise_id')]
+            enterprise_figures.update(row)
+        return figures
+
+    def build_chunk(self, users, start, now, dashboard_url):
+        figures = self.weekly_figures([u['enterprise__id'] for u in users], start, now)
+        items = []
+        for user in users:
+            data = figures[user['enterprise__id']]
+            if data['overall'] is None and not (data['open'] or data['completed'] or data['created']):
+                # Nothing assessed and no action plan yet: nothing to report
+                continue
+            delta = None
+            if data['overall'] is not None and data['baseline'] is not None:
+                delta = round(data['overall'] - data['baseline'], 2)
+            items.append((user['email'], {
+                'recipient_name': user['first_name'] or user['email'],
+                'enterprise_name': user['enterprise__name'],
+                'week_start': start.date(),
+                'week_end': now.date(),
+                'overall': data['overall'],
+                'delta': delta,
+                'assessments': data['assessments'],
+                'completed': data['completed'],
+                'created': data['created'],
+                'open': data['open'],
+                'overdue': data['overdue'],
+                'dashboard_url': dashboard_url,
+            }))
+        return items
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        start = now - timedelta(days=max(1, options['days']))
+        batch_size = max(1, options['batch_size'])
+        workers = max(0, options['workers'])
+        dry_run = options['dry_run']
+        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
+        dashboard_url = f"{getattr(settings, 'FRONTEND_URL', '').rstrip('/')}/dashboard"
+
+        compile_all()
+        pool = None
+        if workers:
+            # Fork the renderers before any database connection exists, so
+            # no child inherits a socket it might later close
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+            # A fork pool starts all of its processes on the first submit
+            pool.submit(int).result()
+
+        users_seen = 0
+        queued = 0
+        skipped = 0
+        pending = deque()
+
+        def collect(result):
+            nonlocal queued
+            if not dry_run:
+                enqueue_emails(result)
+            queued += len(result)
+
+        try:
+            rows = self.recipients().iterator(chunk_size=batch_size)
+            while True:
+                users = list(itertools.islice(rows, batch_size))
+                if not users:
+                    break
+                users_seen += len(users)
+                items = self.build_chunk(users, start, now, dashboard_url)
+                skipped += len(users) - len(items)
+                if pool is None:
+                    collect(_render_chunk(items, from_email))
+                    continue
+                pending.append(pool.submit(_render_chunk, items, from_email))
+                while len(pending) >= workers * 2:
+                    collect(pending.popleft().result())
+            while pending:
+                collect(pending.popleft().result())
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        action = 'Rendered' if dry_run else 'Queued'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {queued} weekly report(s) for {users_seen} opted-in user(s); "
+            f"{skipped} had nothing to report"
+        ))
@@ -0,0 +1,71 @@
+"""
+Management command to delete expired, never-verified email and phone OTPs.
+
+Verified codes are kept as an audit trail. Deletes run in small batches,
+each in its own transaction, walking the partial expiry indexes.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from diagnostic.models import EmailOTP, PhoneOTP
+
+
+class Command(BaseCommand):
+    help = "Delete expired, unverified email and phone OTPs in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of OTPs to delete per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=24,
+            help='Only delete codes that expired at least this many hours ago (default: 24)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Seconds to sleep between batches (default: 0.05)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many OTPs would be deleted without deleting anything',
+        )
+
+    def sweep(self, model, cutoff, batch_size, pause):
+        expired = model.objects.filter(is_verified=False, expires_at__lt=cutoff)
+        deleted = 0
+        while True:
+            ids = list(expired.order_by('expires_at').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            with transaction.atomic():
+                deleted += model.objects.filter(id__in=ids).delete()[0]
+            if len(ids) < batch_size:
+                return deleted
+            if pause:
+                time.sleep(pause)
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        cutoff = timezone.now() - timedelta(hours=max(0, options['grace_hours']))
+
+        if options['dry_run']:
+            for model in (EmailOTP, PhoneOTP):
+                count = model.objects.filter(is_verified=False, expires_at__lt=cutoff).count()
+                self.stdout.write(f"{model.__name__}: {count} would be deleted")
+            return
+
+        for model in (EmailOTP, PhoneOTP):
+            deleted = self.sweep(model, cutoff, batch_size, options['pause'])
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: deleted {deleted} expired code(s)"))
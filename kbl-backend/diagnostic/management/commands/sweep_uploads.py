@@ -0,0 +1,114 @@
+"""
+Management command to garbage-collect chunked upload sessions.
+
+Deletes open sessions whose expiry has passed, along with their part files,
+and completed sessions once they are as old as the session TTL (their file
+already belongs to an attachment or document). Part files in
+``MEDIA_ROOT/uploads/partial/`` with no session row, for example after a crash
+between writing and recording a chunk, are removed once they are older than
+the TTL.
+"""
+import os
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from diagnostic.models import UploadSession
+from diagnostic.uploads import partial_dir, part_path, session_ttl
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+class Command(BaseCommand):
+    help = "Delete expired chunked upload sessions and orphaned part files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of sessions to delete per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be deleted without deleting anything',
+        )
+
+    def stale_sessions(self, now):
+        return (
+            UploadSession.objects.filter(status=UploadSession.STATUS_OPEN, expires_at__lt=now)
+            | UploadSession.objects.filter(status=UploadSession.STATUS_COMPLETE, updated_at__lt=now - session_ttl())
+        )
+
+    def remove_part(self, session):
+        try:
+            size = os.path.getsize(part_path(session))
+            os.remove(part_path(session))
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def sweep_sessions(self, now, batch_size):
+        deleted = freed = 0
+        while True:
+            batch = list(self.stale_sessions(now).order_by('expires_at')[:batch_size])
+            if not batch:
+                return deleted, freed
+            for session in batch:
+                freed += self.remove_part(session)
+            with transaction.atomic():
+                deleted += UploadSession.objects.filter(pk__in=[s.pk for s in batch]).delete()[0]
+            if len(batch) < batch_size:
+                return deleted, freed
+
+    def sweep_orphans(self, dry_run):
+        """Remove part files that no session refers to."""
+        cutoff = time.time() - session_ttl().total_seconds()
+        try:
+            entries = [
+                entry for entry in os.scandir(partial_dir())
+                if entry.is_file() and entry.name.endswith('.part') and entry.stat().st_mtime < cutoff
+            ]
+        except FileNotFoundError:
+            return 0, 0
+        stems = {entry.name[:-len('.part')]: entry for entry in entries}
+        known = {
+            str(pk) for pk in UploadSession.objects.filter(pk__in=[
+                stem for stem in stems if _is_uuid(stem)
+            ]).values_list('pk', flat=True)
+        }
+        removed = freed = 0
+        for stem, entry in stems.items():
+            if stem in known:
+                continue
+            removed += 1
+            freed += entry.stat().st_size
+            if not dry_run:
+                os.remove(entry.path)
+        return removed, freed
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options['dry_run']:
+            stale = self.stale_sessions(now).count()
+            orphans, freed = self.sweep_orphans(dry_run=True)
+            self.stdout.write(f"{stale} upload session(s) and {orphans} orphaned part file(s) ({freed} bytes) would be deleted")
+            return
+
+        deleted, freed = self.sweep_sessions(now, max(1, options['batch_size']))
+        orphans, orphan_bytes = self.sweep_orphans(dry_run=False)
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} upload session(s) and {orphans} orphaned part file(s), "
+            f"freeing {freed + orphan_bytes} bytes"
+        ))
+
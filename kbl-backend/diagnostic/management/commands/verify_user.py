@@ -33,6 +33,9 @@ class Command(BaseCommand):
                 f'User {email} has been verified and activated'
             ))
 
+        if user.mark_email_verified():
+            self.stdout.write(self.style.SUCCESS(f'Marked email verified for {email}'))
+
         # Also mark all OTPs as used if EmailOTP model exists
         try:
             from diagnostic.models import EmailOTP
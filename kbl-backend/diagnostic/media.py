@@ -0,0 +1,205 @@
+"""
+Protected media serving.
+
+Every ``/media/`` request goes through ``serve_media``, which decides whether
+the caller may read the file and then hands the transfer off:
+
+* Avatars and their thumbnails are public, including those kept in
+  content-addressed storage.
+* Evidence attachments and action item documents are readable by the
+  enterprise owner and its active team members; rendered reports by the
+  owner. Browsers fetch these from
+  ``<a href>``/``<img src>`` without our JWT header, so the API hands out
+  signed URLs (``signed_media_url``) that carry a time-limited token for that
+  one path; a valid bearer token or session works too. A shared ``cas/`` blob
+  is readable by anyone with access to one of the records using it.
+
+The body is sent by the front server when ``MEDIA_OFFLOAD`` is ``accel``
+(nginx ``X-Accel-Redirect`` to an internal location, see nginx.default.conf)
+or ``sendfile`` (``X-Sendfile``), so a download never ties up a gunicorn
+worker. With no offload configured (local runs) the file is streamed in
+chunks, with single-range ``Range`` support.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+from .avatars import is_avatar_file
+from .models import ActionItemDocument, Attachment, EnterpriseReport, TeamMember
+from .storage import is_blob
+
+SIGNING_SALT = 'diagnostic.media'
+PUBLIC_PREFIXES = ('avatars/',)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def signed_media_url(request, file_field):
+    """Absolute URL for a stored file, signed so the browser can fetch it directly."""
+    if not file_field:
+        return None
+    path = file_field.name
+    url = f"{settings.MEDIA_URL}{quote(path)}"
+    if not path.startswith(PUBLIC_PREFIXES):
+        url += f"?sig={signing.dumps(path, salt=SIGNING_SALT, compress=True)}"
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def _has_valid_signature(request, path):
+    token = request.GET.get('sig')
+    if not token:
+        return False
+    try:
+        signed_path = signing.loads(
+            token, salt=SIGNING_SALT, max_age=getattr(settings, 'MEDIA_URL_MAX_AGE', 6 * 60 * 60),
+        )
+    except signing.BadSignature:
+        return False
+    return signed_path == path
+
+
+def _request_user(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    from rest_framework.request import Request
+    from accounts.authentication import CachedJWTAuthentication
+
+    try:
+        result = CachedJWTAuthentication().authenticate(Request(request))
+    except Exception:
+        return None
+    return result[0] if result else None
+
+
+def _enterprise_access(prefix, user):
+    """Q granting access through enterprise ownership or active membership."""
+    return (
+        Q(**{f'{prefix}owner': user})
+        | Q(**{f'{prefix}team_members__user': user, f'{prefix}team_members__status': TeamMember.STATUS_ACTIVE})
+    )
+
+
+def _is_public(path):
+    if path.startswith(PUBLIC_PREFIXES):
+        return True
+    return is_blob(path) and is_avatar_file(path)
+
+
+def user_can_access(user, path):
+    """Whether ``user`` may read the stored file at ``path``."""
+    if user.is_staff:
+        return True
+    blob = is_blob(path)
+    if blob or path.startswith('evidence/'):
+        if Attachment.objects.filter(_enterprise_access('response__enterprise__', user), file=path).exists():
+            return True
+    if blob or path.startswith('reports/'):
+        # Like the report API, rendered reports are for the enterprise owner only
+        if EnterpriseReport.objects.filter(Q(html=path) | Q(pdf=path), enterprise__owner=user).exists():
+            return True
+    if blob or path.startswith('action_documents/'):
+        return ActionItemDocument.objects.filter(
+            _enterprise_access('action_item__enterprise__', user) | Q(action_item__owner=user), file=path,
+        ).exists()
+    return False
+
+
+def _normalize(path):
+    normalized = posixpath.normpath(path).lstrip('/')
+    if normalized.startswith('..') or normalized in ('', '.') or '\x00' in normalized:
+        raise Http404('Invalid path')
+    return normalized
+
+
+def _offload_response(path, full_path, content_type):
+    mode = getattr(settings, 'MEDIA_OFFLOAD', '')
+    response = HttpResponse(content_type=content_type)
+    if mode == 'accel':
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = f"{prefix}{quote(path)}"
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+def _stream_file(full_path, start, length):
+    with open(full_path, 'rb') as handle:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = handle.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _streaming_response(request, full_path, content_type, size):
+    start, end = 0, size - 1
+    status = 200
+    header = request.META.get('HTTP_RANGE', '').strip()
+    match = _range_re.match(header) if header else None
+    if match and (match.group(1) or match.group(2)):
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the final N bytes
+            start = max(0, size - int(last))
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        status = 206
+
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(
+        _stream_file(full_path, start, length), status=status, content_type=content_type,
+    )
+    response['Content-Length'] = str(length)
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def serve_media(request, path):
+    """Permission-checked media download, offloaded to the front server when configured."""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponse(status=405)
+    path = _normalize(path)
+    public = _is_public(path)
+    if not public and not _has_valid_signature(request, path):
+        user = _request_user(request)
+        if user is None or not user_can_access(user, path):
+            # Same answer as a missing file, so paths can't be probed
+            raise Http404('File not found')
+
+    full_path = os.path.join(str(settings.MEDIA_ROOT), path)
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    if getattr(settings, 'MEDIA_OFFLOAD', ''):
+        response = _offload_response(path, full_path, content_type)
+    else:
+        response = _streaming_response(request, full_path, content_type, stat.st_size)
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = 'public, max-age=86400' if public else 'private, max-age=3600'
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostic', '0004_actionitem_assigned_to_user_actionitem_completed_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actionitem',
+            index=models.Index(fields=['owner', 'status', 'order'], name='diagnostic__owner_i_f4a8b0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actionitem',
+            index=models.Index(fields=['enterprise', 'status'], name='diagnostic__enterpr_2f273b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actionitem',
+            index=models.Index(fields=['assigned_to_user', 'status'], name='diagnostic__assigne_538433_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:47
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def backfill_counters(apps, schema_editor):
+    ActionItem = apps.get_model('diagnostic', 'ActionItem')
+    ActionItemNote = apps.get_model('diagnostic', 'ActionItemNote')
+    ActionItemDocument = apps.get_model('diagnostic', 'ActionItemDocument')
+
+    def per_item(model, aggregate):
+        return Subquery(
+            model.objects
+            .filter(action_item=OuterRef('pk'))
+            .order_by()
+            .values('action_item')
+            .annotate(value=aggregate)
+            .values('value')
+        )
+
+    ActionItem.objects.update(
+        notes_count=Coalesce(per_item(ActionItemNote, Count('id')), Value(0), output_field=IntegerField()),
+        documents_count=Coalesce(per_item(ActionItemDocument, Count('id')), Value(0), output_field=IntegerField()),
+        last_activity_at=Greatest(
+            per_item(ActionItemNote, Max('created_at')),
+            per_item(ActionItemDocument, Max('created_at')),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostic', '0005_actionitem_board_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actionitem',
+            name='documents_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='actionitem',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, help_text='When a note or document was last added or removed', null=True),
+        ),
+        migrations.AddField(
+            model_name='actionitem',
+            name='notes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
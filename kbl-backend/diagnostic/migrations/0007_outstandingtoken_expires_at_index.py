@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index token_blacklist_outstandingtoken.expires_at for prune_tokens.
+
+    The table belongs to simplejwt, so the index is created here with raw SQL.
+    CONCURRENTLY keeps token refreshes working while it builds, which requires
+    running outside a transaction.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ('diagnostic', '0006_actionitem_activity_counters'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS token_blacklist_outstandingtoken_expires_at_idx '
+                'ON token_blacklist_outstandingtoken (expires_at);'
+            ),
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS token_blacklist_outstandingtoken_expires_at_idx;',
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+from django.db.models import Min, OuterRef, Subquery
+
+
+def backfill_email_verified_at(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    EmailOTP = apps.get_model('diagnostic', 'EmailOTP')
+
+    first_verified = (
+        EmailOTP.objects
+        .filter(user=OuterRef('pk'), is_verified=True)
+        .order_by()
+        .values('user')
+        .annotate(at=Min('updated_at'))
+        .values('at')
+    )
+    User.objects.filter(
+        email_verified_at__isnull=True,
+        email_otps__is_verified=True,
+    ).update(email_verified_at=Subquery(first_verified))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostic', '0007_outstandingtoken_expires_at_index'),
+        ('accounts', '0003_user_email_verified_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_email_verified_at, migrations.RunPython.noop),
+    ]
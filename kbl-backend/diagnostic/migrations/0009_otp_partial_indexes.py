@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostic', '0008_backfill_user_email_verified_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailotp',
+            index=models.Index(condition=models.Q(('is_verified', False)), fields=['user', 'code'], name='emailotp_pending_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailotp',
+            index=models.Index(condition=models.Q(('is_verified', False)), fields=['user', '-created_at'], name='emailotp_pending_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailotp',
+            index=models.Index(condition=models.Q(('is_verified', False)), fields=['expires_at'], name='emailotp_pending_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phoneotp',
+            index=models.Index(condition=models.Q(('is_verified', False)), fields=['user', 'code'], name='phoneotp_pending_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phoneotp',
+            index=models.Index(condition=models.Q(('is_verified', False)), fields=['expires_at'], name='phoneotp_pending_expiry_idx'),
+        ),
+    ]
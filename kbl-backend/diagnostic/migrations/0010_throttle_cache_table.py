@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_tables(apps, schema_editor):
+    # Creates the table for every DatabaseCache alias (the 'throttle' cache);
+    # a no-op for tables that already exist
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+def drop_throttle_cache_table(apps, schema_editor):
+    location = settings.CACHES.get('throttle', {}).get('LOCATION')
+    if location:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {schema_editor.quote_name(location)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostic', '0009_otp_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, drop_throttle_cache_table),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostic', '0011_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='dedupe_key',
+            field=models.CharField(blank=True, help_text='kind:subject:time-bucket; a second email with the same key is never queued', max_length=200, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:37
+
+import diagnostic.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostic', '0015_avatarthumbnailjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scoresummary',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Bumped when the scores or action items change; rendered reports are cached per version'),
+        ),
+        migrations.CreateModel(
+            name='EnterpriseReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('version', models.PositiveIntegerField(help_text='ScoreSummary.version the report was rendered from')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('html', models.FileField(blank=True, upload_to=diagnostic.models.enterprise_report_upload_path)),
+                ('pdf', models.FileField(blank=True, upload_to=diagnostic.models.enterprise_report_upload_path)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('enterprise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reports', to='diagnostic.enterprise')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='report_pending_idx')],
+                'unique_together': {('enterprise', 'version')},
+            },
+        ),
+    ]
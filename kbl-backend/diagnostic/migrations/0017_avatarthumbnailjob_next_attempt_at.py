@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 04:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostic', '0016_enterprisereport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='avatarthumbnailjob',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Not picked up again before this time'),
+        ),
+    ]
@@ -1,6 +1,9 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.utils import timezone
 
 
 User = get_user_model()
@@ -98,6 +101,9 @@ class ScoreSummary(TimeStampedModel):
     section_scores = models.JSONField(default=dict)
     priorities = models.JSONField(default=dict)
     calculated_at = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveIntegerField(
+        default=1, help_text='Bumped when the scores or action items change; rendered reports are cached per version'
+    )
 
     def __str__(self) -> str:
         return f"Summary for {self.enterprise.name}"
@@ -135,6 +141,12 @@ class EmailOTP(TimeStampedModel):
     
     class Meta:
         ordering = ['-created_at']
+        # Only pending codes are ever looked up, so the indexes skip verified rows
+        indexes = [
+            models.Index(fields=['user', 'code'], condition=models.Q(is_verified=False), name='emailotp_pending_code_idx'),
+            models.Index(fields=['user', '-created_at'], condition=models.Q(is_verified=False), name='emailotp_pending_recent_idx'),
+            models.Index(fields=['expires_at'], condition=models.Q(is_verified=False), name='emailotp_pending_expiry_idx'),
+        ]
         
     def __str__(self) -> str:
         return f"OTP for {self.user.email} (used={self.is_used}, verified={self.is_verified})"
@@ -147,6 +159,12 @@ class PhoneOTP(TimeStampedModel):
     expires_at = models.DateTimeField()
     is_verified = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'code'], condition=models.Q(is_verified=False), name='phoneotp_pending_code_idx'),
+            models.Index(fields=['expires_at'], condition=models.Q(is_verified=False), name='phoneotp_pending_expiry_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"Phone OTP for {self.user_id}:{self.phone} (verified={self.is_verified})"
 
@@ -197,13 +215,45 @@ class ActionItem(TimeStampedModel):
         on_delete=models.SET_NULL,
         help_text='User who marked this action as complete'
     )
+    notes_count = models.PositiveIntegerField(default=0)
+    documents_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True, help_text='When a note or document was last added or removed')
+
+    # Maintained with atomic UPDATEs in diagnostic.signals
+    COUNTER_FIELDS = ('notes_count', 'documents_count', 'last_activity_at')
 
     class Meta:
         ordering = ['status', 'order', 'id']
+        indexes = [
+            models.Index(fields=['owner', 'status', 'order']),
+            models.Index(fields=['enterprise', 'status']),
+            models.Index(fields=['assigned_to_user', 'status']),
+        ]
 
     def __str__(self) -> str:
         return f"{self.title} ({self.status})"
 
+    def save(self, *args, **kwargs):
+        # Never write back a possibly stale in-memory copy of the counters
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def set_status(self, new_status: str, user=None) -> None:
+        """Move to ``new_status``, recording or clearing who completed the item and when."""
+        old_status = self.status
+        self.status = new_status
+        if new_status == self.STATUS_COMPLETED and old_status != self.STATUS_COMPLETED:
+            self.completed_at = timezone.now()
+            self.completed_by = user
+            self.progress_percentage = 100
+        elif new_status != self.STATUS_COMPLETED:
+            self.completed_at = None
+            self.completed_by = None
+
 
 class ActionItemNote(TimeStampedModel):
     """Notes/updates added to an action item by team members."""
@@ -309,3 +359,204 @@ class NotificationPreference(TimeStampedModel):
 
     def __str__(self):
         return f"{self.user.email}'s notification preferences"
+
+
+class EmailOutbox(TimeStampedModel):
+    """
+    Outgoing email waiting to be delivered by the ``send_outbox`` worker.
+
+    Request handlers only insert rows here (see diagnostic.outbox); delivery,
+    retries and backoff happen out of band.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50, blank=True, help_text='What triggered the email, e.g. verification')
+    dedupe_key = models.CharField(
+        max_length=200, null=True, blank=True, unique=True,
+        help_text='kind:subject:time-bucket; a second email with the same key is never queued',
+    )
+    to = models.JSONField(default=list)
+    from_email = models.CharField(max_length=254, blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Outgoing Email'
+        verbose_name_plural = 'Email Outbox'
+        # The worker only ever scans pending rows that are due
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at'],
+                condition=models.Q(status='pending'),
+                name='emailoutbox_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind or 'email'} to {', '.join(self.to)} ({self.status})"
+
+
+class UploadSession(TimeStampedModel):
+    """
+    A resumable, chunked upload of an evidence attachment or action document.
+
+    Chunks are written straight into a part file on disk as they arrive (see
+    diagnostic.uploads); completing the session verifies the checksum and
+    moves the part file into place as the target's file.
+    """
+    TARGET_ATTACHMENT = 'attachment'
+    TARGET_ACTION_DOCUMENT = 'action_document'
+    TARGET_CHOICES = [
+        (TARGET_ATTACHMENT, 'Evidence attachment'),
+        (TARGET_ACTION_DOCUMENT, 'Action item document'),
+    ]
+    STATUS_OPEN = 'open'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_COMPLETE, 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='upload_sessions', on_delete=models.CASCADE)
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    response = models.ForeignKey(
+        QuestionResponse, related_name='upload_sessions', on_delete=models.CASCADE, null=True, blank=True,
+    )
+    action_item = models.ForeignKey(
+        ActionItem, related_name='upload_sessions', on_delete=models.CASCADE, null=True, blank=True,
+    )
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    description = models.TextField(blank=True)
+    size = models.PositiveIntegerField(help_text='Total file size in bytes')
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, help_text='Expected hex SHA-256 of the whole file')
+    received_chunks = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['expires_at'],
+                condition=models.Q(status='open'),
+                name='uploadsession_open_exp_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Upload {self.filename} ({len(self.received_chunks)}/{self.chunk_count} chunks, {self.status})"
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+
+class StoredBlob(TimeStampedModel):
+    """
+    One file in content-addressed storage and how many model fields use it.
+
+    Maintained by diagnostic.storage.ContentAddressedStorage; the file is
+    removed when ``ref_count`` drops to zero.
+    """
+    name = models.CharField(max_length=255, unique=True, help_text='Storage path, cas/<aa>/<bb>/<sha256><ext>')
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.ref_count} reference(s))"
+
+
+class AvatarThumbnailJob(TimeStampedModel):
+    """
+    Thumbnail generation for a newly uploaded avatar, picked up by the
+    ``process_avatars`` worker (see diagnostic.avatars).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, related_name='avatar_jobs', on_delete=models.CASCADE)
+    source = models.CharField(max_length=255, help_text='Avatar file name the job was queued for')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text='Not picked up again before this time')
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status='pending'),
+                name='avatarjob_pending_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Avatar thumbnails for user {self.user_id} ({self.status})"
+
+
+
+def enterprise_report_upload_path(instance: 'EnterpriseReport', filename: str) -> str:
+    return f"reports/{instance.enterprise_id}/{filename}"
+
+
+class EnterpriseReport(TimeStampedModel):
+    """
+    HTML and PDF report for one version of an enterprise's score summary,
+    rendered by the ``render_reports`` worker (see diagnostic.reports).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    enterprise = models.ForeignKey(Enterprise, related_name='reports', on_delete=models.CASCADE)
+    version = models.PositiveIntegerField(help_text='ScoreSummary.version the report was rendered from')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    html = models.FileField(upload_to=enterprise_report_upload_path, blank=True)
+    pdf = models.FileField(upload_to=enterprise_report_upload_path, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ('enterprise', 'version')
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status='pending'),
+                name='report_pending_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Report v{self.version} for {self.enterprise.name} ({self.status})"
@@ -0,0 +1,267 @@
+"""
+Durable email outbox.
+
+Request handlers call ``enqueue_email``/``enqueue_emails``, which only insert
+``EmailOutbox`` rows (inside the caller's transaction, so an email is queued
+exactly when the data it talks about is committed). The ``send_outbox``
+management command calls ``deliver_due`` in a loop: it leases due rows with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so several workers can run side by
+side, commits, sends the batch over one backend connection and then records
+the outcome. Failed sends are retried with exponential backoff until
+``max_attempts``; ``prune_outbox`` deletes finished rows after a few days.
+
+Emails that users can trigger repeatedly (verification, OTP, password reset)
+carry a ``dedupe_key`` of kind, subject and time bucket. The column is
+unique, so retries and double-clicks within a bucket queue one email, and
+``enqueue_once`` skips the work of building it (e.g. a new OTP) as well.
+The daily action digest uses one key per recipient and day. Invitations are
+not deduplicated: TeamMember is unique on (enterprise, email), and a
+re-invite after a cancelled invitation must still be sent.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+# How long a claimed row stays invisible to other workers while it is being sent
+CLAIM_LEASE = timedelta(minutes=15)
+
+# Seconds per dedupe bucket; override per kind with the EMAIL_DEDUPE_WINDOWS setting
+DEFAULT_DEDUPE_WINDOWS = {
+    'verification': 5 * 60,
+    'email_otp': 60,
+    'password_reset': 5 * 60,
+}
+
+
+def dedupe_key(kind: str, subject, now=None) -> str:
+    """Key for "this kind of email about this subject in the current time bucket"."""
+    windows = {**DEFAULT_DEDUPE_WINDOWS, **getattr(settings, 'EMAIL_DEDUPE_WINDOWS', {})}
+    window = max(1, int(windows.get(kind, 5 * 60)))
+    bucket = int((now or timezone.now()).timestamp()) // window
+    return f"{kind}:{subject}:{bucket}"
+
+
+def _outbox_row(to, subject, body, html_body='', from_email=None, kind='', dedupe_key=None):
+    if isinstance(to, str):
+        to = [to]
+    return EmailOutbox(
+        kind=kind,
+        dedupe_key=dedupe_key,
+        to=list(to),
+        from_email=from_email or '',
+        subject=subject,
+        body=body,
+        html_body=html_body or '',
+    )
+
+
+def enqueue_email(to, subject, body, html_body='', from_email=None, kind='', dedupe_key=None) -> EmailOutbox:
+    """Queue one email for background delivery and return the outbox row."""
+    row = _outbox_row(
+        to, subject, body, html_body=html_body, from_email=from_email, kind=kind, dedupe_key=dedupe_key,
+    )
+    row.save()
+    logger.info(f"Queued {kind or 'email'} for {', '.join(row.to)} (outbox #{row.pk})")
+    return row
+
+
+def enqueue_emails(messages, ignore_conflicts=False) -> list:
+    """
+    Queue many emails with one INSERT. ``messages`` are ``enqueue_email`` kwargs.
+
+    With ``ignore_conflicts`` a message whose ``dedupe_key`` is already queued
+    is dropped instead of failing the insert.
+    """
+    rows = EmailOutbox.objects.bulk_create(
+        [_outbox_row(**message) for message in messages], ignore_conflicts=ignore_conflicts,
+    )
+    if rows:
+        logger.info(f"Queued {len(rows)} email(s) for background delivery")
+    return rows
+
+
+def is_queued(key: str) -> bool:
+    return EmailOutbox.objects.filter(dedupe_key=key).exists()
+
+
+def enqueue_once(key: str, build):
+    """
+    Queue the email ``build()`` returns unless one with ``key`` already exists.
+
+    ``build`` returns ``enqueue_email`` keyword arguments and runs in the same
+    savepoint as the insert, so anything it writes (an OTP, say) is rolled
+    back if a concurrent request claims the key first. Returns the new row,
+    or None when the email was a duplicate.
+    """
+    if is_queued(key):
+        logger.info(f"Skipping duplicate email {key}")
+        return None
+    try:
+        with transaction.atomic():
+            return enqueue_email(**build(), dedupe_key=key)
+    except IntegrityError:
+        if is_queued(key):
+            logger.info(f"Skipping duplicate email {key} (concurrent request)")
+            return None
+        raise
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff after the given number of failed attempts, with a little jitter."""
+    seconds = min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+    return timedelta(seconds=seconds * random.uniform(0.9, 1.1))
+
+
+def _build_message(row, connection):
+    msg = EmailMultiAlternatives(
+        subject=row.subject,
+        body=row.body,
+        from_email=row.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=row.to,
+        connection=connection,
+    )
+    if row.html_body:
+        msg.attach_alternative(row.html_body, 'text/html')
+    return msg
+
+
+def _error_text(error):
+    return f"{type(error).__name__}: {str(error)}"
+
+
+def _send_rows(rows, connection) -> dict:
+    """Send the rows' messages and return ``{row id: error text}`` for failures."""
+    if connection is not None and getattr(connection, 'supports_partial_failures', False):
+        # One call lets the backend batch identical messages; its error names the failures
+        messages = {row.pk: _build_message(row, connection) for row in rows}
+        try:
+            connection.send_messages(list(messages.values()))
+        except Exception as e:
+            failed = getattr(e, 'failed_messages', None)
+            if failed is None:
+                return {pk: _error_text(e) for pk in messages}
+            return {pk: failed[message] for pk, message in messages.items() if message in failed}
+        return {}
+
+    errors = {}
+    for row in rows:
+        try:
+            if not _build_message(row, connection).send(fail_silently=False):
+                raise RuntimeError('Email backend reported 0 messages sent')
+        except Exception as e:
+            errors[row.pk] = _error_text(e)
+    return errors
+
+
+def _claim_due(batch_size: int) -> list:
+    """
+    Lease up to ``batch_size`` due rows to this worker and commit.
+
+    The lease pushes ``next_attempt_at`` forward instead of holding row locks
+    through the sends, so a slow mail API never keeps a transaction open. A
+    worker that dies mid-send leaves its rows to be picked up again when the
+    lease runs out, so delivery is at least once.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            EmailOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if rows:
+            EmailOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+                next_attempt_at=now + CLAIM_LEASE, updated_at=now,
+            )
+    return rows
+
+
+def deliver_due(batch_size: int = 50, connection=None) -> dict:
+    """
+    Claim up to ``batch_size`` due rows and try to send them.
+
+    Returns counts of ``sent``, ``retrying`` and ``failed`` rows; all zero means
+    nothing was due.
+    """
+    counts = {'sent': 0, 'retrying': 0, 'failed': 0}
+    rows = _claim_due(batch_size)
+    if not rows:
+        return counts
+
+    try:
+        connection = connection or get_connection(fail_silently=False)
+        connection.open()
+    except Exception as e:
+        # Each send below retries the connection and records its own failure
+        logger.warning(f"Could not open email connection: {str(e)}")
+        connection = None
+
+    try:
+        errors = _send_rows(rows, connection)
+    finally:
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    for row in rows:
+        row.attempts += 1
+        error = errors.get(row.pk)
+        if error is None:
+            row.status = EmailOutbox.STATUS_SENT
+            row.sent_at = timezone.now()
+            row.last_error = ''
+            counts['sent'] += 1
+            continue
+        row.last_error = error[:2000]
+        if row.attempts >= row.max_attempts:
+            row.status = EmailOutbox.STATUS_FAILED
+            counts['failed'] += 1
+            logger.error(f"Giving up on outbox #{row.pk} after {row.attempts} attempt(s): {row.last_error}")
+        else:
+            row.next_attempt_at = timezone.now() + retry_delay(row.attempts)
+            counts['retrying'] += 1
+            logger.warning(f"Outbox #{row.pk} attempt {row.attempts} failed, retrying: {row.last_error}")
+
+    # bulk_update skips auto_now, so stamp the rows explicitly
+    finished_at = timezone.now()
+    for row in rows:
+        row.updated_at = finished_at
+    EmailOutbox.objects.bulk_update(
+        rows, ['status', 'attempts', 'next_attempt_at', 'sent_at', 'last_error', 'updated_at'],
+    )
+    return counts
+
+
+def prune_finished(older_than, batch_size: int = 1000) -> int:
+    """
+    Delete sent and failed rows last touched before ``older_than``.
+
+    Bodies hold OTP codes and verification/reset links, so finished rows are
+    not kept longer than needed for troubleshooting.
+    """
+    finished = EmailOutbox.objects.filter(
+        status__in=[EmailOutbox.STATUS_SENT, EmailOutbox.STATUS_FAILED], updated_at__lt=older_than,
+    )
+    deleted = 0
+    while True:
+        ids = list(finished.order_by('updated_at').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            deleted += EmailOutbox.objects.filter(id__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return deleted
@@ -0,0 +1,114 @@
+"""
+Postgres-side assembly of read-heavy JSON payloads.
+
+These functions build the same JSON documents as the Python code in
+ActionItemViewSet.board and EnterpriseReportView, but with json_build_object
+and json_agg, and yield the resulting text in chunks so the view can stream it
+without hydrating any model instances.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from .models import ActionItem, Enterprise, ScoreSummary
+
+User = get_user_model()
+
+BOARD_STATUSES = (ActionItem.STATUS_TODO, ActionItem.STATUS_INPROGRESS, ActionItem.STATUS_COMPLETED)
+
+# Mirrors the Python formatting in ActionItemViewSet.board: initials from the
+# linked user, otherwise derived from the legacy assigned_to string.
+_CARD_USER_SQL = """
+    CASE
+        WHEN u.id IS NOT NULL THEN
+            CASE
+                WHEN COALESCE(u.first_name, '') <> '' AND COALESCE(u.last_name, '') <> ''
+                    THEN upper(left(u.first_name, 1) || left(u.last_name, 1))
+                WHEN COALESCE(u.first_name, '') <> ''
+                    THEN upper(left(u.first_name, 2))
+                ELSE upper(left(u.email, 2))
+            END
+        WHEN a.assigned_to <> '' THEN
+            CASE
+                WHEN position('@' in a.assigned_to) = 0 THEN a.assigned_to
+                WHEN position('.' in split_part(a.assigned_to, '@', 1)) > 0
+                    THEN upper(
+                        left(split_part(split_part(a.assigned_to, '@', 1), '.', 1), 1)
+                        || left(split_part(split_part(a.assigned_to, '@', 1), '.', 2), 1)
+                    )
+                ELSE upper(left(a.assigned_to, 2))
+            END
+        ELSE ''
+    END
+"""
+
+BOARD_SQL = f"""
+    SELECT s.status,
+           COALESCE(
+               json_agg(
+                   json_build_object(
+                       'id', a.id,
+                       'title', a.title,
+                       'source', a.source,
+                       'date', COALESCE(to_char(a.due_date, 'YYYY-MM-DD'), ''),
+                       'user', {_CARD_USER_SQL},
+                       'priority', a.priority,
+                       'progress_percentage', a.progress_percentage,
+                       'assigned_to_user_id', a.assigned_to_user_id
+                   )
+                   ORDER BY a."order", a.id
+               ) FILTER (WHERE a.id IS NOT NULL),
+               '[]'::json
+           )::text
+    FROM unnest(%s::varchar[]) WITH ORDINALITY AS s(status, position)
+    LEFT JOIN {ActionItem._meta.db_table} a ON a.status = s.status AND a.owner_id = %s
+    LEFT JOIN {User._meta.db_table} u ON u.id = a.assigned_to_user_id
+    GROUP BY s.status, s.position
+    ORDER BY s.position
+"""
+
+# Matches DRF's JSONEncoder: UTC timestamps end in "Z" and carry microseconds
+# only when there is a fractional part.
+_ISO_TIMESTAMP_SQL = """
+    CASE WHEN {col} IS NULL THEN NULL ELSE
+        to_char({col} AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS')
+        || CASE WHEN date_part('microseconds', {col})::int %% 1000000 <> 0
+                THEN to_char({col} AT TIME ZONE 'UTC', '.US') ELSE '' END
+        || 'Z'
+    END
+"""
+
+REPORT_SQL = f"""
+    SELECT s.id IS NOT NULL,
+           json_build_object(
+               'id', e.id,
+               'name', e.name,
+               'overall_percentage', CASE WHEN s.id IS NULL THEN 0 ELSE s.overall_percentage::float8 END,
+               'section_scores', COALESCE(s.section_scores, '{{}}'::jsonb),
+               'priorities', COALESCE(s.priorities, '{{}}'::jsonb),
+               'updated_at', {_ISO_TIMESTAMP_SQL.format(col='s.updated_at')}
+           )::text
+    FROM {Enterprise._meta.db_table} e
+    LEFT JOIN {ScoreSummary._meta.db_table} s ON s.enterprise_id = e.id
+    WHERE e.id = %s AND e.owner_id = %s
+"""
+
+
+def iter_board_json(owner_id):
+    """Yield the board payload for an owner as JSON text, one column at a time."""
+    with connection.cursor() as cursor:
+        cursor.execute(BOARD_SQL, [list(BOARD_STATUSES), owner_id])
+        yield '{'
+        for index, (status_value, cards) in enumerate(cursor):
+            yield f'{"," if index else ""}"{status_value}":'
+            yield cards
+        yield '}'
+
+
+def fetch_report_json(enterprise_id, owner_id):
+    """
+    Return (has_summary, json_text) for an owned enterprise, or None if it
+    does not exist or belongs to someone else.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(REPORT_SQL, [enterprise_id, owner_id])
+        return cursor.fetchone()
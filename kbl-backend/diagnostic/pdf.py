@@ -0,0 +1,165 @@
+"""
+Minimal PDF writer for generated reports.
+
+Lays out wrapped text, headings, rules and filled bars on A4 pages using the
+standard Helvetica fonts every PDF viewer ships, so nothing is embedded and
+no third-party dependency or system library is needed. Text is encoded as
+WinAnsi (cp1252); characters outside it are replaced with '?'.
+"""
+import zlib
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 50
+
+# Advance widths (1/1000 em) of ASCII 32..126, from the Adobe Helvetica AFMs
+_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+_FONTS = {False: ('F1', _HELVETICA), True: ('F2', _HELVETICA_BOLD)}
+
+
+def text_width(text, size, bold=False):
+    widths = _FONTS[bold][1]
+    return sum(widths[ord(c) - 32] if 32 <= ord(c) <= 126 else 556 for c in text) * size / 1000
+
+
+def wrap(text, size, width, bold=False):
+    """Split ``text`` into lines no wider than ``width`` points."""
+    lines = []
+    for paragraph in str(text).splitlines() or ['']:
+        line = ''
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and text_width(candidate, size, bold) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _escape(text):
+    encoded = text.encode('cp1252', errors='replace')
+    return encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class PdfDocument:
+    """Flowing single-column document; call ``render()`` for the PDF bytes."""
+
+    def __init__(self, title=''):
+        self.title = title
+        self.pages = []
+        self._new_page()
+
+    def _new_page(self):
+        self._ops = []
+        self.pages.append(self._ops)
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _ensure(self, height):
+        if self.y - height < MARGIN:
+            self._new_page()
+
+    @property
+    def width(self):
+        return PAGE_WIDTH - 2 * MARGIN
+
+    def _line(self, text, size, bold, x, color):
+        font = _FONTS[bold][0]
+        self._ops.append(
+            b'%.3f %.3f %.3f rg BT /%s %g Tf %.2f %.2f Td (%s) Tj ET'
+            % (*color, font.encode(), size, x, self.y, _escape(text))
+        )
+
+    def text(self, text, size=10, bold=False, indent=0, color=(0.2, 0.25, 0.33), leading=1.35):
+        """Add wrapped text, breaking onto new pages as needed."""
+        for line in wrap(text, size, self.width - indent, bold):
+            self._ensure(size * leading)
+            self.y -= size * leading
+            self._line(line, size, bold, MARGIN + indent, color)
+
+    def heading(self, text, size=14):
+        self.space(size * 0.6)
+        # Keep a heading together with at least a couple of lines after it
+        self._ensure(size * 1.4 + 30)
+        self.text(text, size=size, bold=True, color=(0.004, 0.286, 0.498))
+        self.space(4)
+
+    def space(self, height):
+        self.y -= height
+
+    def rule(self):
+        self._ensure(6)
+        self.y -= 3
+        self._ops.append(b'0.886 0.910 0.941 RG 0.5 w %.2f %.2f m %.2f %.2f l S' % (MARGIN, self.y, PAGE_WIDTH - MARGIN, self.y))
+        self.y -= 3
+
+    def bar(self, label, fraction, value_text, size=10):
+        """A labelled horizontal bar filled to ``fraction`` (0..1)."""
+        label_width, bar_width, height = self.width * 0.38, self.width * 0.45, size * 0.9
+        self._ensure(size * 1.8)
+        self.y -= size * 1.6
+        label = wrap(label, size, label_width - 6)[0]
+        self._line(label, size, False, MARGIN, (0.2, 0.25, 0.33))
+        x = MARGIN + label_width
+        filled = bar_width * max(0.0, min(1.0, fraction))
+        self._ops.append(b'0.886 0.910 0.941 rg %.2f %.2f %.2f %.2f re f' % (x, self.y - 1, bar_width, height))
+        if filled:
+            self._ops.append(b'0.004 0.286 0.498 rg %.2f %.2f %.2f %.2f re f' % (x, self.y - 1, filled, height))
+        self._line(value_text, size, True, x + bar_width + 8, (0.2, 0.25, 0.33))
+
+    def render(self):
+        objects = []
+
+        def add(body):
+            objects.append(body)
+            return len(objects)
+
+        catalog = add(None)
+        pages = add(None)
+        regular = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+        bold = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+        resources = b'<< /Font << /F1 %d 0 R /F2 %d 0 R >> >>' % (regular, bold)
+        page_ids = []
+        for number, ops in enumerate(self.pages, start=1):
+            footer = b'0.58 0.64 0.72 rg BT /F1 8 Tf %.2f %.2f Td (Page %d of %d) Tj ET' % (
+                PAGE_WIDTH - MARGIN - 50, MARGIN / 2, number, len(self.pages),
+            )
+            stream = zlib.compress(b'\n'.join(ops + [footer]))
+            content = add(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(stream), stream))
+            page_ids.append(add(
+                b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources %s /Contents %d 0 R >>'
+                % (pages, PAGE_WIDTH, PAGE_HEIGHT, resources, content)
+            ))
+        objects[catalog - 1] = b'<< /Type /Catalog /Pages %d 0 R >>' % pages
+        objects[pages - 1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % page for page in page_ids), len(page_ids),
+        )
+        info = add(b'<< /Title (%s) /Producer (KBL) >>' % _escape(self.title))
+
+        out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        xref = len(out)
+        out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+        out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+        out += b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            len(objects) + 1, catalog, info, xref,
+        )
+        return bytes(out)
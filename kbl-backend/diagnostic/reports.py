@@ -0,0 +1,222 @@
+"""
+Printable enterprise reports.
+
+A report covers the section scores, the priority questions that need action
+(with their text and the rubric descriptors for the current and next score)
+and the enterprise's action items. ``EnterpriseReportDocumentView`` asks for
+the report matching the current ``ScoreSummary.version``; the first request
+queues an ``EnterpriseReport`` and the ``render_reports`` worker writes its
+HTML and PDF files. A report that failed ``MAX_ATTEMPTS`` times is queued
+again by the first request after ``FAILED_COOLDOWN``. Later requests for the same version get the stored files,
+served like any other media, so a report is only rendered again once the
+scores or action items change and the version moves on.
+
+PDFs are produced by the small writer in diagnostic.pdf rather than an
+HTML-to-PDF engine, which would need system libraries in the image.
+"""
+import logging
+from datetime import date, timedelta
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import ActionItem, EnterpriseReport, QuestionResponse, ScoreSummary
+from .pdf import PdfDocument
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+# A failed report is queued again on request once it has been failed this long
+FAILED_COOLDOWN = timedelta(minutes=10)
+_STATUS_ORDER = {ActionItem.STATUS_TODO: 0, ActionItem.STATUS_INPROGRESS: 1, ActionItem.STATUS_COMPLETED: 2}
+_PRIORITY_ORDER = {ActionItem.PRIORITY_HIGH: 0, ActionItem.PRIORITY_MEDIUM: 1, ActionItem.PRIORITY_LOW: 2}
+
+
+def bump_report_version(enterprise_ids):
+    """
+    Move the summary version of these enterprises on, so their cached reports
+    are rendered again. ActionItem signals do this per row; call it after
+    writes that skip them (bulk_create, bulk_update, ``QuerySet.update``).
+    """
+    ScoreSummary.objects.filter(enterprise_id__in=set(enterprise_ids) - {None}).update(version=F('version') + 1)
+
+
+def request_report(enterprise, version):
+    """
+    The report for ``version``, queued for rendering if it does not exist yet
+    or failed more than FAILED_COOLDOWN ago.
+    """
+    report, _ = EnterpriseReport.objects.get_or_create(enterprise=enterprise, version=version)
+    if report.status == EnterpriseReport.STATUS_FAILED and report.updated_at <= timezone.now() - FAILED_COOLDOWN:
+        # Conditional so concurrent requests requeue it once
+        EnterpriseReport.objects.filter(pk=report.pk, status=EnterpriseReport.STATUS_FAILED).update(
+            status=EnterpriseReport.STATUS_PENDING, attempts=0, updated_at=timezone.now(),
+        )
+        report.refresh_from_db()
+    return report
+
+
+def retry_after(report):
+    """Seconds until a failed report is queued again by request_report."""
+    remaining = report.updated_at + FAILED_COOLDOWN - timezone.now()
+    return max(1, int(remaining.total_seconds()) + 1)
+
+
+def report_context(enterprise, summary):
+    sections = [
+        {'name': name, 'percentage': scores.get('percentage', 0), 'weighted': scores.get('weighted', 0), 'perfect': scores.get('perfect', 0)}
+        for name, scores in (summary.section_scores or {}).items()
+    ]
+
+    questions = {
+        response.question.number: response.question
+        for response in QuestionResponse.objects.filter(enterprise=enterprise).select_related('question__category')
+    }
+    priorities = []
+    for number, entry in (summary.priorities or {}).items():
+        question = questions.get(number)
+        if entry.get('action_required') != 'Y' or question is None:
+            continue
+        score = entry.get('raw_score')
+        descriptors = question.descriptors or {}
+        priorities.append({
+            'number': number,
+            'category': question.category.name,
+            'priority': entry.get('priority'),
+            'text': question.text,
+            'score': score,
+            'current': descriptors.get(str(score), '') if score is not None else '',
+            'next': descriptors.get(str(score + 1), '') if score is not None and score < 4 else '',
+        })
+    priorities.sort(key=lambda p: (p['priority'], p['category'], p['number']))
+
+    action_items = sorted(
+        ActionItem.objects.filter(enterprise=enterprise).select_related('assigned_to_user'),
+        key=lambda item: (_STATUS_ORDER.get(item.status, 9), _PRIORITY_ORDER.get(item.priority, 9), item.due_date or date.max, item.pk),
+    )
+    return {
+        'enterprise': enterprise,
+        'version': summary.version,
+        'overall_percentage': summary.overall_percentage,
+        'sections': sections,
+        'priorities': priorities,
+        'action_items': action_items,
+        'generated_at': timezone.now(),
+    }
+
+
+def render_html(context):
+    return render_to_string('reports/enterprise_report.html', context)
+
+
+def _assignee(item):
+    user = item.assigned_to_user
+    if user is not None:
+        return user.get_full_name() or user.email
+    return item.assigned_to
+
+
+def render_pdf(context):
+    enterprise = context['enterprise']
+    doc = PdfDocument(title=f"{enterprise.name} assessment report")
+    doc.text(enterprise.name, size=20, bold=True, color=(0.004, 0.286, 0.498))
+    doc.text(
+        f"Assessment report, version {context['version']}, generated "
+        f"{timezone.localtime(context['generated_at']):%d %b %Y %H:%M}",
+        size=9, color=(0.39, 0.45, 0.55),
+    )
+    overall = context['overall_percentage']
+    doc.space(6)
+    doc.text(f"Overall score: {overall:.1f}%" if overall is not None else 'Overall score: not assessed yet', size=13, bold=True)
+
+    doc.heading('Section scores')
+    for section in context['sections']:
+        doc.bar(section['name'], section['percentage'] / 100, f"{section['percentage']:.1f}%")
+
+    doc.heading('Priority actions')
+    if not context['priorities']:
+        doc.text('No priority questions need action.')
+    for priority in context['priorities']:
+        doc.space(4)
+        doc.text(f"{priority['number']}  {priority['text']}", bold=True)
+        doc.text(f"{priority['category']} - priority {priority['priority']} - score {priority['score']}/4", size=9, color=(0.39, 0.45, 0.55), indent=12)
+        if priority['current']:
+            doc.text(f"Now: {priority['current']}", size=9, indent=12)
+        if priority['next']:
+            doc.text(f"Next level: {priority['next']}", size=9, indent=12)
+        doc.rule()
+
+    doc.heading('Action items')
+    if not context['action_items']:
+        doc.text('No action items yet.')
+    for item in context['action_items']:
+        doc.space(4)
+        doc.text(item.title, bold=True)
+        details = [item.get_status_display(), f"{item.get_priority_display()} priority", f"{item.progress_percentage}% done"]
+        if item.due_date:
+            details.append(f"due {item.due_date:%d %b %Y}")
+        if _assignee(item):
+            details.append(f"assigned to {_assignee(item)}")
+        doc.text(' - '.join(details), size=9, color=(0.39, 0.45, 0.55), indent=12)
+        if item.description:
+            doc.text(item.description, size=9, indent=12)
+        doc.rule()
+    return doc.render()
+
+
+def _render(report):
+    summary = ScoreSummary.objects.filter(enterprise_id=report.enterprise_id).first()
+    if summary is None or summary.version != report.version:
+        # Scores or action items changed since it was requested; the next
+        # download asks for the new version instead
+        report.delete()
+        return
+    context = report_context(report.enterprise, summary)
+    stem = f"report-v{report.version}"
+    report.html.save(f"{stem}.html", ContentFile(render_html(context).encode('utf-8')), save=False)
+    report.pdf.save(f"{stem}.pdf", ContentFile(render_pdf(context)), save=False)
+    report.status = EnterpriseReport.STATUS_DONE
+    report.last_error = ''
+    report.save(update_fields=['status', 'attempts', 'last_error', 'html', 'pdf', 'updated_at'])
+    # Older versions are no longer served; their files go with the rows
+    EnterpriseReport.objects.filter(enterprise_id=report.enterprise_id, version__lt=report.version).delete()
+
+
+def process_due(batch_size=5):
+    """
+    Claim up to ``batch_size`` pending reports and render them.
+
+    Returns counts of ``done``, ``retrying`` and ``failed`` reports; all zero
+    means nothing was pending.
+    """
+    counts = {'done': 0, 'retrying': 0, 'failed': 0}
+    with transaction.atomic():
+        reports = list(
+            EnterpriseReport.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('enterprise')
+            .filter(status=EnterpriseReport.STATUS_PENDING)
+            .order_by('created_at')[:batch_size]
+        )
+        for report in reports:
+            report.attempts += 1
+            try:
+                with transaction.atomic():
+                    _render(report)
+            except Exception as e:
+                report.last_error = f'{type(e).__name__}: {e}'[:2000]
+                if report.attempts >= MAX_ATTEMPTS:
+                    report.status = EnterpriseReport.STATUS_FAILED
+                    counts['failed'] += 1
+                    logger.error(f"Giving up on report #{report.pk} after {report.attempts} attempt(s): {report.last_error}")
+                else:
+                    counts['retrying'] += 1
+                    logger.warning(f"Report #{report.pk} attempt {report.attempts} failed, retrying: {report.last_error}")
+                report.html = report.pdf = ''
+                report.save(update_fields=['status', 'attempts', 'last_error', 'html', 'pdf', 'updated_at'])
+                continue
+            counts['done'] += 1
+    return counts
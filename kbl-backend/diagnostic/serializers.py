@@ -1,6 +1,8 @@
 from rest_framework import serializers
 
 from .models import Category, Question, Enterprise, QuestionResponse, ScoreSummary, Attachment, EmailOTP, ActionItem, TeamMember, NotificationPreference
+from .avatars import avatar_url
+from .media import signed_media_url
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -85,6 +87,7 @@ class EnterpriseSerializer(serializers.ModelSerializer):
 class TeamMemberSerializer(serializers.ModelSerializer):
     # Use PrimaryKeyRelatedField with a default queryset that will be filtered in __init__
     enterprise = serializers.PrimaryKeyRelatedField(queryset=Enterprise.objects.all())
+    avatar_url = serializers.SerializerMethodField()
     
     class Meta:
         model = TeamMember
@@ -111,6 +114,12 @@ class TeamMemberSerializer(serializers.ModelSerializer):
             # If no request context, use all enterprises (fallback, shouldn't happen in normal flow)
             self.fields['enterprise'].queryset = Enterprise.objects.all()
 
+    def get_avatar_url(self, obj):
+        request = self.context.get('request')
+        if obj.user is None or request is None:
+            return ''
+        return avatar_url(request, obj.user, 64)
+
 
 class QuestionResponseSerializer(serializers.ModelSerializer):
     class Meta:
@@ -128,7 +137,7 @@ class QuestionResponseSerializer(serializers.ModelSerializer):
 class ScoreSummarySerializer(serializers.ModelSerializer):
     class Meta:
         model = ScoreSummary
-        fields = ['id', 'enterprise', 'overall_percentage', 'section_scores', 'priorities', 'calculated_at']
+        fields = ['id', 'enterprise', 'overall_percentage', 'section_scores', 'priorities', 'calculated_at', 'version']
 
 
 class AttachmentSerializer(serializers.ModelSerializer):
@@ -136,6 +145,11 @@ class AttachmentSerializer(serializers.ModelSerializer):
         model = Attachment
         fields = ['id', 'response', 'file', 'uploaded_at', 'created_at', 'updated_at']
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['file'] = signed_media_url(self.context.get('request'), instance.file)
+        return data
+
 
 class EmailOTPSerializer(serializers.ModelSerializer):
     class Meta:
@@ -4,27 +4,26 @@ from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 import os
 import logging
-from django.core.mail import send_mail, EmailMultiAlternatives, get_connection
-from django.template.loader import render_to_string
 from django.utils import timezone
 from datetime import timedelta
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.conf import settings
 from .models import EmailOTP
+from .email_templates import build_email
+from .outbox import dedupe_key, enqueue_once
 import logging
 import re
 import requests
 
-from django.db.models import Prefetch
+from django.db.models import F, Prefetch
 from django.utils import timezone
 from datetime import timedelta
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 
-from .models import Enterprise, QuestionResponse, Question, Category, ScoreSummary, EmailOTP, AssessmentSession
+from .models import Enterprise, QuestionResponse, Question, Category, ScoreSummary, EmailOTP, AssessmentSession, ActionItem
+from .reports import bump_report_version
 
 
 IMMEDIATE_PRIORITY_SET = {1, 2}
@@ -110,14 +109,23 @@ def compute_scores_for_enterprise(enterprise: Enterprise) -> Dict:
 
 def recompute_and_store_summary(enterprise: Enterprise) -> ScoreSummary:
     data = compute_scores_for_enterprise(enterprise)
-    summary, _ = ScoreSummary.objects.update_or_create(
-        enterprise=enterprise,
-        defaults={
-            'overall_percentage': data['overall_percentage'],
-            'section_scores': data['section_scores'],
-            'priorities': data['priorities'],
-        }
+    defaults = {
+        'overall_percentage': data['overall_percentage'],
+        'section_scores': data['section_scores'],
+        'priorities': data['priorities'],
+    }
+    previous = ScoreSummary.objects.filter(enterprise=enterprise).values(*defaults).first()
+    changed = previous is not None and (
+        float(previous['overall_percentage'] or 0) != data['overall_percentage']
+        or previous['section_scores'] != data['section_scores']
+        or previous['priorities'] != data['priorities']
     )
+    if changed:
+        # Cached reports are keyed by version, so only bump it when something changed
+        defaults['version'] = F('version') + 1
+    summary, _ = ScoreSummary.objects.update_or_create(enterprise=enterprise, defaults=defaults)
+    if changed:
+        summary.refresh_from_db(fields=['version'])
     # Record a historical session as well
     try:
         AssessmentSession.objects.create(
@@ -131,10 +139,42 @@ def recompute_and_store_summary(enterprise: Enterprise) -> ScoreSummary:
     return summary
 
 
+def resolve_assignee(enterprise: Optional[Enterprise], assigned_to: str):
+    """Return the enterprise owner or accepted team member whose email is ``assigned_to``."""
+    email = (assigned_to or '').strip()
+    if enterprise is None or '@' not in email:
+        return None
+    if enterprise.owner_id and enterprise.owner and enterprise.owner.email.lower() == email.lower():
+        return enterprise.owner
+    member = (
+        enterprise.team_members
+        .select_related('user')
+        .filter(email__iexact=email, user__isnull=False)
+        .first()
+    )
+    return member.user if member else None
+
+
+def link_legacy_assignments(enterprise_id: Optional[int], email: str, user) -> int:
+    """Point email-only (legacy ``assigned_to``) action items in an enterprise at ``user``."""
+    if not enterprise_id or not email:
+        return 0
+    linked = (
+        ActionItem.objects
+        .filter(enterprise_id=enterprise_id, assigned_to_user__isnull=True, assigned_to__iexact=email)
+        .update(assigned_to_user=user)
+    )
+    if linked:
+        # update() skips the ActionItem signals that invalidate cached reports
+        bump_report_version([enterprise_id])
+    return linked
+
+
 def send_verification_email(request, user, base_url: str) -> bool:
     """
-    Create/refresh an EmailOTP and send an HTML email with a verification button.
-    Returns True if email was sent successfully, False otherwise.
+    Create/refresh an EmailOTP and queue an HTML email with a verification button.
+    At most one is queued per user per dedupe window (see diagnostic.outbox).
+    Returns True if the email was queued (now or earlier), False otherwise.
     """
     logger = logging.getLogger(__name__)
     logger.info(f"Attempting to send verification email to {user.email}")
@@ -145,18 +185,6 @@ def send_verification_email(request, user, base_url: str) -> bool:
         expires = timezone.now() + timedelta(hours=24)
         
         logger.debug(f"Generated OTP code: {code}")
-        
-        # Invalidate any existing OTPs for this user
-        EmailOTP.objects.filter(user=user).update(is_used=True)
-        
-        # Create new OTP
-        otp = EmailOTP.objects.create(
-            user=user, 
-            code=code, 
-            expires_at=expires,
-            is_used=False,
-            is_verified=False
-        )
 
         uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
         
@@ -247,45 +275,38 @@ def send_verification_email(request, user, base_url: str) -> bool:
             'verification_url': verification_url,  # This is the actual working link
         }
 
-        subject = 'Verify your email address for Kigali Business Lab'
-        template_path = 'emails/verify_email.html'
-        
-        # Render HTML email
-        html_body = render_to_string(template_path, context)
-        text_body = (
-            f"Hello {user.first_name},\n\n"
-            "Thank you for registering with Kigali Business Lab. "
-            "Please verify your email address by clicking the link below:\n\n"
-            f"{verification_url}\n\n"
-            "If you did not create an account, please ignore this email.\n\n"
-            "Best regards,\n"
-            "Kigali Business Lab Team"
-        )
-
         # Send email
         from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@kigalibusinesslab.rw')
         
-        msg = EmailMultiAlternatives(
-            subject=subject,
-            body=text_body,
-            from_email=from_email,
-            to=[user.email],
-        )
-        msg.attach_alternative(html_body, 'text/html')
-        
-        # Send email with detailed logging
+        # Queue the email; the send_outbox worker delivers it with retries
         try:
-            msg.send(fail_silently=False)
-            logger.info(f"✅ Successfully sent verification email to {user.email}")
+            message = build_email('verification', user.email, context, from_email=from_email)
+
+            def create_otp():
+                # Invalidate any existing OTPs for this user
+                EmailOTP.objects.filter(user=user, is_used=False).update(is_used=True)
+                
+                # Create new OTP
+                EmailOTP.objects.create(
+                    user=user, 
+                    code=code, 
+                    expires_at=expires,
+                    is_used=False,
+                    is_verified=False
+                )
+                return message
+
+            # Retries and double-clicks within the dedupe window reuse the queued email and OTP
+            if enqueue_once(dedupe_key('verification', user.pk), create_otp) is None:
+                logger.info(f"Verification email for {user.email} already queued; not sending another")
+                return True
+            logger.info(f"✅ Queued verification email to {user.email}")
             logger.info(f"   From: {from_email}")
-            logger.info(f"   To: {user.email}")
-            logger.info(f"   Subject: {subject}")
+            logger.info(f"   Subject: {message['subject']}")
             logger.info(f"   Verification URL: {verification_url}")
             return True
         except Exception as send_error:
-            logger.error(f"❌ Failed to send verification email to {user.email}: {str(send_error)}", exc_info=True)
-            logger.error(f"   SendGrid API Key configured: {bool(os.environ.get('SENDGRID_API_KEY'))}")
-            logger.error(f"   From email: {from_email}")
+            logger.error(f"❌ Failed to queue verification email to {user.email}: {str(send_error)}", exc_info=True)
             raise  # Re-raise to be caught by outer exception handler
         
     except Exception as e:
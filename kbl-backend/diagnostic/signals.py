@@ -0,0 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import capabilities
+from .models import ActionItem, ActionItemDocument, ActionItemNote, Attachment, Enterprise, EnterpriseReport
+from .reports import bump_report_version
+
+User = get_user_model()
+
+
+def _adjust_activity_counter(action_item_id, field: str, delta: int) -> None:
+    """Atomically move an ActionItem counter by ``delta`` and stamp the activity time."""
+    ActionItem.objects.filter(pk=action_item_id).update(
+        **{field: Greatest(F(field) + delta, Value(0))},
+        last_activity_at=timezone.now(),
+    )
+
+
+@receiver(post_save, sender=ActionItemNote)
+def action_item_note_saved(sender, instance, created, **kwargs):
+    if created:
+        _adjust_activity_counter(instance.action_item_id, 'notes_count', 1)
+
+
+@receiver(post_delete, sender=ActionItemNote)
+def action_item_note_deleted(sender, instance, **kwargs):
+    _adjust_activity_counter(instance.action_item_id, 'notes_count', -1)
+
+
+@receiver(post_save, sender=ActionItemDocument)
+def action_item_document_saved(sender, instance, created, **kwargs):
+    if created:
+        _adjust_activity_counter(instance.action_item_id, 'documents_count', 1)
+
+
+@receiver(post_delete, sender=ActionItemDocument)
+def action_item_document_deleted(sender, instance, **kwargs):
+    _adjust_activity_counter(instance.action_item_id, 'documents_count', -1)
+
+
+@receiver(post_save, sender=ActionItem)
+@receiver(post_delete, sender=ActionItem)
+def action_item_changed(sender, instance, **kwargs):
+    # Reports list action items, so a change invalidates the cached ones
+    bump_report_version([instance.enterprise_id])
+
+
+@receiver(post_save, sender=Enterprise)
+def enterprise_saved(sender, instance, created, **kwargs):
+    # Reports show the enterprise's name and details
+    if not created:
+        bump_report_version([instance.pk])
+
+
+def _release_file(field_file) -> None:
+    """Drop the deleted row's reference to its file once the delete commits."""
+    if field_file:
+        storage, name = field_file.storage, field_file.name
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, **kwargs):
+    _release_file(instance.file)
+
+
+@receiver(post_delete, sender=ActionItemDocument)
+def action_item_document_file_released(sender, instance, **kwargs):
+    _release_file(instance.file)
+
+
+@receiver(post_delete, sender=EnterpriseReport)
+def enterprise_report_released(sender, instance, **kwargs):
+    _release_file(instance.html)
+    _release_file(instance.pdf)
+
+
+@receiver(post_delete, sender=User)
+def user_avatar_released(sender, instance, **kwargs):
+    from .avatars import release_thumbnails
+
+    _release_file(instance.avatar)
+    release_thumbnails(instance)
+
+
+@receiver(post_migrate, dispatch_uid='diagnostic.capabilities.invalidate')
+def schema_migrated(sender, **kwargs):
+    capabilities.invalidate()
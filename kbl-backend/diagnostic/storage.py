@@ -0,0 +1,167 @@
+"""
+Content-addressed media storage.
+
+Every file saved through ``ContentAddressedStorage`` (the default storage, so
+evidence attachments, action documents and avatars) is stored once under
+``cas/<aa>/<bb>/<sha256><ext>``, whatever its upload_to path would have been.
+Saving content that is already stored only adds a reference; ``StoredBlob``
+rows count the references, and ``delete`` removes the file when the last one
+goes. Both hold the row lock while they touch the file, so a save never
+counts a reference to a file a concurrent delete is about to unlink. Files saved before this storage existed keep their old paths and are
+deleted as before.
+
+The upload handlers below hash request files while Django streams them to
+memory or disk, so the storage does not have to read them a second time.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CAS_PREFIX = 'cas/'
+_extension_re = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+
+def blob_name(sha256, filename=''):
+    """Storage path for content with this digest; the extension keeps MIME guessing working."""
+    extension = os.path.splitext(filename)[1].lower()
+    if not _extension_re.match(extension):
+        extension = ''
+    return f"{CAS_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(CAS_PREFIX)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the final name from the content, so there is nothing to dodge
+        return name
+
+    def _spool(self, content):
+        """Copy content to a temporary file next to the blobs, hashing it on the way."""
+        spool_dir = self.path(f'{CAS_PREFIX}tmp')
+        os.makedirs(spool_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, spooled = tempfile.mkstemp(dir=spool_dir)
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    handle.write(chunk)
+        except BaseException:
+            os.remove(spooled)
+            raise
+        return spooled, digest.hexdigest()
+
+    def _save(self, name, content):
+        sha256 = getattr(content, 'sha256', None)
+        spooled = None
+        if not sha256:
+            spooled, sha256 = self._spool(content)
+        from .models import StoredBlob
+
+        name = blob_name(sha256, name)
+        full_path = self.path(name)
+        try:
+            with transaction.atomic():
+                # The row lock orders this against delete() and gc_media: whoever
+                # holds it sees the file and the reference count agree
+                blob = self._lock_blob(name, sha256)
+                if not os.path.exists(full_path):
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    if spooled is None and hasattr(content, 'temporary_file_path'):
+                        file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+                    else:
+                        if spooled is None:
+                            spooled, _ = self._spool(content)
+                        os.replace(spooled, full_path)
+                        spooled = None
+                    if self.file_permissions_mode is not None:
+                        os.chmod(full_path, self.file_permissions_mode)
+                StoredBlob.objects.filter(pk=blob.pk).update(
+                    ref_count=F('ref_count') + 1, size=os.path.getsize(full_path), updated_at=timezone.now(),
+                )
+        finally:
+            if spooled is not None:
+                os.remove(spooled)
+        return name
+
+    def _lock_blob(self, name, sha256):
+        """The StoredBlob row for ``name``, created with no references if missing, locked."""
+        from .models import StoredBlob
+
+        blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+        if blob is not None:
+            return blob
+        try:
+            with transaction.atomic():
+                return StoredBlob.objects.create(name=name, sha256=sha256, ref_count=0)
+        except IntegrityError:
+            # A concurrent save created it first; wait for its lock
+            return StoredBlob.objects.select_for_update().get(name=name)
+
+    def add_reference(self, name):
+        """Count one more model field pointing at ``name``; the caller holds its row lock."""
+        from .models import StoredBlob
+
+        StoredBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+    def delete(self, name):
+        """Drop one reference; the file goes once nothing refers to it."""
+        if not is_blob(name):
+            return super().delete(name)
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                # Untracked blob: leave it for gc_media rather than guess
+                logger.warning(f"Delete of untracked blob {name} ignored")
+                return
+            if blob.ref_count > 1:
+                StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+                return
+            blob.delete()
+            # Unlinked under the lock: a save of the same content waiting on it
+            # finds no row and no file, and writes both again
+            super().delete(name)
+
+
+class _HashingMixin:
+    def new_file(self, *args, **kwargs):
+        # Before super(): the memory handler raises StopFutureHandlers from new_file
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self._sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.sha256 = self._sha256.hexdigest()
+        return uploaded
+
+
+class HashingMemoryFileUploadHandler(_HashingMixin, MemoryFileUploadHandler):
+    """MemoryFileUploadHandler that also leaves the SHA-256 on the uploaded file."""
+
+
+class HashingTemporaryFileUploadHandler(_HashingMixin, TemporaryFileUploadHandler):
+    """TemporaryFileUploadHandler that also leaves the SHA-256 on the uploaded file."""
@@ -1,3 +1,1339 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail import EmailMultiAlternatives
+from django.core.files.base import ContentFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.authentication import CachedJWTAuthentication
+from config.email_backends import SendGridBatchError, SendGridEmailBackend
+
+from .avatars import process_due
+from .email_templates import EMAIL_TEMPLATES, build_emails, compile_all
+from .exports import iter_evidence_zip
+from .reports import process_due as render_due_reports
+from .media import signed_media_url
+from .models import (
+    ActionItem, ActionItemDocument, ActionItemNote, AssessmentSession, Attachment, AvatarThumbnailJob, Category,
+    EmailOTP, EmailOutbox, Enterprise, EnterpriseReport, NotificationPreference, PhoneOTP, Question,
+    QuestionResponse, ScoreSummary, StoredBlob, TeamMember, UploadSession,
+)
+from .outbox import dedupe_key, deliver_due, enqueue_email
+from .services import link_legacy_assignments
+from .throttling import AuthScopedRateThrottle
+
+User = get_user_model()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TeamMemberPortalQueryCountTests(TestCase):
+    """The portal must cost the same number of queries however much data it returns."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(
+            username='member', email='member@example.com', password='pass', first_name='Mia',
+        )
+        cls.owners = []
+        for i in range(5):
+            owner = User.objects.create_user(
+                username=f'owner{i}', email=f'owner{i}@example.com', password='pass',
+            )
+            enterprise = Enterprise.objects.create(owner=owner, name=f'Enterprise {i}')
+            TeamMember.objects.create(
+                enterprise=enterprise,
+                email=cls.member.email,
+                user=cls.member,
+                status=TeamMember.STATUS_ACTIVE,
+            )
+            items = ActionItem.objects.bulk_create([
+                ActionItem(
+                    owner=owner,
+                    enterprise=enterprise,
+                    title=f'Item {i}-{n}',
+                    assigned_to_user=cls.member,
+                    status=(ActionItem.STATUS_TODO, ActionItem.STATUS_INPROGRESS, ActionItem.STATUS_COMPLETED)[n % 3],
+                )
+                for n in range(40)
+            ])
+            ActionItemNote.objects.create(action_item=items[0], author=owner, content='Kick-off')
+            cls.owners.append(owner)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.member)
+
+    def test_portal_query_count_is_constant(self):
+        # Owner check, memberships, assigned items
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/team-portal/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_enterprises'], 5)
+        for enterprise in data['enterprises']:
+            self.assertEqual(enterprise['total_assigned'], 40)
+            self.assertEqual(
+                enterprise['todo'] + enterprise['in_progress'] + enterprise['completed'], 40,
+            )
+        notes = [
+            action['notes_count']
+            for enterprise in data['enterprises']
+            for action in enterprise['assigned_actions']
+        ]
+        self.assertEqual(notes.count(1), 5)
+
+    def test_portal_excludes_items_assigned_to_others(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='pass')
+        ActionItem.objects.create(
+            owner=self.owners[0],
+            enterprise=self.owners[0].enterprise,
+            title='Not mine',
+            assigned_to_user=other,
+        )
+        response = self.client.get('/api/team-portal/')
+        titles = {
+            action['title']
+            for enterprise in response.json()['enterprises']
+            for action in enterprise['assigned_actions']
+        }
+        self.assertNotIn('Not mine', titles)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    """Email backend whose every send fails, for exercising outbox retries."""
+
+    def send_messages(self, email_messages):
+        raise ConnectionError('mail server unavailable')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+@override_settings(SECURE_SSL_REDIRECT=False)
+class EmailOutboxTests(TestCase):
+    def test_request_path_only_enqueues(self):
+        user = User.objects.create_user(username='reset', email='reset@example.com', password='pass')
+        response = APIClient().post('/api/auth/password-reset/request/', {'email': user.email}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        row = EmailOutbox.objects.get()
+        self.assertEqual((row.kind, row.to, row.status), ('password_reset', [user.email], EmailOutbox.STATUS_PENDING))
+
+    def test_repeated_logins_queue_one_verification(self):
+        user = User.objects.create_user(username='unverified', email='unverified@example.com', password='pass')
+        client = APIClient()
+        for _ in range(3):
+            response = client.post('/api/auth/login/', {'email': user.email, 'password': 'pass'}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(EmailOutbox.objects.filter(kind='verification').count(), 1)
+        self.assertEqual(EmailOTP.objects.filter(user=user).count(), 1)
+        self.assertEqual(EmailOutbox.objects.get().dedupe_key, dedupe_key('verification', user.pk))
+
+    def test_password_reset_retries_are_deduplicated(self):
+        user = User.objects.create_user(username='twice', email='twice@example.com', password='pass')
+        client = APIClient()
+        for _ in range(2):
+            response = client.post('/api/auth/password-reset/request/', {'email': user.email}, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(EmailOutbox.objects.filter(kind='password_reset').count(), 1)
+
+    def test_worker_sends_due_rows(self):
+        enqueue_email(['a@example.com'], 'Hello', 'Plain body', html_body='<p>Hi</p>', kind='test')
+        call_command('send_outbox', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        row = EmailOutbox.objects.get()
+        self.assertEqual(row.status, EmailOutbox.STATUS_SENT)
+        self.assertEqual(row.attempts, 1)
+        self.assertIsNotNone(row.sent_at)
+
+    @override_settings(EMAIL_BACKEND='diagnostic.tests.FailingEmailBackend')
+    def test_failures_back_off_then_give_up(self):
+        row = enqueue_email(['b@example.com'], 'Hello', 'Body')
+        row.max_attempts = 2
+        row.save(update_fields=['max_attempts'])
+
+        self.assertEqual(deliver_due(), {'sent': 0, 'retrying': 1, 'failed': 0})
+        row.refresh_from_db()
+        self.assertEqual(row.status, EmailOutbox.STATUS_PENDING)
+        self.assertGreater(row.next_attempt_at, timezone.now())
+        self.assertIn('mail server unavailable', row.last_error)
+        # Not due yet, so the next pass leaves it alone
+        self.assertEqual(deliver_due(), {'sent': 0, 'retrying': 0, 'failed': 0})
+
+        EmailOutbox.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_due(), {'sent': 0, 'retrying': 0, 'failed': 1})
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (EmailOutbox.STATUS_FAILED, 2))
+
+    def test_claimed_rows_are_leased_to_one_worker(self):
+        row = enqueue_email(['c@example.com'], 'Hello', 'Body')
+        from .outbox import _claim_due
+
+        self.assertEqual([claimed.pk for claimed in _claim_due(10)], [row.pk])
+        # A second worker polling while the first is sending finds nothing
+        self.assertEqual(_claim_due(10), [])
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (EmailOutbox.STATUS_PENDING, 0))
+
+    def test_prune_deletes_only_old_finished_rows(self):
+        old_sent, old_failed, recent, pending = (enqueue_email([f'{i}@example.com'], 'Code', 'Your code is 123456') for i in range(4))
+        EmailOutbox.objects.filter(pk=old_sent.pk).update(status=EmailOutbox.STATUS_SENT)
+        EmailOutbox.objects.filter(pk=old_failed.pk).update(status=EmailOutbox.STATUS_FAILED)
+        EmailOutbox.objects.filter(pk=recent.pk).update(status=EmailOutbox.STATUS_SENT, updated_at=timezone.now())
+        EmailOutbox.objects.filter(pk__in=[old_sent.pk, old_failed.pk, pending.pk]).update(
+            updated_at=timezone.now() - timedelta(days=10),
+        )
+        out = StringIO()
+        call_command('prune_outbox', stdout=out)
+        self.assertIn('Deleted 2', out.getvalue())
+        self.assertEqual(set(EmailOutbox.objects.values_list('pk', flat=True)), {recent.pk, pending.pk})
+
+
+@override_settings(SENDGRID_API_KEY='test-key', SENDGRID_API_BASE_URL='http://sendgrid.test')
+class SendGridEmailBackendTests(TestCase):
+    def setUp(self):
+        self.payloads = []
+        self.session = mock.Mock()
+        self.session.post.side_effect = self.fake_post
+        patcher = mock.patch('config.email_backends._get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_post(self, url, json, headers, timeout):
+        self.payloads.append(json)
+        failing = json['subject'] == 'Broken'
+        return mock.Mock(status_code=500 if failing else 202, text='boom' if failing else '')
+
+    def message(self, to, subject='Notice'):
+        message = EmailMultiAlternatives(subject, 'Plain', 'team@example.com', [to])
+        message.attach_alternative('<p>HTML</p>', 'text/html')
+        return message
+
+    def test_identical_messages_share_one_request(self):
+        messages = [self.message(f'user{i}@example.com') for i in range(3)] + [self.message('x@example.com', 'Other')]
+        self.assertEqual(SendGridEmailBackend().send_messages(messages), 4)
+        self.assertEqual(len(self.payloads), 2)
+        self.assertEqual(self.session.post.call_args.args[0], 'http://sendgrid.test/v3/mail/send')
+        batched = next(p for p in self.payloads if p['subject'] == 'Notice')
+        self.assertEqual([p['to'] for p in batched['personalizations']], [[{'email': f'user{i}@example.com'}] for i in range(3)])
+        self.assertEqual([c['type'] for c in batched['content']], ['text/plain', 'text/html'])
+
+    def test_partial_failure_names_failed_messages(self):
+        good, bad = self.message('a@example.com'), self.message('b@example.com', 'Broken')
+        with self.assertRaises(SendGridBatchError) as raised:
+            SendGridEmailBackend().send_messages([good, bad])
+        self.assertEqual(list(raised.exception.failed_messages), [bad])
+        self.assertEqual(raised.exception.sent, 1)
+
+    def test_unsendable_messages_are_reported_as_failed(self):
+        good, empty = self.message('a@example.com'), EmailMultiAlternatives('Notice', '', 'team@example.com', [])
+        with self.assertRaises(SendGridBatchError) as raised:
+            SendGridEmailBackend().send_messages([good, empty])
+        self.assertEqual(raised.exception.failed_messages, {empty: 'No recipients in email message'})
+        self.assertEqual(raised.exception.sent, 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AuthThrottlingTests(TestCase):
+    def setUp(self):
+        caches['throttle'].clear()
+        self.addCleanup(caches['throttle'].clear)
+        patcher = mock.patch.object(AuthScopedRateThrottle, 'THROTTLE_RATES', {'auth_register': '2/min', 'invitation_accept': '20/min'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def register(self, forwarded_for):
+        return APIClient().post('/api/auth/register/', {}, format='json', HTTP_X_FORWARDED_FOR=forwarded_for)
+
+    def test_spoofed_forwarded_for_does_not_reset_the_limit(self):
+        # The proxy appends the real client address; earlier entries are client-supplied
+        statuses = [self.register(f'10.0.0.{i}, 203.0.113.5').status_code for i in range(3)]
+        self.assertNotEqual(statuses[1], 429)
+        self.assertEqual(statuses[2], 429)
+        self.assertNotEqual(self.register('198.51.100.7').status_code, 429)
+
+    @override_settings(PASSWORD_HASHING_WAIT_SECONDS=0.05)
+    def test_hashing_cap_rejects_when_no_slot_is_free(self):
+        with mock.patch('diagnostic.throttling._try_global_slot', return_value=None):
+            response = self.register('203.0.113.9')
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            # Looking an invitation up hashes nothing, so it is not capped
+            lookup = APIClient().get('/api/team/accept/', {'token': 'missing'})
+            self.assertEqual(lookup.status_code, 400)
+            accept = APIClient().post('/api/team/accept/', {'token': 'missing'}, format='json')
+            self.assertEqual(accept.status_code, 429)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BulkActionItemTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        cls.member = User.objects.create_user(username='member', email='member@example.com', password='pass')
+        cls.enterprise = Enterprise.objects.create(owner=cls.owner, name='Acme')
+        TeamMember.objects.create(
+            enterprise=cls.enterprise, email=cls.member.email, user=cls.member,
+            status=TeamMember.STATUS_ACTIVE, role=TeamMember.ROLE_MEMBER,
+        )
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='pass')
+        other = Enterprise.objects.create(owner=stranger, name='Other')
+        cls.foreign = ActionItem.objects.create(owner=stranger, enterprise=other, title='Not yours')
+
+    def setUp(self):
+        self.first = ActionItem.objects.create(owner=self.owner, enterprise=self.enterprise, title='First')
+        self.second = ActionItem.objects.create(owner=self.owner, enterprise=self.enterprise, title='Second')
+        self.client = APIClient()
+
+    def bulk(self, user, *operations):
+        self.client.force_authenticate(user)
+        return self.client.post('/api/action-items/bulk/', {'operations': list(operations)}, format='json')
+
+    def test_applies_a_mix_of_operations(self):
+        response = self.bulk(
+            self.owner,
+            {'op': 'create', 'data': {'title': 'Third'}},
+            {'op': 'update', 'id': self.first.pk, 'data': {'title': 'First, renamed'}},
+            {'op': 'assign', 'id': self.first.pk, 'user_id': self.member.pk},
+            {'op': 'complete', 'id': self.second.pk},
+            {'op': 'delete', 'id': self.second.pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['deleted']), (1, 1, 1))
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.title, self.first.assigned_to_user), ('First, renamed', self.member))
+        self.assertFalse(ActionItem.objects.filter(pk=self.second.pk).exists())
+        self.assertEqual(ActionItem.objects.get(title='Third').enterprise, self.enterprise)
+
+    def test_items_are_locked_before_they_are_validated(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.bulk(self.owner, {'op': 'update', 'id': self.first.pk, 'data': {'title': 'Renamed'}})
+        lookup = next(q['sql'] for q in queries if '"diagnostic_actionitem"."id" IN' in q['sql'] and q['sql'].startswith('SELECT'))
+        self.assertIn('FOR UPDATE', lookup)
+
+    def test_one_invalid_operation_applies_nothing(self):
+        response = self.bulk(
+            self.owner,
+            {'op': 'create', 'data': {'title': 'Third'}},
+            {'op': 'update', 'id': self.first.pk, 'data': {'title': 'First, renamed'}},
+            {'op': 'update', 'id': self.second.pk, 'data': {'priority': 'urgent'}},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['status'] for r in response.data['results']], ['skipped', 'skipped', 'error'])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.title, 'First')
+        self.assertFalse(ActionItem.objects.filter(title='Third').exists())
+
+    def test_permissions_are_checked_per_operation(self):
+        response = self.bulk(
+            self.member,
+            {'op': 'complete', 'id': self.first.pk},
+            {'op': 'update', 'id': self.second.pk, 'data': {'title': 'Renamed'}},
+            {'op': 'delete', 'id': self.second.pk},
+            {'op': 'assign', 'id': self.second.pk, 'user_id': self.member.pk},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [r.get('errors') for r in response.data['results']],
+            [None] + [{'detail': 'Permission denied'}] * 3,
+        )
+        self.assertEqual(self.bulk(self.member, {'op': 'complete', 'id': self.first.pk}).status_code, 200)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, ActionItem.STATUS_COMPLETED)
+
+    def test_items_the_caller_cannot_see_are_not_found(self):
+        for op in ({'op': 'complete', 'id': self.foreign.pk}, {'op': 'delete', 'id': self.foreign.pk}):
+            response = self.bulk(self.owner, op)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['results'][0]['errors'], {'id': 'Action item not found'})
+        self.assertTrue(ActionItem.objects.filter(pk=self.foreign.pk).exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AssigneeResolutionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        cls.member = User.objects.create_user(username='member', email='member@example.com', password='pass')
+        cls.enterprise = Enterprise.objects.create(owner=cls.owner, name='Acme')
+        TeamMember.objects.create(
+            enterprise=cls.enterprise, email='Member@Example.com', user=cls.member,
+            status=TeamMember.STATUS_ACTIVE, role=TeamMember.ROLE_MEMBER,
+        )
+        other = Enterprise.objects.create(owner=User.objects.create_user(username='other', email='other@example.com'), name='Other')
+        TeamMember.objects.create(enterprise=other, email='outsider@example.com', user=User.objects.create_user(
+            username='outsider', email='outsider@example.com',
+        ), status=TeamMember.STATUS_ACTIVE)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_create_and_update_resolve_free_text_assignees(self):
+        response = self.client.post('/api/action-items/', {
+            'enterprise': self.enterprise.pk, 'title': 'Hire', 'assigned_to': ' member@example.com ',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['assigned_to_user'], self.member.pk)
+
+        url = f"/api/action-items/{response.data['id']}/"
+        self.assertEqual(self.client.patch(url, {'assigned_to': 'OWNER@example.com'}, format='json').data['assigned_to_user'], self.owner.pk)
+        # Someone outside the enterprise, or a plain name, stays free text
+        self.assertIsNone(self.client.patch(url, {'assigned_to': 'outsider@example.com'}, format='json').data['assigned_to_user'])
+        self.assertIsNone(self.client.patch(url, {'assigned_to': 'The accountant'}, format='json').data['assigned_to_user'])
+
+    def test_accepting_an_invitation_links_earlier_assignments(self):
+        invited = TeamMember.objects.create(
+            enterprise=self.enterprise, email='newhire@example.com', status=TeamMember.STATUS_INVITED,
+            invitation_token='tok', invitation_expires_at=timezone.now() + timedelta(days=1), invited_by=self.owner,
+        )
+        item = ActionItem.objects.create(owner=self.owner, enterprise=self.enterprise, title='Train', assigned_to='NewHire@example.com')
+        self.assertIsNone(item.assigned_to_user)
+
+        response = APIClient().post('/api/team/accept/', {
+            'token': 'tok', 'password': 'long-enough-pw', 'confirm_password': 'long-enough-pw',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        invited.refresh_from_db()
+        item.refresh_from_db()
+        self.assertEqual(item.assigned_to_user, invited.user)
+
+    def test_backfill_batches_and_resumes(self):
+        items = [
+            ActionItem.objects.create(owner=self.owner, enterprise=self.enterprise, title=f'Task {n}', assigned_to=email)
+            for n, email in enumerate(['member@example.com', 'outsider@example.com', 'OWNER@example.com', 'nobody'])
+        ]
+        out = StringIO()
+        call_command('backfill_action_item_assignees', '--batch-size=1', '--dry-run', stdout=out)
+        self.assertIn('Would link 2 of 3 legacy assignment(s)', out.getvalue())
+        self.assertFalse(ActionItem.objects.filter(assigned_to_user__isnull=False).exists())
+
+        out = StringIO()
+        call_command('backfill_action_item_assignees', '--batch-size=1', f'--start-after={items[1].pk}', stdout=out)
+        self.assertIn(f'Scanned up to id {items[2].pk}: linked 1 of 1 item(s)', out.getvalue())
+        self.assertIn('Linked 1 of 1 legacy assignment(s)', out.getvalue())
+
+        out = StringIO()
+        call_command('backfill_action_item_assignees', '--batch-size=2', stdout=out)
+        self.assertIn('Linked 1 of 2 legacy assignment(s)', out.getvalue())
+        self.assertEqual(
+            [item.assigned_to_user_id for item in ActionItem.objects.filter(pk__in=[i.pk for i in items]).order_by('pk')],
+            [self.member.pk, None, self.owner.pk, None],
+        )
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MigrationStatusTests(TestCase):
+    def test_refresh_requires_a_staff_session(self):
+        with mock.patch('diagnostic.capabilities.invalidate') as invalidate:
+            self.assertEqual(self.client.get('/migration-status/').status_code, 200)
+            self.assertEqual(self.client.get('/migration-status/?refresh=1').status_code, 403)
+            invalidate.assert_not_called()
+
+            staff = User.objects.create_user(username='ops', email='ops@example.com', password='pass', is_staff=True)
+            self.client.force_login(staff)
+            self.assertEqual(self.client.get('/migration-status/?refresh=1').status_code, 200)
+            invalidate.assert_called_once()
+
+
+class ActionDigestTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass', first_name='Olive')
+        self.assignee = User.objects.create_user(username='helper', email='helper@example.com', password='pass')
+        self.enterprise = Enterprise.objects.create(owner=self.owner, name='Acme')
+        self.today = timezone.localdate()
+
+    def item(self, title, days, **fields):
+        return ActionItem.objects.create(
+            owner=self.owner, enterprise=self.enterprise, title=title,
+            due_date=self.today + timedelta(days=days), **fields,
+        )
+
+    def digests(self, *args):
+        call_command('send_action_digests', *args, stdout=StringIO())
+        return {row.to[0]: row for row in EmailOutbox.objects.filter(kind='action_digest')}
+
+    def test_selects_overdue_and_upcoming_items_per_recipient(self):
+        self.item('Late filing', -2, assigned_to_user=self.assignee)
+        self.item('Due tomorrow', 1)
+        self.item('Next month', 30)
+        self.item('Already done', -1, status=ActionItem.STATUS_COMPLETED)
+        ActionItem.objects.create(owner=self.owner, enterprise=self.enterprise, title='No due date')
+
+        digests = self.digests()
+        self.assertEqual(sorted(digests), ['helper@example.com', 'owner@example.com'])
+        owner = digests['owner@example.com']
+        self.assertEqual(owner.subject, '1 overdue action item(s) need attention')
+        self.assertIn('Hello Olive', owner.body)
+        for title in ('Late filing', 'Due tomorrow'):
+            self.assertIn(title, owner.body)
+        for title in ('Next month', 'Already done', 'No due date'):
+            self.assertNotIn(title, owner.body)
+        helper = digests['helper@example.com']
+        self.assertIn('Late filing', helper.body)
+        self.assertNotIn('Due tomorrow', helper.body)
+        self.assertIn('/team-portal', helper.body)
+
+    def test_skips_opted_out_and_inactive_recipients(self):
+        self.item('Late filing', -2, assigned_to_user=self.assignee)
+        NotificationPreference.objects.create(user=self.owner, email_notifications=False)
+        self.assignee.is_active = False
+        self.assignee.save()
+        self.assertEqual(self.digests(), {})
+
+    def test_caps_items_per_digest(self):
+        for days in range(-3, 3):
+            self.item(f'Item {days}', days)
+        body = self.digests('--max-items=4')['owner@example.com'].body
+        self.assertEqual(body.count('  - Item'), 4)
+        self.assertIn('...and 2 more.', body)
+
+    def test_queues_one_digest_per_recipient_and_day(self):
+        self.item('Late filing', -2)
+        first = self.digests()['owner@example.com']
+        self.assertEqual(first.dedupe_key, f'action_digest:{self.owner.pk}:{self.today.isoformat()}')
+
+        out = StringIO()
+        call_command('send_action_digests', stdout=out)
+        self.assertIn('Queued 0 of 1 digest(s); 1 were already queued today', out.getvalue())
+        self.assertEqual(EmailOutbox.objects.filter(kind='action_digest').count(), 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class DatabaseAssembledPayloadTests(TestCase):
+    """?assemble=db must return the same documents as the ORM code paths."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        cls.enterprise = Enterprise.objects.create(owner=cls.owner, name='Acme')
+        people = [
+            User.objects.create_user(username='fl', email='fl@example.com', password='pass', first_name='Fay', last_name='Lu'),
+            User.objects.create_user(username='f', email='f@example.com', password='pass', first_name='fred'),
+            User.objects.create_user(username='e', email='eve@example.com', password='pass'),
+        ]
+        assignments = [{'assigned_to_user': user} for user in people] + [
+            {'assigned_to': 'jane.doe@example.com'},
+            {'assigned_to': 'ops@example.com'},
+            {'assigned_to': 'Finance team'},
+            {},
+        ]
+        statuses = [ActionItem.STATUS_TODO, ActionItem.STATUS_INPROGRESS]
+        for index, fields in enumerate(assignments):
+            ActionItem.objects.create(
+                owner=cls.owner, enterprise=cls.enterprise, title=f'Item {index}', status=statuses[index % 2],
+                order=len(assignments) - index, due_date=timezone.localdate() if index % 3 else None,
+                progress_percentage=index * 10, **fields,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def fetch(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return json.loads(content)
+
+    def test_board_matches_orm(self):
+        self.assertEqual(self.fetch('/api/action-items/board/?assemble=db'), self.fetch('/api/action-items/board/'))
+
+    def test_report_matches_orm(self):
+        category = Category.objects.create(name='Finance')
+        for number, score in (('1-1', 1), ('1-2', 3)):
+            question = Question.objects.create(category=category, number=number, priority=1, text=number, descriptors={})
+            QuestionResponse.objects.create(enterprise=self.enterprise, question=question, score=score)
+        url = f'/api/enterprise/{self.enterprise.pk}/report/'
+        orm = self.fetch(url)
+        self.assertTrue(orm['section_scores'])
+        self.assertEqual(self.fetch(url + '?assemble=db'), orm)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BulkInviteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        cls.enterprise = Enterprise.objects.create(owner=cls.owner, name='Acme')
+        TeamMember.objects.create(enterprise=cls.enterprise, email='Known@example.com', status=TeamMember.STATUS_INVITED)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def invite(self, **data):
+        return self.client.post('/api/team/bulk-invite/', {'enterprise': self.enterprise.pk, **data}, format='json')
+
+    def test_reports_a_status_per_address_and_queues_one_email_per_invite(self):
+        response = self.invite(invitations=[
+            'new@example.com',
+            {'email': 'Lead@Example.com', 'role': 'manager'},
+            'NEW@example.com',
+            'not-an-email',
+            {'email': 'role@example.com', 'role': 'boss'},
+            'owner@example.com',
+            'known@example.com',
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [(r['email'], r['status']) for r in response.data['results']],
+            [
+                ('new@example.com', 'invited'), ('lead@example.com', 'invited'), ('new@example.com', 'duplicate'),
+                ('not-an-email', 'invalid'), ('role@example.com', 'invalid'), ('owner@example.com', 'skipped'),
+                ('known@example.com', 'exists'),
+            ],
+        )
+        self.assertEqual(
+            dict(TeamMember.objects.filter(enterprise=self.enterprise, status=TeamMember.STATUS_INVITED)
+                 .exclude(email='Known@example.com').values_list('email', 'role')),
+            {'new@example.com': TeamMember.ROLE_MEMBER, 'lead@example.com': TeamMember.ROLE_MANAGER},
+        )
+        self.assertEqual(
+            sorted(to for row in EmailOutbox.objects.filter(kind='team_invitation') for to in row.to),
+            ['lead@example.com', 'new@example.com'],
+        )
+
+    def test_accepts_csv_with_a_header_row(self):
+        response = self.invite(csv='email,role\nfirst@example.com,admin\nsecond@example.com\n')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['counts'], {'invited': 2})
+        self.assertEqual(TeamMember.objects.get(email='first@example.com').role, TeamMember.ROLE_ADMIN)
+
+    def test_other_enterprises_are_not_found(self):
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='pass')
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.invite(invitations=['new@example.com']).status_code, 404)
+        self.assertFalse(TeamMember.objects.filter(email='new@example.com').exists())
+
+
+class PruneTokensTests(TestCase):
+    def test_prunes_expired_tokens_in_batches(self):
+        user = User.objects.create_user(username='u', email='u@example.com', password='pass')
+        now = timezone.now()
+        tokens = {
+            name: OutstandingToken.objects.create(user=user, jti=name, token=name, expires_at=now + offset)
+            for name, offset in (
+                ('old', -timedelta(days=2)), ('old-blacklisted', -timedelta(days=3)),
+                ('in-grace', -timedelta(minutes=30)), ('live', timedelta(days=1)),
+            )
+        }
+        BlacklistedToken.objects.create(token=tokens['old-blacklisted'])
+        BlacklistedToken.objects.create(token=tokens['live'])
+
+        out = StringIO()
+        call_command('prune_tokens', '--dry-run', stdout=out)
+        self.assertIn('Would prune 2 outstanding and 1 blacklisted', out.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 4)
+
+        out = StringIO()
+        call_command('prune_tokens', '--batch-size=1', '--pause=0', stdout=out)
+        self.assertIn('Pruned 2 outstanding and 1 blacklisted token(s) in 2 batch(es)', out.getvalue())
+        self.assertEqual(set(OutstandingToken.objects.values_list('jti', flat=True)), {'in-grace', 'live'})
+        self.assertEqual(BlacklistedToken.objects.get().token, tokens['live'])
+
+
+class SweepOtpsTests(TestCase):
+    def test_deletes_only_expired_unverified_codes(self):
+        user = User.objects.create_user(username='u', email='u@example.com', password='pass')
+        now = timezone.now()
+        for code, expires_at, verified in (
+            ('expired', now - timedelta(days=2), False),
+            ('verified', now - timedelta(days=2), True),
+            ('in-grace', now - timedelta(hours=1), False),
+            ('live', now + timedelta(minutes=5), False),
+        ):
+            EmailOTP.objects.create(user=user, code=code, expires_at=expires_at, is_verified=verified)
+        PhoneOTP.objects.create(user=user, phone='+250700000000', code='111111', expires_at=now - timedelta(days=2))
+        PhoneOTP.objects.create(user=user, phone='+250700000000', code='222222', expires_at=now + timedelta(minutes=5))
+
+        out = StringIO()
+        call_command('sweep_otps', '--batch-size=1', '--pause=0', stdout=out)
+        self.assertIn('EmailOTP: deleted 1 expired code(s)', out.getvalue())
+        self.assertIn('PhoneOTP: deleted 1 expired code(s)', out.getvalue())
+        self.assertEqual(set(EmailOTP.objects.values_list('code', flat=True)), {'verified', 'in-grace', 'live'})
+        self.assertEqual(list(PhoneOTP.objects.values_list('code', flat=True)), ['222222'])
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='u@example.com', email='u@example.com', password='pass')
+        self.token = RefreshToken.for_user(self.user).access_token
+        self.auth = CachedJWTAuthentication()
+
+    def resolve(self):
+        return self.auth.get_user(self.token)
+
+    def test_second_request_is_served_from_cache(self):
+        self.resolve()
+        with self.assertNumQueries(1):  # the shared version token only
+            self.assertEqual(self.resolve().pk, self.user.pk)
+
+    def test_save_invalidates_copies_cached_by_every_worker(self):
+        self.assertEqual(self.resolve().first_name, '')
+        token_key = f'auth:user-version:{self.user.pk}'
+        before = caches['auth_versions'].get(token_key)
+        self.user.first_name = 'Uma'
+        self.user.save()
+        # Other workers see the change through the shared token, not their own cache
+        self.assertNotEqual(caches['auth_versions'].get(token_key), before)
+        self.assertEqual(self.resolve().first_name, 'Uma')
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.resolve()
+
+    def test_deleted_user_is_not_served_from_cache(self):
+        self.resolve()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.resolve()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class StaleAuthUserTests(TestCase):
+    """Account views must write the row, not the (possibly stale) authenticated copy."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='u@example.com', email='u@example.com', password='old-pass')
+        self.stale = User.objects.get(pk=self.user.pk)
+        self.client = APIClient()
+        self.client.force_authenticate(self.stale)
+
+    def test_profile_update_keeps_fields_it_does_not_edit(self):
+        User.objects.filter(pk=self.user.pk).update(
+            avatar='cas/aa/bb/processed.webp', email_verified_at=timezone.now(),
+        )
+        response = self.client.put('/api/account/profile/', {'first_name': 'Uma', 'title': 'CFO'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['first_name'], response.data['title']), ('Uma', 'CFO'))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.avatar.name), ('Uma', 'cas/aa/bb/processed.webp'))
+        self.assertIsNotNone(self.user.email_verified_at)
+
+    def test_password_change_checks_the_current_hash(self):
+        self.user.set_password('changed-elsewhere')
+        self.user.save()
+        data = {'current_password': 'old-pass', 'new_password': 'new-pass-1', 'confirm_password': 'new-pass-1'}
+        self.assertEqual(self.client.post('/api/account/password/change/', data).status_code, 400)
+        data['current_password'] = 'changed-elsewhere'
+        self.assertEqual(self.client.post('/api/account/password/change/', data).status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-pass-1'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class EmailVerificationStateTests(TestCase):
+    def test_verification_link_unblocks_login_and_refreshes_cached_user(self):
+        user = User.objects.create_user(username='new', email='new@example.com', password='pass')
+        credentials = {'email': 'new@example.com', 'password': 'pass'}
+        self.assertEqual(self.client.post('/api/auth/login/', credentials).status_code, 400)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        self.assertFalse(client.get('/api/auth/status/').data['verified'])
+
+        EmailOTP.objects.create(user=user, code='abc123', expires_at=timezone.now() + timedelta(hours=1))
+        uid = urlsafe_base64_encode(force_bytes(user.pk))
+        response = self.client.get(f'/api/auth/verify-email/?uid={uid}&code=abc123')
+        self.assertIn('message=email_verified', response['Location'])
+
+        user.refresh_from_db()
+        self.assertIsNotNone(user.email_verified_at)
+        self.assertFalse(user.mark_email_verified())
+        # The cached auth user was invalidated by mark_email_verified
+        self.assertTrue(client.get('/api/auth/status/').data['verified'])
+        self.assertEqual(self.client.post('/api/auth/login/', credentials).status_code, 200)
+
+
+class EmailTemplateRegistryTests(TestCase):
+    def test_every_registered_template_compiles(self):
+        compile_all()
+
+    def test_renders_plain_text_unescaped_and_html_escaped(self):
+        context = {
+            'inviter_name': 'Ana <Ops>', 'invitee_email': 'new@example.com',
+            'enterprise_name': 'Tom & Jerry\nLtd', 'accept_url': 'https://example.com/accept?a=1&b=2',
+        }
+        first, second = build_emails(
+            'team_invitation', [('new@example.com', context), (['a@example.com', 'b@example.com'], context)],
+            from_email='kbl@example.com',
+        )
+        self.assertEqual(first['subject'], "You've been invited to join Tom & Jerry Ltd on Kigali Business Lab")
+        self.assertIn('Ana <Ops> has invited you', first['body'])
+        self.assertIn('https://example.com/accept?a=1&b=2', first['body'])
+        self.assertIn('Ana &lt;Ops&gt;', first['html_body'])
+        self.assertNotIn('Ana <Ops>', first['html_body'])
+        self.assertEqual((first['to'], second['to']), (['new@example.com'], ['a@example.com', 'b@example.com']))
+        self.assertEqual((first['kind'], first['from_email']), ('team_invitation', 'kbl@example.com'))
+
+    def test_text_only_templates_have_no_html_body(self):
+        kinds = [kind for kind, spec in EMAIL_TEMPLATES.items() if spec.html_template is None]
+        self.assertIn('email_otp', kinds)
+        email = build_emails('email_otp', [('u@example.com', {'code': '123456'})])[0]
+        self.assertIn('123456', email['body'])
+        self.assertEqual(email['html_body'], '')
+
+
+class WeeklyReportTests(TestCase):
+    def owner(self, name, **preferences):
+        user = User.objects.create_user(username=name, email=f'{name}@example.com', password='pass', first_name=name.title())
+        if preferences:
+            NotificationPreference.objects.create(user=user, **preferences)
+        return user, Enterprise.objects.create(owner=user, name=f'{name.title()} Ltd')
+
+    def run_command(self):
+        out = StringIO()
+        call_command('send_weekly_reports', '--workers=0', stdout=out)
+        return out.getvalue()
+
+    def test_figures_cover_the_week_and_opted_out_owners_are_skipped(self):
+        now = timezone.now()
+        _, enterprise = self.owner('ada')
+        ScoreSummary.objects.create(enterprise=enterprise, overall_percentage=62.5)
+        before = AssessmentSession.objects.create(enterprise=enterprise, overall_percentage=50)
+        AssessmentSession.objects.filter(pk=before.pk).update(created_at=now - timedelta(days=10))
+        AssessmentSession.objects.create(enterprise=enterprise, overall_percentage=62.5)
+        owner = enterprise.owner
+        ActionItem.objects.create(
+            owner=owner, enterprise=enterprise, title='Done', status=ActionItem.STATUS_COMPLETED,
+            completed_at=now - timedelta(days=1),
+        )
+        ActionItem.objects.create(
+            owner=owner, enterprise=enterprise, title='Late', due_date=timezone.localdate() - timedelta(days=1),
+        )
+        old = ActionItem.objects.create(owner=owner, enterprise=enterprise, title='Old')
+        ActionItem.objects.filter(pk=old.pk).update(created_at=now - timedelta(days=30))
+
+        _, muted = self.owner('bo', weekly_reports=False)
+        ScoreSummary.objects.create(enterprise=muted, overall_percentage=40)
+        self.owner('cy')  # nothing assessed and no action plan
+
+        self.assertIn('Queued 1 weekly report(s) for 2 opted-in user(s); 1 had nothing to report', self.run_command())
+        email = EmailOutbox.objects.get(kind='weekly_report')
+        self.assertEqual(email.to, ['ada@example.com'])
+        self.assertEqual(email.subject, 'Your weekly progress report for Ada Ltd')
+        for line in (
+            'Overall score: 62.5% (+12.5)',
+            'Assessments completed this week: 1',
+            'Action items completed: 1',
+            'New action items: 2',
+            'Still open: 2 (1 overdue)',
+        ):
+            self.assertIn(line, email.body)
+
+
+class TempMediaRootMixin:
+    """Point MEDIA_ROOT at a fresh temporary directory for each test."""
+    media_settings = {}
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, **self.media_settings)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ProtectedMediaTests(TempMediaRootMixin, TestCase):
+    media_settings = {'MEDIA_OFFLOAD': ''}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        cls.outsider = User.objects.create_user(username='outsider', email='outsider@example.com', password='pass')
+        enterprise = Enterprise.objects.create(owner=cls.owner, name='Acme')
+        cls.item = ActionItem.objects.create(owner=cls.owner, enterprise=enterprise, title='Policy')
+
+    def setUp(self):
+        super().setUp()
+        self.doc = ActionItemDocument(action_item=self.item, uploaded_by=self.owner, filename='policy.txt')
+        self.doc.file.save('policy.txt', ContentFile(b'0123456789'))
+        self.url = f'/media/{self.doc.file.name}'
+
+    def test_requires_access_or_signature(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.client.logout()
+        self.assertEqual(self.client.get(signed_media_url(None, self.doc.file)).status_code, 200)
+
+    def test_range_and_accel_offload(self):
+        signed = signed_media_url(None, self.doc.file)
+        response = self.client.get(signed, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(self.client.get(signed, HTTP_RANGE='bytes=20-').status_code, 416)
+        with override_settings(MEDIA_OFFLOAD='accel'):
+            response = self.client.get(signed)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.doc.file.name}')
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ActionItemActivityTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        enterprise = Enterprise.objects.create(owner=self.owner, name='Acme')
+        self.item = ActionItem.objects.create(owner=self.owner, enterprise=enterprise, title='Register the business')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def counters(self):
+        return ActionItem.objects.values_list('notes_count', 'documents_count', 'last_activity_at').get(pk=self.item.pk)
+
+    def test_creates_and_deletes_move_counters(self):
+        self.assertEqual(self.counters(), (0, 0, None))
+        response = self.client.post(f'/api/action-items/{self.item.pk}/notes/', {'content': 'Called the registrar'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(
+            f'/api/action-items/{self.item.pk}/documents/', {'file': ContentFile(b'%PDF-1.4', name='form.pdf')}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 201)
+        notes, documents, first_activity = self.counters()
+        self.assertEqual((notes, documents), (1, 1))
+        self.assertIsNotNone(first_activity)
+
+        ActionItemNote.objects.get().delete()
+        ActionItemDocument.objects.get().delete()
+        notes, documents, last_activity = self.counters()
+        self.assertEqual((notes, documents), (0, 0))
+        self.assertGreater(last_activity, first_activity)
+
+    def test_lists_are_paginated_newest_first(self):
+        now = timezone.now()
+        for age in range(3):
+            note = ActionItemNote.objects.create(action_item=self.item, author=self.owner, content=f'note {age}')
+            document = ActionItemDocument(action_item=self.item, uploaded_by=self.owner, filename=f'doc {age}.pdf')
+            document.file.save(f'doc{age}.pdf', ContentFile(f'doc {age}'.encode()))
+            ActionItemNote.objects.filter(pk=note.pk).update(created_at=now - timedelta(minutes=age))
+            ActionItemDocument.objects.filter(pk=document.pk).update(created_at=now - timedelta(minutes=age))
+
+        for path, key, label in (('notes', 'content', 'note'), ('documents', 'filename', 'doc')):
+            url = f'/api/action-items/{self.item.pk}/{path}/'
+            first = self.client.get(url, {'page_size': 2}).data
+            self.assertEqual(first['count'], 3)
+            self.assertEqual([entry[key].split('.')[0] for entry in first['results']], [f'{label} 0', f'{label} 1'])
+            second = self.client.get(url, {'page_size': 2, 'page': 2}).data
+            self.assertEqual([entry[key].split('.')[0] for entry in second['results']], [f'{label} 2'])
+            self.assertIsNone(second['next'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ChunkedUploadTests(TempMediaRootMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        enterprise = Enterprise.objects.create(owner=cls.owner, name='Acme')
+        cls.item = ActionItem.objects.create(owner=cls.owner, enterprise=enterprise, title='Policy')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.data = bytes(range(256)) * 1000  # 256000 bytes, four 64 KiB chunks
+
+    def start(self):
+        response = self.client.post('/api/uploads/', {
+            'target': 'action_document', 'action_item': self.item.pk, 'filename': 'plan.bin',
+            'size': len(self.data), 'chunk_size': 65536,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put_chunk(self, session_id, index, body):
+        return self.client.put(
+            f'/api/uploads/{session_id}/chunks/{index}/', body, content_type='application/octet-stream',
+        )
+
+    def test_chunks_in_any_order_then_complete(self):
+        session_id = self.start()
+        for index in (3, 1, 0, 2, 1):
+            chunk = self.data[index * 65536:(index + 1) * 65536]
+            self.assertEqual(self.put_chunk(session_id, index, chunk).status_code, 200)
+        self.assertEqual(self.put_chunk(session_id, 0, b'short').status_code, 400)
+
+        checksum = hashlib.sha256(self.data).hexdigest()
+        response = self.client.post(f'/api/uploads/{session_id}/complete/', {'sha256': checksum}, format='json')
+        self.assertEqual(response.status_code, 201)
+        doc = ActionItemDocument.objects.get(pk=response.data['id'])
+        self.assertEqual(doc.file_size, len(self.data))
+        with doc.file.open('rb') as handle:
+            self.assertEqual(handle.read(), self.data)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, UploadSession.STATUS_COMPLETE)
+
+        # A late chunk must not reach the stored blob through the renamed part file
+        self.assertEqual(self.put_chunk(session_id, 0, b'\xff' * 65536).status_code, 409)
+        with doc.file.open('rb') as handle:
+            self.assertEqual(handle.read(), self.data)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'partial')), [])
+
+    def test_incomplete_or_corrupt_uploads_are_rejected_and_swept(self):
+        session_id = self.start()
+        self.put_chunk(session_id, 0, self.data[:65536])
+        checksum = hashlib.sha256(self.data).hexdigest()
+        response = self.client.post(f'/api/uploads/{session_id}/complete/', {'sha256': checksum}, format='json')
+        self.assertEqual(response.status_code, 409)
+        for index in (1, 2, 3):
+            self.put_chunk(session_id, index, b'\0' * len(self.data[index * 65536:(index + 1) * 65536]))
+        response = self.client.post(f'/api/uploads/{session_id}/complete/', {'sha256': checksum}, format='json')
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(ActionItemDocument.objects.exists())
+
+        UploadSession.objects.filter(pk=session_id).update(expires_at=timezone.now())
+        call_command('sweep_uploads', stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ContentAddressedStorageTests(TempMediaRootMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        enterprise = Enterprise.objects.create(owner=cls.owner, name='Acme')
+        cls.item = ActionItem.objects.create(owner=cls.owner, enterprise=enterprise, title='Registration')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, content, name='registration.pdf'):
+        response = self.client.post(
+            f'/api/action-items/{self.item.pk}/documents/', {'file': ContentFile(content, name=name)},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 201)
+        return ActionItemDocument.objects.get(pk=response.data['id'])
+
+    def test_identical_uploads_share_one_blob_until_the_last_is_deleted(self):
+        first, second = self.upload(b'certificate'), self.upload(b'certificate')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.startswith('cas/'))
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(second.file.storage.exists(second.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertFalse(second.file.storage.exists(second.file.name))
+
+    def test_save_rewrites_a_blob_whose_file_is_missing(self):
+        first = self.upload(b'licence')
+        os.remove(first.file.path)
+        second = self.upload(b'licence')
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+        with second.file.open('rb') as handle:
+            self.assertEqual(handle.read(), b'licence')
+
+    def test_chunked_upload_of_stored_content_completes_immediately(self):
+        self.upload(b'statement', name='statement.pdf')
+        response = self.client.post('/api/uploads/', {
+            'target': 'action_document', 'action_item': self.item.pk, 'filename': 'copy.pdf',
+            'size': len(b'statement'), 'sha256': hashlib.sha256(b'statement').hexdigest(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], UploadSession.STATUS_COMPLETE)
+        self.assertEqual(response.data['result']['filename'], 'copy.pdf')
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AvatarThumbnailTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='pic', email='pic@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def photo(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), (200, 30, 30)).save(buffer, 'JPEG', exif=exif.tobytes())
+        return ContentFile(buffer.getvalue(), name='me.jpg')
+
+    def test_upload_queues_thumbnails_served_by_size(self):
+        bad = self.client.post('/api/account/avatar/upload/', {'avatar': ContentFile(b'not an image', name='x.png')}, format='multipart')
+        self.assertEqual(bad.status_code, 400)
+
+        response = self.client.post('/api/account/avatar/upload/', {'avatar': self.photo()}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['thumbnails_pending'])
+        self.assertEqual(AvatarThumbnailJob.objects.get().status, AvatarThumbnailJob.STATUS_PENDING)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_due()['done'], 1)
+        self.user.refresh_from_db()
+        self.assertEqual(sorted(self.user.avatar_thumbnails, key=int), ['32', '64', '256'])
+        with self.user.avatar.open('rb') as handle, Image.open(handle) as cleaned:
+            self.assertEqual(cleaned.size, (1024, 683))
+            self.assertNotIn(0x010F, cleaned.getexif())
+        with self.user.avatar.storage.open(self.user.avatar_thumbnails['64']['webp'], 'rb') as handle, Image.open(handle) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('WEBP', (64, 64)))
+
+        profile = self.client.get('/api/account/profile/').data
+        self.assertTrue(profile['avatar_url'].endswith(self.user.avatar_thumbnails['256']['webp']))
+        self.assertEqual(self.client.get(profile['avatar_urls']['32']['jpeg']).status_code, 200)
+
+    def test_replacing_from_a_stale_cached_user_releases_the_processed_files(self):
+        stale = User.objects.get(pk=self.user.pk)
+        self.client.force_authenticate(stale)
+        self.client.post('/api/account/avatar/upload/', {'avatar': self.photo()}, format='multipart')
+        with self.captureOnCommitCallbacks(execute=True):
+            process_due()
+        self.user.refresh_from_db()
+        processed = [self.user.avatar.name, *(name for formats in self.user.avatar_thumbnails.values() for name in formats.values())]
+
+        # ``stale`` still holds the upload the worker has replaced and released
+        buffer = BytesIO()
+        Image.new('RGB', (300, 300), (30, 30, 200)).save(buffer, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/account/avatar/upload/', {'avatar': ContentFile(buffer.getvalue(), name='new.png')}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(StoredBlob.objects.filter(name__in=processed).exists())
+        self.assertTrue(StoredBlob.objects.filter(name=User.objects.get(pk=self.user.pk).avatar.name).exists())
+
+    def test_oversized_image_is_rejected_before_queueing(self):
+        buffer = BytesIO()
+        Image.new('1', (6000, 5000)).save(buffer, 'PNG')
+        response = self.client.post('/api/account/avatar/upload/', {'avatar': ContentFile(buffer.getvalue(), name='big.png')}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AvatarThumbnailJob.objects.exists())
+
+    def test_failed_attempt_waits_before_retry(self):
+        self.client.post('/api/account/avatar/upload/', {'avatar': self.photo()}, format='multipart')
+        with mock.patch('diagnostic.avatars._process', side_effect=OSError('storage unavailable')):
+            self.assertEqual(process_due()['retrying'], 1)
+            self.assertEqual(process_due(), {'done': 0, 'retrying': 0, 'failed': 0})
+
+        AvatarThumbnailJob.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_due()['done'], 1)
+        self.assertEqual(AvatarThumbnailJob.objects.get().attempts, 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class EvidenceExportTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        self.enterprise = Enterprise.objects.create(owner=self.owner, name='Acme Foods')
+        category = Category.objects.create(name='Finance')
+        question = Question.objects.create(category=category, number='2.1', priority=1, text='Keeps books?', descriptors={})
+        response = QuestionResponse.objects.create(enterprise=self.enterprise, question=question, score=3)
+        attachment = Attachment(response=response)
+        attachment.file.save('ledger.csv', ContentFile(b'date,amount\n' * 5000))
+        item = ActionItem.objects.create(owner=self.owner, enterprise=self.enterprise, title='Open a bank account')
+        for _ in range(2):
+            document = ActionItemDocument(action_item=item, uploaded_by=self.owner, filename='form.pdf')
+            document.file.save('form.pdf', ContentFile(b'%PDF-1.4 form'))
+
+    def test_streams_zip_with_manifest(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.get(f'/api/enterprise/{self.enterprise.pk}/evidence-export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        names = archive.namelist()
+        self.assertEqual(names[-1], 'manifest.csv')
+        self.assertEqual(archive.read(names[0]), b'date,amount\n' * 5000)
+        self.assertEqual(archive.getinfo(names[0]).compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.getinfo(names[1]).compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(len([n for n in names if n.startswith('action_items/')]), 2)
+        manifest = archive.read('manifest.csv').decode('utf-8-sig')
+        self.assertIn('2.1', manifest)
+        self.assertIn('Open a bank account', manifest)
+
+        outsider = User.objects.create_user(username='outsider', email='outsider@example.com', password='pass')
+        client.force_authenticate(outsider)
+        self.assertEqual(client.get(f'/api/enterprise/{self.enterprise.pk}/evidence-export/').status_code, 403)
+
+    def test_missing_files_are_listed_in_the_manifest(self):
+        document = ActionItemDocument.objects.first()
+        os.remove(document.file.path)
+        archive = zipfile.ZipFile(BytesIO(b''.join(iter_evidence_zip(self.enterprise))))
+        self.assertFalse([n for n in archive.namelist() if n.startswith('action_items/')])
+        rows = list(csv.DictReader(archive.read('manifest.csv').decode('utf-8-sig').splitlines()))
+        self.assertEqual([(row['missing'], row['size']) for row in rows], [('', '60000'), ('yes', ''), ('yes', '')])
+
+
+class GcMediaTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        item = ActionItem.objects.create(owner=owner, title='Registration')
+        self.document = ActionItemDocument(action_item=item, uploaded_by=owner, filename='kept.pdf')
+        self.document.file.save('kept.pdf', ContentFile(b'kept'))
+        owner.avatar_thumbnails = {'64': {'webp': 'avatars/1_64.webp'}}
+        owner.save(update_fields=['avatar_thumbnails'])
+
+        storage = self.document.file.storage
+        self.orphan_blob = storage.save('dropped.pdf', ContentFile(b'dropped'))
+        self.files = [self.document.file.name, self.orphan_blob, 'avatars/1_64.webp', 'attachments/legacy.pdf', 'uploads/partial/x.part']
+        # Files from before content-addressed storage, written straight to disk
+        for name in self.files[2:]:
+            os.makedirs(os.path.dirname(storage.path(name)), exist_ok=True)
+            with open(storage.path(name), 'wb') as handle:
+                handle.write(b'legacy')
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', '--min-age-hours=0', *args, stdout=out)
+        return out.getvalue()
+
+    def exists(self, name):
+        return self.document.file.storage.exists(name)
+
+    def test_reports_then_deletes_only_unreferenced_files(self):
+        self.assertIn('2 orphaned file(s) (13 bytes) would be reclaimed', self.gc())
+        self.assertTrue(all(self.exists(name) for name in self.files))
+
+        self.assertIn('Deleted 2 orphaned file(s), reclaiming 13 bytes', self.gc('--delete'))
+        self.assertFalse(self.exists(self.orphan_blob))
+        self.assertFalse(self.exists('attachments/legacy.pdf'))
+        self.assertFalse(StoredBlob.objects.filter(name=self.orphan_blob).exists())
+        for name in (self.document.file.name, 'avatars/1_64.webp', 'uploads/partial/x.part'):
+            self.assertTrue(self.exists(name))
+
+    def test_untracked_blobs_are_removed_without_leaving_rows(self):
+        StoredBlob.objects.filter(name=self.orphan_blob).delete()
+        self.assertIn('Deleted 2 orphaned file(s)', self.gc('--delete'))
+        self.assertFalse(self.exists(self.orphan_blob))
+        self.assertEqual(list(StoredBlob.objects.values_list('name', flat=True)), [self.document.file.name])
+
+    def test_recently_referenced_blob_is_kept_until_its_row_commits(self):
+        # An older file storage has just handed out again; the row that will
+        # refer to it is not committed yet
+        storage = self.document.file.storage
+        old = time.time() - 2 * 3600
+        os.utime(storage.path(self.orphan_blob), (old, old))
+        os.utime(storage.path('attachments/legacy.pdf'), (old, old))
+        storage.add_reference(self.orphan_blob)
+
+        out = StringIO()
+        call_command('gc_media', '--min-age-hours=1', '--delete', stdout=out)
+        self.assertIn('Deleted 1 orphaned file(s)', out.getvalue())
+        self.assertTrue(self.exists(self.orphan_blob))
+
+        StoredBlob.objects.filter(name=self.orphan_blob).update(updated_at=timezone.now() - timedelta(hours=2))
+        self.assertIn('Deleted 1 orphaned file(s)', self.gc('--delete'))
+        self.assertFalse(self.exists(self.orphan_blob))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class EnterpriseReportDocumentTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        self.enterprise = Enterprise.objects.create(owner=self.owner, name='Acme Foods')
+        category = Category.objects.create(name='Finance')
+        question = Question.objects.create(
+            category=category, number='2-1', priority=1, text='Do you keep books?',
+            descriptors={'1': 'Receipts in a box', '2': 'Spreadsheet updated monthly'},
+        )
+        QuestionResponse.objects.create(enterprise=self.enterprise, question=question, score=1)
+        self.item = ActionItem.objects.create(owner=self.owner, enterprise=self.enterprise, title='Hire a bookkeeper')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.url = f'/api/enterprise/{self.enterprise.pk}/report/pdf/'
+
+    def render(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return render_due_reports()
+
+    def test_renders_once_per_summary_version(self):
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+        self.assertEqual(self.render()['done'], 1)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        pdf = b''.join(self.client.get(response.data['url']).streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        html = self.client.get(f'/api/enterprise/{self.enterprise.pk}/report/html/').data['url']
+        page = b''.join(self.client.get(html).streaming_content).decode()
+        self.assertIn('Receipts in a box', page)
+        self.assertIn('Spreadsheet updated monthly', page)
+        self.assertIn('Hire a bookkeeper', page)
+        self.assertEqual(self.render()['done'], 0)
+
+        self.item.status = ActionItem.STATUS_COMPLETED
+        self.item.save()
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+        self.assertEqual(self.render()['done'], 1)
+        self.assertEqual(list(EnterpriseReport.objects.values_list('version', flat=True)), [response.data['version'] + 1])
+
+    def test_bulk_update_renders_a_new_version(self):
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+        self.assertEqual(self.render()['done'], 1)
+        version = self.client.get(self.url).data['version']
+
+        response = self.client.post('/api/action-items/bulk/', {'operations': [
+            {'op': 'update', 'id': self.item.pk, 'data': {'title': 'Hire an accountant'}},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['version'], version + 1)
+
+    def test_renaming_or_linking_assignees_renders_a_new_version(self):
+        version = self.client.get(self.url).data['version']
+        self.enterprise.name = 'Acme Foods Ltd'
+        self.enterprise.save()
+        self.assertEqual(self.client.get(self.url).data['version'], version + 1)
+
+        helper = User.objects.create_user(username='helper', email='helper@example.com', password='pass')
+        ActionItem.objects.filter(pk=self.item.pk).update(assigned_to='helper@example.com')
+        self.assertEqual(link_legacy_assignments(self.enterprise.pk, 'helper@example.com', helper), 1)
+        self.assertEqual(self.client.get(self.url).data['version'], version + 2)
+
+    def test_failed_report_is_queued_again_after_cooldown(self):
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+        report = EnterpriseReport.objects.get()
+        EnterpriseReport.objects.filter(pk=report.pk).update(
+            status=EnterpriseReport.STATUS_FAILED, attempts=3, updated_at=timezone.now(),
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        EnterpriseReport.objects.filter(pk=report.pk).update(updated_at=timezone.now() - timedelta(minutes=11))
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+        report.refresh_from_db()
+        self.assertEqual((report.status, report.attempts), (EnterpriseReport.STATUS_PENDING, 0))
+        self.assertEqual(self.render()['done'], 1)
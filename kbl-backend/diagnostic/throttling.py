@@ -0,0 +1,157 @@
+"""
+Rate limiting and CPU protection for the password-hashing endpoints.
+
+Two independent guards:
+
+* Scoped DRF throttles (sliding window) for login, registration, password
+  change/reset and invitation acceptance. They store their history in the
+  ``throttle`` cache alias, a database cache, so every gunicorn worker sees
+  the same counts.
+* ``limit_password_hashing``, a concurrency cap on the handlers that run
+  PBKDF2. Each worker admits ``PASSWORD_HASHING_MAX_CONCURRENCY_PER_WORKER``
+  requests at a time, and across workers at most
+  ``PASSWORD_HASHING_MAX_CONCURRENCY`` may hash at once (Postgres advisory
+  locks), so a burst of logins cannot occupy every worker. Requests that
+  cannot get a slot within ``PASSWORD_HASHING_WAIT_SECONDS`` receive a 429.
+
+Counters for both are kept per worker and exposed through ``metrics_snapshot``.
+"""
+import functools
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle, SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+# First key of the two-int advisory lock namespace ("KBL")
+HASHING_LOCK_NAMESPACE = 0x4B424C
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'throttled': {},
+    'hashing_acquired': 0,
+    'hashing_rejected': 0,
+    'hashing_in_flight': 0,
+}
+
+
+def _record(key, scope=None, delta=1):
+    with _metrics_lock:
+        if scope is not None:
+            _metrics[key][scope] = _metrics[key].get(scope, 0) + delta
+        else:
+            _metrics[key] += delta
+
+
+def metrics_snapshot():
+    """Return a copy of this worker's throttling counters."""
+    with _metrics_lock:
+        return {**_metrics, 'throttled': dict(_metrics['throttled'])}
+
+
+def _throttle_cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+
+class AuthScopedRateThrottle(ScopedRateThrottle):
+    """ScopedRateThrottle backed by the shared throttle cache, with metrics."""
+
+    def __init__(self):
+        self.cache = _throttle_cache()
+        super().__init__()
+
+    def throttle_failure(self):
+        _record('throttled', self.scope)
+        return False
+
+
+class LoginEmailRateThrottle(SimpleRateThrottle):
+    """Limit attempts against one account, whichever addresses they come from."""
+
+    scope = 'auth_login_email'
+
+    def __init__(self):
+        self.cache = _throttle_cache()
+        super().__init__()
+
+    def get_cache_key(self, request, view):
+        email = (request.data.get('email') or '').strip().lower()
+        if not email:
+            return None
+        ident = hashlib.sha256(email.encode('utf-8')).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def throttle_failure(self):
+        _record('throttled', self.scope)
+        return False
+
+
+_worker_slots = threading.BoundedSemaphore(
+    max(1, getattr(settings, 'PASSWORD_HASHING_MAX_CONCURRENCY_PER_WORKER', 1))
+)
+
+
+def _try_global_slot():
+    """Take one of the host-wide hashing slots; return its number or None."""
+    with connection.cursor() as cursor:
+        for slot in range(max(1, getattr(settings, 'PASSWORD_HASHING_MAX_CONCURRENCY', 2))):
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [HASHING_LOCK_NAMESPACE, slot])
+            if cursor.fetchone()[0]:
+                return slot
+    return None
+
+
+def _release_global_slot(slot):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [HASHING_LOCK_NAMESPACE, slot])
+    except Exception as e:
+        # The lock is session-scoped; closing the connection releases it anyway
+        logger.warning(f"Could not release password hashing slot {slot}: {str(e)}")
+
+
+def _busy_response(wait):
+    _record('hashing_rejected')
+    response = Response(
+        {'detail': 'The server is busy processing other sign-ins. Please try again shortly.'},
+        status=429,
+    )
+    response['Retry-After'] = str(max(1, int(wait)))
+    return response
+
+
+def limit_password_hashing(handler):
+    """Decorate a view method that hashes passwords with the concurrency cap."""
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        wait = getattr(settings, 'PASSWORD_HASHING_WAIT_SECONDS', 2.0)
+        deadline = time.monotonic() + wait
+        if not _worker_slots.acquire(timeout=wait):
+            return _busy_response(wait)
+        try:
+            slot = _try_global_slot()
+            while slot is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+                slot = _try_global_slot()
+            if slot is None:
+                return _busy_response(wait)
+
+            _record('hashing_acquired')
+            _record('hashing_in_flight')
+            try:
+                return handler(view, request, *args, **kwargs)
+            finally:
+                _record('hashing_in_flight', delta=-1)
+                _release_global_slot(slot)
+        finally:
+            _worker_slots.release()
+
+    return wrapper
@@ -0,0 +1,275 @@
+"""
+Resumable chunked uploads for evidence attachments and action documents.
+
+A client creates an ``UploadSession`` with the file's size (and optionally its
+SHA-256), PUTs numbered chunks in any order, retrying only the ones that
+failed, and then completes the session. Each chunk is copied from the request
+stream to a spool file and then, under the session's row lock, into its slot
+of a part file under ``MEDIA_ROOT/uploads/partial/``, in small blocks, so no
+chunk, let alone the whole file, is buffered in memory.
+Completing hashes the part file, checks it against the expected checksum and
+renames it into place as the new Attachment/ActionItemDocument file, so
+completing copies nothing.
+
+Files are stored content-addressed (diagnostic.storage). A session created
+with a SHA-256 that is already stored completes at once, without any chunks,
+provided the user can already read a file with that content; a bare checksum
+is not proof of having the file.
+
+Open sessions expire ``UPLOAD_SESSION_TTL`` seconds after their last chunk;
+``sweep_uploads`` deletes them together with their part files.
+"""
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ActionItemDocument, Attachment, StoredBlob, UploadSession
+from .storage import blob_name
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 5 * 1024 * 1024
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A request the upload protocol rejects; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, detail, status=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+
+
+class _PartFile(File):
+    # FileSystemStorage moves files that expose temporary_file_path instead of copying them
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def session_ttl():
+    return timedelta(seconds=getattr(settings, 'UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+
+def partial_dir():
+    return os.path.join(str(settings.MEDIA_ROOT), 'uploads', 'partial')
+
+
+def part_path(session):
+    return os.path.join(partial_dir(), f'{session.pk}.part')
+
+
+def create_session(user, target, filename, size, chunk_size=None, **fields):
+    """
+    Validate the declared file and open a session for it.
+
+    Returns ``(session, created)``; ``created`` is the new attachment or
+    document when the content was already stored and the session completed
+    immediately, else None.
+    """
+    filename = os.path.basename(str(filename or '').replace('\\', '/')).strip()
+    if not filename:
+        raise UploadError('filename is required')
+    try:
+        size = int(size)
+        chunk_size = int(chunk_size or DEFAULT_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        raise UploadError('size and chunk_size must be integers')
+    if size <= 0:
+        raise UploadError('size must be positive')
+    if size > MAX_UPLOAD_SIZE:
+        raise UploadError('File size exceeds 10MB limit')
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError(f'chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes')
+    sha256 = (fields.pop('sha256', '') or '').lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise UploadError('sha256 must be a hex digest')
+    with transaction.atomic():
+        session = UploadSession.objects.create(
+            user=user,
+            target=target,
+            filename=filename[:255],
+            size=size,
+            chunk_size=chunk_size,
+            sha256=sha256,
+            expires_at=timezone.now() + session_ttl(),
+            **fields,
+        )
+        created = _complete_from_stored(session) if sha256 else None
+    return session, created
+
+
+def _create_target(session, file):
+    if session.target == UploadSession.TARGET_ATTACHMENT:
+        return Attachment.objects.create(response=session.response, file=file)
+    return ActionItemDocument.objects.create(
+        action_item=session.action_item,
+        uploaded_by=session.user,
+        file=file,
+        filename=session.filename,
+        file_type=session.content_type,
+        file_size=session.size,
+        description=session.description,
+    )
+
+
+def _complete_from_stored(session):
+    """Point the target at an already stored blob with the declared checksum and size."""
+    from .media import user_can_access
+
+    name = blob_name(session.sha256, session.filename)
+    blob = StoredBlob.objects.select_for_update().filter(name=name, size=session.size).first()
+    if blob is None or not default_storage.exists(name) or not user_can_access(session.user, name):
+        return None
+    default_storage.add_reference(name)
+    created = _create_target(session, name)
+    session.status = UploadSession.STATUS_COMPLETE
+    session.received_chunks = list(range(session.chunk_count))
+    session.save(update_fields=['status', 'received_chunks', 'updated_at'])
+    return created
+
+
+def _check_open(session):
+    if session.status != UploadSession.STATUS_OPEN:
+        raise UploadError('Upload session is already complete', status=409)
+    if session.expires_at <= timezone.now():
+        raise UploadError('Upload session has expired', status=410)
+
+
+def chunk_length(session, index):
+    if not 0 <= index < session.chunk_count:
+        raise UploadError(f'Chunk index must be between 0 and {session.chunk_count - 1}')
+    return min(session.chunk_size, session.size - index * session.chunk_size)
+
+
+def write_chunk(session, index, stream, content_length, expected_sha256=None):
+    """
+    Copy one chunk from ``stream`` into the part file and record it.
+
+    Re-sending a chunk overwrites its slot, so retrying after a dropped
+    connection is always safe.
+    """
+    _check_open(session)
+    length = chunk_length(session, index)
+    try:
+        content_length = int(content_length)
+    except (TypeError, ValueError):
+        raise UploadError('Content-Length is required', status=411)
+    if content_length != length:
+        raise UploadError(f'Chunk {index} must be exactly {length} bytes')
+
+    # Spool the chunk first: the part file is only opened under the session
+    # lock, so no writer can still hold it once complete_session renames it
+    # into content-addressed storage. Spools a crash leaves behind are .part
+    # files without a session and go with sweep_uploads' orphans.
+    os.makedirs(partial_dir(), exist_ok=True)
+    digest = hashlib.sha256()
+    fd, spooled = tempfile.mkstemp(dir=partial_dir(), prefix=f'{session.pk}-{index}-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'w+b') as spool:
+            remaining = length
+            while remaining:
+                block = stream.read(min(COPY_BLOCK_SIZE, remaining))
+                if not block:
+                    raise UploadError(f'Chunk {index} ended after {length - remaining} of {length} bytes')
+                spool.write(block)
+                digest.update(block)
+                remaining -= len(block)
+            if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+                raise UploadError(f'Chunk {index} checksum mismatch')
+
+            spool.seek(0)
+            with transaction.atomic():
+                locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+                _check_open(locked)
+                part = os.open(part_path(session), os.O_RDWR | os.O_CREAT, 0o640)
+                try:
+                    os.lseek(part, index * session.chunk_size, os.SEEK_SET)
+                    for block in iter(lambda: spool.read(COPY_BLOCK_SIZE), b''):
+                        os.write(part, block)
+                finally:
+                    os.close(part)
+                if index not in locked.received_chunks:
+                    locked.received_chunks = sorted(locked.received_chunks + [index])
+                locked.expires_at = timezone.now() + session_ttl()
+                locked.save(update_fields=['received_chunks', 'expires_at', 'updated_at'])
+    finally:
+        os.remove(spooled)
+    return locked
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(COPY_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_session(session, sha256=None):
+    """
+    Verify the assembled file and turn it into the session's target record.
+
+    Returns the new Attachment or ActionItemDocument.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        _check_open(session)
+        missing = sorted(set(range(session.chunk_count)) - set(session.received_chunks))
+        if missing:
+            raise UploadError(f'{len(missing)} chunk(s) missing, first is {missing[0]}', status=409)
+        expected = (sha256 or session.sha256 or '').lower()
+        if not expected:
+            raise UploadError('sha256 of the whole file is required')
+
+        path = part_path(session)
+        try:
+            actual_size = os.path.getsize(path)
+        except OSError:
+            raise UploadError('Uploaded data is missing, start a new upload', status=410)
+        if actual_size != session.size:
+            raise UploadError(f'Assembled file is {actual_size} bytes, expected {session.size}', status=409)
+        if file_sha256(path) != expected:
+            raise UploadError('Checksum mismatch, re-upload the file', status=422)
+
+        with open(path, 'rb') as handle:
+            part = _PartFile(handle, name=session.filename)
+            part.sha256 = expected
+            created = _create_target(session, part)
+        if os.path.exists(path):
+            # Content was already stored, so storage kept the existing copy
+            os.remove(path)
+        session.status = UploadSession.STATUS_COMPLETE
+        session.save(update_fields=['status', 'updated_at'])
+    return created
+
+
+def discard_session(session):
+    """Delete a session and whatever part of its file has arrived."""
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def session_data(session):
+    return {
+        'id': str(session.pk),
+        'target': session.target,
+        'filename': session.filename,
+        'size': session.size,
+        'chunk_size': session.chunk_size,
+        'chunk_count': session.chunk_count,
+        'received_chunks': session.received_chunks,
+        'status': session.status,
+        'expires_at': session.expires_at.isoformat(),
+    }
@@ -14,6 +14,7 @@ from .views import (
     MyEnterprisesSummariesView,
     RecomputeAllSummariesView,
     EnterpriseReportView,
+    EnterpriseReportDocumentView,
     LogoutView,
     MyAssessmentStatsView,
     MyAssessmentSessionsView,
@@ -41,9 +42,14 @@ from .views import (
     ActionItemUpdateProgressView,
     ActionItemAddNoteView,
     ActionItemUploadDocumentView,
+    UploadSessionCreateView,
+    UploadSessionDetailView,
+    UploadChunkView,
+    UploadCompleteView,
     EnterpriseActionItemsView,
     AssignActionItemView,
     EnterpriseTeamMembersView,
+    EnterpriseEvidenceExportView,
 )
 
 router = DefaultRouter()
@@ -94,6 +100,7 @@ urlpatterns = [
     path('my/enterprises-summaries/', MyEnterprisesSummariesView.as_view()),
     path('recompute/all/', RecomputeAllSummariesView.as_view()),
     path('enterprise/<int:pk>/report/', EnterpriseReportView.as_view()),
+    path('enterprise/<int:pk>/report/<str:fmt>/', EnterpriseReportDocumentView.as_view(), name='enterprise-report-document'),
     
     # Assessment sessions endpoints
     path('assessment-sessions/<int:pk>/', AssessmentSessionDeleteView.as_view(), name='api-assessment-session-delete'),
@@ -107,7 +114,13 @@ urlpatterns = [
     path('action-items/<int:pk>/progress/', ActionItemUpdateProgressView.as_view(), name='action-item-progress'),
     path('action-items/<int:pk>/notes/', ActionItemAddNoteView.as_view(), name='action-item-add-note'),
     path('action-items/<int:pk>/documents/', ActionItemUploadDocumentView.as_view(), name='action-item-upload-doc'),
+    # Resumable chunked uploads (evidence attachments and action documents)
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('uploads/<uuid:pk>/', UploadSessionDetailView.as_view(), name='upload-session-detail'),
+    path('uploads/<uuid:pk>/chunks/<int:index>/', UploadChunkView.as_view(), name='upload-chunk'),
+    path('uploads/<uuid:pk>/complete/', UploadCompleteView.as_view(), name='upload-complete'),
     path('action-items/<int:pk>/assign/', AssignActionItemView.as_view(), name='action-item-assign'),
     path('enterprise/<int:enterprise_id>/action-items/', EnterpriseActionItemsView.as_view(), name='enterprise-action-items'),
     path('enterprise/<int:enterprise_id>/team-members/', EnterpriseTeamMembersView.as_view(), name='enterprise-team-members'),
+    path('enterprise/<int:enterprise_id>/evidence-export/', EnterpriseEvidenceExportView.as_view(), name='enterprise-evidence-export'),
 ]
\ No newline at end of file
@@ -4,6 +4,7 @@ import logging
 import os
 import re
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
@@ -17,9 +18,13 @@ from django.conf import settings
 from django.urls import reverse
 
 # Email utilities
-from .utils.email import send_team_invitation_email
+from .utils.email import send_team_invitation_email, compute_frontend_url, queue_team_invitation_emails
+from .outbox import dedupe_key, enqueue_once
+from .media import signed_media_url
+from .reports import bump_report_version
+from .throttling import AuthScopedRateThrottle, LoginEmailRateThrottle, limit_password_hashing
 
-from .models import Category, Question, Enterprise, QuestionResponse, ScoreSummary, Attachment, EmailOTP, PhoneOTP, ActionItem, TeamMember
+from .models import Category, Question, Enterprise, QuestionResponse, ScoreSummary, Attachment, EmailOTP, ActionItem, TeamMember
 
 # Utility function to check if user is a team member (not an owner)
 def is_team_member_only(user):
@@ -64,7 +69,13 @@ class NotificationPreferenceSerializer(serializers.ModelSerializer):
         model = NotificationPreference
         fields = ['email_notifications', 'push_notifications', 'weekly_reports', 'marketing_communications']
         read_only_fields = ['user']
-from .services import recompute_and_store_summary, compute_public_base_url, send_verification_email
+from .services import (
+    recompute_and_store_summary,
+    compute_public_base_url,
+    send_verification_email,
+    link_legacy_assignments,
+    resolve_assignee,
+)
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 
 
@@ -262,25 +273,12 @@ class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
             attrs[self.username_field] = email
         # Block login until email verified
         data = super().validate(attrs)
-        User = get_user_model()
-        try:
-            user = User.objects.get(email__iexact=email)
-        except User.DoesNotExist:
-            return data
-        from .models import EmailOTP
-        has_email_verified = EmailOTP.objects.filter(user=user, is_verified=True).exists()
-        if not has_email_verified:
-            # Re-send verification link only if a recent unverified OTP doesn't already exist
+        user = self.user
+        if not user.is_email_verified:
+            # Re-send the verification link; repeated logins within the dedupe window queue it once
             try:
-                now = timezone.now()
-                recent = EmailOTP.objects.filter(user=user, is_verified=False, expires_at__gte=now).order_by('-created_at').first()
-                # Throttle re-sends: if an OTP exists and was created within last 2 minutes, skip sending another
-                should_send = True
-                if recent and (now - recent.created_at).total_seconds() < 120:
-                    should_send = False
-                if should_send:
-                    base = compute_public_base_url(self.context['request'])
-                    send_verification_email(self.context['request'], user, base)
+                base = compute_public_base_url(self.context['request'])
+                send_verification_email(self.context['request'], user, base)
             except Exception:
                 pass
             raise serializers.ValidationError({'detail': 'Please verify your email. We have re-sent the verification link to your inbox.'})
@@ -289,6 +287,12 @@ class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 class EmailTokenObtainPairView(TokenObtainPairView):
     serializer_class = EmailTokenObtainPairSerializer
+    throttle_classes = [AuthScopedRateThrottle, LoginEmailRateThrottle]
+    throttle_scope = 'auth_login'
+
+    @limit_password_hashing
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
 
 
 class QuestionResponseViewSet(viewsets.ModelViewSet):
@@ -357,10 +361,28 @@ class ActionItemViewSet(viewsets.ModelViewSet):
             .aggregate(models.Max('order'))
             .get('order__max') or 0
         )
-        serializer.save(owner=self.request.user, enterprise=enterprise, order=max_order + 1)
+        extra = {}
+        if not serializer.validated_data.get('assigned_to_user'):
+            assignee = resolve_assignee(enterprise, serializer.validated_data.get('assigned_to', ''))
+            if assignee is not None:
+                extra['assigned_to_user'] = assignee
+        serializer.save(owner=self.request.user, enterprise=enterprise, order=max_order + 1, **extra)
+
+    def perform_update(self, serializer):
+        extra = {}
+        if 'assigned_to' in serializer.validated_data and 'assigned_to_user' not in serializer.validated_data:
+            enterprise = serializer.validated_data.get('enterprise') or serializer.instance.enterprise
+            extra['assigned_to_user'] = resolve_assignee(enterprise, serializer.validated_data['assigned_to'])
+        serializer.save(**extra)
 
     @action(detail=False, methods=['get'])
     def board(self, request):
+        if request.query_params.get('assemble') == 'db':
+            # Build the whole payload in Postgres and stream it through
+            from django.http import StreamingHttpResponse
+            from .payloads import iter_board_json
+            return StreamingHttpResponse(iter_board_json(request.user.id), content_type='application/json')
+
         items = ActionItem.objects.filter(owner=request.user).select_related('assigned_to_user').order_by('status', 'order', 'id')
         def to_card(it: ActionItem):
             # Get user display from assigned_to_user or legacy assigned_to field
@@ -438,28 +460,211 @@ class ActionItemViewSet(viewsets.ModelViewSet):
                 it.save(update_fields=['status', 'order', 'updated_at'])
         return Response({'detail': 'Updated'})
 
+    BULK_MAX_OPERATIONS = 500
+    BULK_EDITABLE_FIELDS = ('title', 'description', 'source', 'priority', 'due_date', 'status', 'progress_percentage')
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    @transaction.atomic
+    def bulk(self, request):
+        """Apply a batch of operations in one transaction.
+        Items are loaded and locked in that transaction, so a concurrent
+        request cannot change them between validation and the write.
+        Payload: { operations: [ {op: create, data: {...}},
+                                 {op: update, id, data: {...}},
+                                 {op: assign, id, user_id},
+                                 {op: complete, id},
+                                 {op: delete, id}, ... ] }
+        Nothing is written unless every operation is valid.
+        """
+        payload = request.data if isinstance(request.data, dict) else {}
+        operations = payload.get('operations')
+        if not isinstance(operations, list):
+            return Response({'detail': 'operations must be a list'}, status=400)
+        if len(operations) > self.BULK_MAX_OPERATIONS:
+            return Response({'detail': f'At most {self.BULK_MAX_OPERATIONS} operations per request'}, status=400)
+
+        user = request.user
+        User = get_user_model()
+
+        def as_int(value):
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return None
+
+        # Permissions are resolved once per enterprise, not per operation
+        owned_enterprise_ids = set(Enterprise.objects.filter(owner=user).values_list('id', flat=True))
+        member_roles = dict(
+            TeamMember.objects
+            .filter(user=user, status=TeamMember.STATUS_ACTIVE)
+            .values_list('enterprise_id', 'role')
+        )
+
+        # Load and lock everything the operations refer to up front, in id
+        # order so overlapping batches cannot deadlock. Only items the caller
+        # can see are loaded; any other id is reported as not found
+        item_ids = {as_int(op.get('id')) for op in operations if isinstance(op, dict) and op.get('op') != 'create'}
+        items = {
+            it.id: it
+            for it in ActionItem.objects.select_for_update().filter(id__in=item_ids - {None}).filter(
+                models.Q(owner=user) | models.Q(assigned_to_user=user) | models.Q(enterprise_id__in=list(member_roles))
+            ).order_by('id')
+        }
+        assignee_ids = {as_int(op.get('user_id')) for op in operations if isinstance(op, dict) and op.get('op') == 'assign'}
+        assignees = {u.id: u for u in User.objects.filter(id__in=assignee_ids - {None})}
+        next_order = {
+            row['status']: row['order__max'] or 0
+            for row in ActionItem.objects.filter(owner=user).values('status').annotate(models.Max('order'))
+        }
+
+        def can_edit(it):
+            return it.owner_id == user.id
+
+        def can_assign(it):
+            return can_edit(it) or member_roles.get(it.enterprise_id) in {TeamMember.ROLE_ADMIN, TeamMember.ROLE_MANAGER}
+
+        def can_progress(it):
+            return can_edit(it) or it.assigned_to_user_id == user.id or it.enterprise_id in member_roles
+
+        def validated_fields(data, partial):
+            data = data if isinstance(data, dict) else {}
+            serializer = ActionItemSerializer(
+                data={k: v for k, v in data.items() if k in self.BULK_EDITABLE_FIELDS},
+                partial=partial,
+            )
+            if not serializer.is_valid():
+                return None, serializer.errors
+            return serializer.validated_data, None
+
+        results = []
+        to_create = []
+        to_update = {}
+        update_fields = {'updated_at'}
+        to_delete = set()
+        for index, op in enumerate(operations):
+            kind = op.get('op') if isinstance(op, dict) else None
+            result = {'index': index, 'op': kind}
+            results.append(result)
+
+            if kind == 'create':
+                fields, errors = validated_fields(op.get('data'), partial=False)
+                enterprise_id = as_int((op.get('data') or {}).get('enterprise')) if isinstance(op.get('data'), dict) else None
+                if errors:
+                    result['errors'] = errors
+                elif not owned_enterprise_ids:
+                    result['errors'] = {'enterprise': 'Please create your enterprise profile first.'}
+                elif enterprise_id and enterprise_id not in owned_enterprise_ids:
+                    result['errors'] = {'enterprise': 'Not permitted'}
+                else:
+                    status_val = fields.pop('status', ActionItem.STATUS_TODO)
+                    next_order[status_val] = next_order.get(status_val, 0) + 1
+                    it = ActionItem(
+                        owner=user,
+                        enterprise_id=enterprise_id or min(owned_enterprise_ids),
+                        order=next_order[status_val],
+                        **fields,
+                    )
+                    it.set_status(status_val, user)
+                    to_create.append((result, it))
+                continue
+
+            if kind not in {'update', 'assign', 'complete', 'delete'}:
+                result['errors'] = {'op': 'Unknown operation'}
+                continue
+            it = items.get(as_int(op.get('id')))
+            if it is None or it.id in to_delete:
+                result['errors'] = {'id': 'Action item not found'}
+                continue
+            result['id'] = it.id
+
+            if kind == 'update':
+                fields, errors = validated_fields(op.get('data'), partial=True)
+                if errors:
+                    result['errors'] = errors
+                    continue
+                if not can_edit(it):
+                    result['errors'] = {'detail': 'Permission denied'}
+                    continue
+                status_val = fields.pop('status', None)
+                for name, value in fields.items():
+                    setattr(it, name, value)
+                update_fields.update(fields)
+                if status_val:
+                    it.set_status(status_val, user)
+                    update_fields.update({'status', 'completed_at', 'completed_by', 'progress_percentage'})
+            elif kind == 'assign':
+                if not can_assign(it):
+                    result['errors'] = {'detail': 'Permission denied'}
+                    continue
+                user_id = op.get('user_id')
+                if not user_id:
+                    it.assigned_to_user = None
+                    it.assigned_to = ''
+                elif as_int(user_id) in assignees:
+                    it.assigned_to_user = assignees[as_int(user_id)]
+                    it.assigned_to = it.assigned_to_user.email
+                else:
+                    result['errors'] = {'user_id': 'User not found'}
+                    continue
+                update_fields.update({'assigned_to_user', 'assigned_to'})
+            elif kind == 'complete':
+                if not can_progress(it):
+                    result['errors'] = {'detail': 'Permission denied'}
+                    continue
+                it.set_status(ActionItem.STATUS_COMPLETED, user)
+                update_fields.update({'status', 'completed_at', 'completed_by', 'progress_percentage'})
+            else:
+                if not can_edit(it):
+                    result['errors'] = {'detail': 'Permission denied'}
+                    continue
+                to_delete.add(it.id)
+                to_update.pop(it.id, None)
+                continue
+            to_update[it.id] = it
+
+        if any('errors' in r for r in results):
+            for r in results:
+                r['status'] = 'error' if 'errors' in r else 'skipped'
+            return Response({'detail': 'No changes were applied', 'results': results}, status=400)
+
+        now = timezone.now()
+        for it in to_update.values():
+            it.updated_at = now
+        ActionItem.objects.bulk_create([it for _, it in to_create])
+        if to_update:
+            ActionItem.objects.bulk_update(list(to_update.values()), sorted(update_fields))
+        if to_delete:
+            ActionItem.objects.filter(id__in=to_delete).delete()
+        # bulk_create and bulk_update skip the signals that invalidate cached reports
+        bump_report_version(
+            [it.enterprise_id for _, it in to_create] + [it.enterprise_id for it in to_update.values()]
+        )
+
+        for result, it in to_create:
+            result['id'] = it.id
+        for r in results:
+            r['status'] = 'ok'
+        return Response({
+            'created': len(to_create),
+            'updated': len(to_update),
+            'deleted': len(to_delete),
+            'results': results,
+        })
+
 
 class TeamMemberViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = TeamMemberSerializer
+    # Only the accept action carries AuthScopedRateThrottle
+    throttle_scope = 'invitation_accept'
 
     def get_queryset(self):
-        from django.db import connection, ProgrammingError
+        from django.db import ProgrammingError
+        from . import capabilities
         logger = logging.getLogger(__name__)
         
-        # Check if team_members table exists first
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'team_members'
-                """)
-                table_exists = cursor.fetchone() is not None
-        except Exception as e:
-            logger.warning(f"Could not check if team_members table exists: {str(e)}")
-            table_exists = False
+        # Check if team_members table exists first (probed once per worker)
+        table_exists = capabilities.has_table(TeamMember._meta.db_table)
         
         if not table_exists:
             logger.warning("team_members table does not exist. Please run migrations: python manage.py migrate")
@@ -468,7 +673,7 @@ class TeamMemberViewSet(viewsets.ModelViewSet):
         
         try:
             enterprises = Enterprise.objects.filter(owner=self.request.user)
-            return TeamMember.objects.filter(enterprise__in=enterprises).select_related('enterprise').order_by('created_at')
+            return TeamMember.objects.filter(enterprise__in=enterprises).select_related('enterprise', 'user').order_by('created_at')
         except ProgrammingError as e:
             if 'team_members' in str(e):
                 logger.error("team_members table does not exist. Please run migrations: python manage.py migrate")
@@ -525,158 +730,281 @@ class TeamMemberViewSet(viewsets.ModelViewSet):
         
         # Send invitation email
         try:
-            # Get frontend URL from environment or construct from request
-            frontend_url = os.environ.get('FRONTEND_URL') or os.environ.get('NEXT_PUBLIC_API_URL', '').replace('/api', '')
-            if not frontend_url or 'localhost' in frontend_url:
-                # Try to get from request headers
-                proto = request.META.get('HTTP_X_FORWARDED_PROTO') or ('https' if request.is_secure() else 'http')
-                host = request.META.get('HTTP_X_FORWARDED_HOST') or request.META.get('HTTP_HOST') or request.get_host()
-                # If host is backend, try to construct frontend URL
-                if 'business-diagnostic-tool.onrender.com' in host:
-                    frontend_url = 'https://kigali-business-lab-business-diagnostic.onrender.com'
-                elif 'localhost' in host or '127.0.0.1' in host:
-                    frontend_url = 'http://localhost:3000'
-                else:
-                    frontend_url = f"{proto}://{host}".replace('/api', '')
-            
-            # Remove trailing slash and /api if present
-            frontend_url = frontend_url.rstrip('/').replace('/api', '')
+            frontend_url = compute_frontend_url(self.request)
             accept_url = f"{frontend_url}/accept-invitation?token={token}"
             
             send_team_invitation_email(
                 inviter_name=self.request.user.get_full_name() or self.request.user.email,
                 invitee_email=team_member.email,
                 enterprise_name=enterprise.name,
-                invite_url=accept_url
+                invite_url=accept_url,
             )
             
-            # Log successful email sending
+            # Log successful email queueing
             import logging
             logger = logging.getLogger(__name__)
-            logger.info(f'Sent invitation email to {team_member.email} for enterprise {enterprise.id}')
+            logger.info(f'Queued invitation email to {team_member.email} for enterprise {enterprise.id}')
             
         except Exception as e:
             # Log the error but don't fail the request
             import logging
             logger = logging.getLogger(__name__)
-            logger.error(f'Failed to send invitation email: {str(e)}', exc_info=True)
+            logger.error(f'Failed to queue invitation email: {str(e)}', exc_info=True)
+
+    BULK_INVITE_MAX = 200
+
+    @action(detail=False, methods=['post'], url_path='bulk-invite',
+            parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def bulk_invite(self, request):
+        """Invite many addresses to one enterprise in a single request.
+
+        Accepts JSON ``{"enterprise": id, "role": "MEMBER", "invitations": [...]}``
+        where each invitation is an email string or ``{"email", "role"}``, or a
+        CSV with ``email[,role]`` rows as a ``csv`` field or an uploaded ``file``.
+        Invitation emails are sent in the background after the rows commit.
+        """
+        import csv
+        import io
+        import secrets
+        from datetime import timedelta
+        from django.core.validators import validate_email
+        from django.db import IntegrityError
+        from django.db.models.functions import Lower
+        logger = logging.getLogger(__name__)
+
+        try:
+            enterprise = Enterprise.objects.get(id=int(request.data.get('enterprise')), owner=request.user)
+        except (TypeError, ValueError, Enterprise.DoesNotExist):
+            return Response({'detail': 'Enterprise not found or not permitted'}, status=404)
+
+        valid_roles = {choice for choice, _ in TeamMember.ROLE_CHOICES}
+        default_role = (request.data.get('role') or TeamMember.ROLE_MEMBER).upper()
+        if default_role not in valid_roles:
+            return Response({'detail': f'Invalid role: {default_role}'}, status=400)
+
+        # Normalise every accepted input shape to (email, role) pairs
+        entries = []
+        upload = request.FILES.get('file')
+        csv_text = upload.read().decode('utf-8-sig', errors='replace') if upload else request.data.get('csv')
+        if csv_text:
+            for row in csv.reader(io.StringIO(csv_text)):
+                if not row or not row[0].strip() or row[0].strip().lower() == 'email':
+                    continue
+                entries.append((row[0], row[1] if len(row) > 1 else ''))
+        else:
+            invitations = request.data.get('invitations') or request.data.get('emails') or []
+            if not isinstance(invitations, list):
+                return Response({'detail': 'invitations must be a list'}, status=400)
+            for inv in invitations:
+                if isinstance(inv, dict):
+                    entries.append((inv.get('email') or '', inv.get('role') or ''))
+                else:
+                    entries.append((str(inv), ''))
+
+        if not entries:
+            return Response({'detail': 'No invitations provided'}, status=400)
+        if len(entries) > self.BULK_INVITE_MAX:
+            return Response({'detail': f'At most {self.BULK_INVITE_MAX} invitations per request'}, status=400)
+
+        results = []
+        candidates = {}
+        owner_email = (request.user.email or '').lower()
+        for raw_email, raw_role in entries:
+            email = (raw_email or '').strip().lower()
+            role = (raw_role or '').strip().upper() or default_role
+            result = {'email': email or raw_email, 'role': role}
+            results.append(result)
+            try:
+                validate_email(email)
+            except ValidationError:
+                result.update(status='invalid', detail='Invalid email address')
+                continue
+            if role not in valid_roles:
+                result.update(status='invalid', detail=f'Invalid role: {role}')
+            elif email == owner_email:
+                result.update(status='skipped', detail='You already own this enterprise')
+            elif email in candidates:
+                result.update(status='duplicate', detail='Listed more than once')
+            else:
+                candidates[email] = result
+
+        # One query for every address already on this enterprise's team
+        existing = set(
+            TeamMember.objects
+            .filter(enterprise=enterprise)
+            .annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=list(candidates))
+            .values_list('email_lower', flat=True)
+        )
+        for email in existing:
+            candidates.pop(email).update(status='exists', detail='Already invited or a member')
+
+        expires_at = timezone.now() + timedelta(days=7)
+        members = [
+            TeamMember(
+                enterprise=enterprise,
+                email=email,
+                role=result['role'],
+                status=TeamMember.STATUS_INVITED,
+                invited_by=request.user,
+                invitation_token=secrets.token_hex(16),
+                invitation_expires_at=expires_at,
+            )
+            for email, result in candidates.items()
+        ]
+
+        frontend_url = compute_frontend_url(request)
+        inviter_name = request.user.get_full_name() or request.user.email
+        emails = [{
+            'inviter_name': inviter_name,
+            'invitee_email': member.email,
+            'enterprise_name': enterprise.name,
+            'invite_url': f"{frontend_url}/accept-invitation?token={member.invitation_token}",
+        } for member in members]
+
+        try:
+            with transaction.atomic():
+                TeamMember.objects.bulk_create(members)
+                # Outbox rows commit (or roll back) together with the invitations
+                queue_team_invitation_emails(emails)
+        except IntegrityError:
+            # Another request invited one of these addresses concurrently
+            logger.warning(f"Bulk invite for enterprise {enterprise.id} hit a uniqueness conflict")
+            return Response({'detail': 'Some of these addresses were invited concurrently. Please retry.'}, status=409)
+
+        for result in candidates.values():
+            result.update(status='invited')
+        logger.info(f"Bulk invited {len(members)} team members to enterprise {enterprise.id}")
+
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        return Response({
+            'enterprise': enterprise.id,
+            'invited': counts.get('invited', 0),
+            'counts': counts,
+            'results': results,
+        }, status=201 if members else 200)
 
     @action(detail=False, methods=['get', 'post'], 
              permission_classes=[permissions.AllowAny],
-             authentication_classes=[])
+             authentication_classes=[],
+             throttle_classes=[AuthScopedRateThrottle])
     def accept(self, request):
-        # For GET requests, show a form or redirect
+        # GET looks the invitation up for the frontend; only POST hashes a password
         if request.method == 'GET':
-            token = request.query_params.get('token', '').strip()
-            if not token:
-                return Response({'detail': 'Token is required'}, status=400)
-                
-            try:
-                member = TeamMember.objects.get(
-                    invitation_token=token, 
-                    status=TeamMember.STATUS_INVITED
-                )
-                
-                if member.invitation_expires_at and member.invitation_expires_at < timezone.now():
-                    return Response({'detail': 'Invitation has expired'}, status=400)
-                
-                # If it's a GET request, we'll return the member details for the frontend
-                return Response({
-                    'detail': 'Valid invitation',
-                    'enterprise_name': member.enterprise.name,
-                    'invited_by': member.invited_by.get_full_name() or member.invited_by.email,
-                    'email': member.email,
-                    'token': token
-                })
-                
-            except TeamMember.DoesNotExist:
-                return Response({'detail': 'Invalid or expired token'}, status=400)
-        
-        # For POST requests, process the acceptance with password setup
-        elif request.method == 'POST':
-            token = (request.data.get('token') or '').strip()
-            password = request.data.get('password', '').strip()
-            confirm_password = request.data.get('confirm_password', '').strip()
-            full_name = request.data.get('full_name', '').strip()
-            
-            if not token:
-                return Response({'detail': 'Token is required'}, status=400)
-                
-            try:
-                member = TeamMember.objects.get(
-                    invitation_token=token, 
-                    status=TeamMember.STATUS_INVITED
+            return self._invitation_details(request)
+        return self._accept_invitation(request)
+
+    def _invitation_details(self, request):
+        token = request.query_params.get('token', '').strip()
+        if not token:
+            return Response({'detail': 'Token is required'}, status=400)
+
+        try:
+            member = TeamMember.objects.get(
+                invitation_token=token, 
+                status=TeamMember.STATUS_INVITED
+            )
+
+            if member.invitation_expires_at and member.invitation_expires_at < timezone.now():
+                return Response({'detail': 'Invitation has expired'}, status=400)
+
+            # If it's a GET request, we'll return the member details for the frontend
+            return Response({
+                'detail': 'Valid invitation',
+                'enterprise_name': member.enterprise.name,
+                'invited_by': member.invited_by.get_full_name() or member.invited_by.email,
+                'email': member.email,
+                'token': token
+            })
+
+        except TeamMember.DoesNotExist:
+            return Response({'detail': 'Invalid or expired token'}, status=400)
+
+    # Process the acceptance with password setup
+    @limit_password_hashing
+    def _accept_invitation(self, request):
+        token = (request.data.get('token') or '').strip()
+        password = request.data.get('password', '').strip()
+        confirm_password = request.data.get('confirm_password', '').strip()
+        full_name = request.data.get('full_name', '').strip()
+
+        if not token:
+            return Response({'detail': 'Token is required'}, status=400)
+
+        try:
+            member = TeamMember.objects.get(
+                invitation_token=token, 
+                status=TeamMember.STATUS_INVITED
+            )
+
+            if member.invitation_expires_at and member.invitation_expires_at < timezone.now():
+                return Response({'detail': 'Invitation has expired'}, status=400)
+
+            User = get_user_model()
+            user = None
+
+            # Check if user already exists with this email
+            existing_user = User.objects.filter(email__iexact=member.email).first()
+
+            if existing_user:
+                # User already exists, just link them. Following the
+                # emailed invitation link also proves the address.
+                user = existing_user
+                user.mark_email_verified()
+            elif password:
+                # Create a new user account
+                if len(password) < 8:
+                    return Response({'detail': 'Password must be at least 8 characters'}, status=400)
+                if password != confirm_password:
+                    return Response({'detail': 'Passwords do not match'}, status=400)
+
+                first_name = full_name.split(' ')[0] if full_name else ''
+                last_name = ' '.join(full_name.split(' ')[1:]) if ' ' in full_name else ''
+
+                # Auto-verify email since they came from invitation
+                user = User.objects.create_user(
+                    email=member.email,
+                    password=password,
+                    username=member.email,
+                    first_name=first_name,
+                    last_name=last_name,
+                    email_verified_at=timezone.now()
                 )
-                
-                if member.invitation_expires_at and member.invitation_expires_at < timezone.now():
-                    return Response({'detail': 'Invitation has expired'}, status=400)
-                
-                User = get_user_model()
-                user = None
-                
-                # Check if user already exists with this email
-                existing_user = User.objects.filter(email__iexact=member.email).first()
-                
-                if existing_user:
-                    # User already exists, just link them
-                    user = existing_user
-                elif password:
-                    # Create a new user account
-                    if len(password) < 8:
-                        return Response({'detail': 'Password must be at least 8 characters'}, status=400)
-                    if password != confirm_password:
-                        return Response({'detail': 'Passwords do not match'}, status=400)
-                    
-                    first_name = full_name.split(' ')[0] if full_name else ''
-                    last_name = ' '.join(full_name.split(' ')[1:]) if ' ' in full_name else ''
-                    
-                    user = User.objects.create_user(
-                        email=member.email,
-                        password=password,
-                        username=member.email,
-                        first_name=first_name,
-                        last_name=last_name
-                    )
-                    
-                    # Auto-verify email since they came from invitation
-                    from .models import EmailOTP
-                    EmailOTP.objects.create(
-                        user=user,
-                        code='INVITE_VERIFIED',
-                        expires_at=timezone.now() + timedelta(days=365),
-                        is_verified=True,
-                        is_used=True
-                    )
-                else:
-                    return Response({
-                        'detail': 'Password is required for new accounts',
-                        'needs_password': True
-                    }, status=400)
-                
-                # Link user to team member
-                member.user = user
-                member.status = TeamMember.STATUS_ACTIVE
-                member.accepted_at = timezone.now()
-                member.invitation_token = None  # Clear token after use
-                member.save()
-                
-                # Generate JWT tokens for immediate login
-                from rest_framework_simplejwt.tokens import RefreshToken
-                refresh = RefreshToken.for_user(user)
-                
+            else:
                 return Response({
-                    'detail': 'Invitation accepted successfully! You are now logged in.',
-                    'enterprise_id': member.enterprise_id,
-                    'enterprise_name': member.enterprise.name,
-                    'user_id': user.id,
-                    'email': user.email,
-                    'access': str(refresh.access_token),
-                    'refresh': str(refresh),
-                    'redirect_url': '/team-portal/'
-                })
-                
-            except TeamMember.DoesNotExist:
-                return Response({'detail': 'Invalid or expired token'}, status=400)
+                    'detail': 'Password is required for new accounts',
+                    'needs_password': True
+                }, status=400)
+
+            # Link user to team member
+            member.user = user
+            member.status = TeamMember.STATUS_ACTIVE
+            member.accepted_at = timezone.now()
+            member.invitation_token = None  # Clear token after use
+            member.save()
+
+            # Legacy assignments made by email before the account existed
+            link_legacy_assignments(member.enterprise_id, member.email, user)
+
+            # Generate JWT tokens for immediate login
+            from rest_framework_simplejwt.tokens import RefreshToken
+            refresh = RefreshToken.for_user(user)
+
+            return Response({
+                'detail': 'Invitation accepted successfully! You are now logged in.',
+                'enterprise_id': member.enterprise_id,
+                'enterprise_name': member.enterprise.name,
+                'user_id': user.id,
+                'email': user.email,
+                'access': str(refresh.access_token),
+                'refresh': str(refresh),
+                'redirect_url': '/team-portal/'
+            })
+
+        except TeamMember.DoesNotExist:
+            return Response({'detail': 'Invalid or expired token'}, status=400)
 
 
 from rest_framework.views import APIView
@@ -687,7 +1015,10 @@ from django.views.generic import TemplateView
 
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [AuthScopedRateThrottle]
+    throttle_scope = 'auth_register'
 
+    @limit_password_hashing
     def post(self, request):
         logger = logging.getLogger(__name__)
         logger.info(f"Registration request received. Data: {request.data}")
@@ -785,20 +1116,15 @@ class ProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
+        # The authenticated user may be another process's cached copy, from
+        # before process_avatars replaced the avatar and released the old files
         u = request.user
-        avatar_url = ''
-        try:
-            if getattr(u, 'avatar', None) and u.avatar:
-                # Build full URL for avatar
-                avatar_relative = u.avatar.url
-                # If it's already a full URL, use it; otherwise build it
-                if avatar_relative.startswith('http'):
-                    avatar_url = avatar_relative
-                else:
-                    # Use request to build absolute URL
-                    avatar_url = request.build_absolute_uri(avatar_relative)
-        except Exception:
-            avatar_url = ''
+        u.refresh_from_db(fields=['avatar', 'avatar_thumbnails'])
+        return self._profile(request, u)
+
+    def _profile(self, request, u):
+        from .avatars import avatar_url, avatar_urls
+
         return Response({
             'email': u.email,
             'first_name': u.first_name,
@@ -806,30 +1132,36 @@ class ProfileView(APIView):
             'full_name': f"{u.first_name} {u.last_name}".strip(),
             'phone': getattr(u, 'phone', ''),
             'title': getattr(u, 'title', ''),
-            'avatar_url': avatar_url,
+            'avatar_url': avatar_url(request, u, 256),
+            # {"32": {"webp": url, "jpeg": url}, "64": ..., "256": ...} once thumbnails exist
+            'avatar_urls': avatar_urls(request, u),
         })
 
     def put(self, request):
-        u = request.user
-        u.first_name = request.data.get('first_name', u.first_name)
-        u.last_name = request.data.get('last_name', u.last_name)
-        u.phone = request.data.get('phone', getattr(u, 'phone', ''))
-        u.title = request.data.get('title', getattr(u, 'title', ''))
-        # email change optional; ensure uniqueness
-        new_email = (request.data.get('email') or '').strip()
-        if new_email and new_email.lower() != u.email.lower():
-            User = get_user_model()
-            if User.objects.filter(email__iexact=new_email).exclude(pk=u.pk).exists():
-                return Response({'detail': 'Email is already in use'}, status=400)
-            u.email = new_email
-            u.username = new_email
-        u.save()
-        return self.get(request)
+        User = get_user_model()
+        with transaction.atomic():
+            # Edit the locked row, not the cached request.user: saving that copy
+            # would write back a stale password, avatar or verification state
+            u = User.objects.select_for_update().get(pk=request.user.pk)
+            u.first_name = request.data.get('first_name', u.first_name)
+            u.last_name = request.data.get('last_name', u.last_name)
+            u.phone = request.data.get('phone', getattr(u, 'phone', ''))
+            u.title = request.data.get('title', getattr(u, 'title', ''))
+            # email change optional; ensure uniqueness
+            new_email = (request.data.get('email') or '').strip()
+            if new_email and new_email.lower() != u.email.lower():
+                if User.objects.filter(email__iexact=new_email).exclude(pk=u.pk).exists():
+                    return Response({'detail': 'Email is already in use'}, status=400)
+                u.email = new_email
+                u.username = new_email
+            u.save(update_fields=['first_name', 'last_name', 'phone', 'title', 'email', 'username'])
+        return self._profile(request, u)
 
 
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.pagination import PageNumberPagination
 from django.core.exceptions import ValidationError
 
 
@@ -852,28 +1184,33 @@ class AvatarUploadView(APIView):
         if file.content_type not in allowed_types:
             return Response({'detail': f'Invalid file type. Allowed: {", ".join(allowed_types)}'}, status=400)
         
+        from .avatars import InvalidImage, avatar_url, queue_thumbnails, release_thumbnails, validate_image
+
         try:
-            u = request.user
-            # Delete old avatar if it exists
-            if u.avatar:
-                try:
-                    u.avatar.delete(save=False)
-                except Exception as e:
-                    logger.warning(f"Could not delete old avatar: {str(e)}")
-            
-            u.avatar = file
-            u.save(update_fields=['avatar'])
-            
-            # Build full URL for avatar
-            avatar_relative = getattr(u.avatar, 'url', '')
-            if avatar_relative.startswith('http'):
-                avatar_url = avatar_relative
-            else:
-                # Use request to build absolute URL
-                avatar_url = request.build_absolute_uri(avatar_relative)
-            
-            logger.info(f"Avatar uploaded successfully for user {u.id}: {avatar_url}")
-            return Response({'avatar_url': avatar_url})
+            validate_image(file)
+        except InvalidImage:
+            return Response({'detail': 'File is not a readable image'}, status=400)
+
+        try:
+            with transaction.atomic():
+                # Locked fresh row: the cached request.user may predate a
+                # process_avatars run, and this releases the current files
+                u = get_user_model().objects.select_for_update().get(pk=request.user.pk)
+                # Delete old avatar if it exists
+                if u.avatar:
+                    try:
+                        u.avatar.delete(save=False)
+                    except Exception as e:
+                        logger.warning(f"Could not delete old avatar: {str(e)}")
+                release_thumbnails(u)
+                u.avatar = file
+                u.save(update_fields=['avatar', 'avatar_thumbnails'])
+                # Thumbnails and metadata stripping happen in the process_avatars worker
+                queue_thumbnails(u)
+
+            url = avatar_url(request, u)
+            logger.info(f"Avatar uploaded successfully for user {u.id}: {url}")
+            return Response({'avatar_url': url, 'avatar_urls': {}, 'thumbnails_pending': True})
         except Exception as e:
             logger.error(f"Error uploading avatar for user {request.user.id}: {str(e)}", exc_info=True)
             return Response({'detail': f'Error uploading avatar: {str(e)}'}, status=500)
@@ -883,20 +1220,28 @@ class AvatarRemoveView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        u = request.user
-        if getattr(u, 'avatar', None):
-            try:
-                u.avatar.delete(save=False)
-            except Exception:
-                pass
-        u.avatar = None
-        u.save(update_fields=['avatar'])
+        from .avatars import release_thumbnails
+
+        with transaction.atomic():
+            # See AvatarUploadView: release the files the row refers to now
+            u = get_user_model().objects.select_for_update().get(pk=request.user.pk)
+            if getattr(u, 'avatar', None):
+                try:
+                    u.avatar.delete(save=False)
+                except Exception:
+                    pass
+            release_thumbnails(u)
+            u.avatar = None
+            u.save(update_fields=['avatar', 'avatar_thumbnails'])
         return Response({'detail': 'Avatar removed'})
 
 
 class ChangePasswordView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [AuthScopedRateThrottle]
+    throttle_scope = 'auth_password'
 
+    @limit_password_hashing
     def post(self, request):
         current = request.data.get('current_password') or ''
         new = request.data.get('new_password') or ''
@@ -905,11 +1250,14 @@ class ChangePasswordView(APIView):
             return Response({'detail': 'current_password, new_password, confirm_password are required'}, status=400)
         if new != confirm:
             return Response({'detail': 'New passwords do not match'}, status=400)
-        u = request.user
-        if not u.check_password(current):
-            return Response({'detail': 'Current password is incorrect'}, status=400)
-        u.set_password(new)
-        u.save(update_fields=['password'])
+        with transaction.atomic():
+            # Check against the row's hash; request.user may be a cached copy
+            # from before another password change
+            u = get_user_model().objects.select_for_update().get(pk=request.user.pk)
+            if not u.check_password(current):
+                return Response({'detail': 'Current password is incorrect'}, status=400)
+            u.set_password(new)
+            u.save(update_fields=['password'])
         return Response({'detail': 'Password updated'})
 
 
@@ -930,23 +1278,14 @@ class DeleteAccountView(APIView):
             # Delete related data first to avoid foreign key constraint issues
             from .models import (
                 Enterprise, QuestionResponse, ScoreSummary, EmailOTP, PhoneOTP, 
-                ActionItem, NotificationPreference
+                ActionItem, NotificationPreference, TeamMember
             )
             from django.db import connection, ProgrammingError, IntegrityError
+            from accounts.authentication import invalidate_cached_user
             
             # Check if team_members table exists before trying to delete from it
-            team_members_table_exists = False
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT table_name 
-                        FROM information_schema.tables 
-                        WHERE table_schema = 'public' 
-                        AND table_name = 'team_members'
-                    """)
-                    team_members_table_exists = cursor.fetchone() is not None
-            except Exception:
-                pass  # If we can't check, we'll try to delete and catch the error
+            from . import capabilities
+            team_members_table_exists = capabilities.has_table(TeamMember._meta.db_table)
             
             # CRITICAL: Delete JWT tokens from token_blacklist FIRST
             # This table has a foreign key to the user table and must be cleaned up
@@ -1086,6 +1425,8 @@ class DeleteAccountView(APIView):
                     # Finally delete the user
                     try:
                         cursor.execute(f"DELETE FROM {user_table} WHERE id = %s", [user_id])
+                        # Raw SQL skips post_delete, so drop the cached auth user here
+                        invalidate_cached_user(user_id)
                         if cursor.rowcount > 0:
                             logger.info(f"User {user_id} deleted via direct SQL from table {user_table}")
                         else:
@@ -1237,25 +1578,24 @@ class PasswordResetRequestView(APIView):
         base = compute_public_base_url(request)
         confirm_url = f"{base}/reset-password?uid={uidb64}&token={token}"
 
-        # Email body
-        subject = 'Password reset instructions'
-        message = (
-            'You requested a password reset.\n\n'
-            f'Open the following link to set a new password: {confirm_url}\n\n'
-            'If you did not request this, you can ignore this email.'
-        )
-
         try:
-            send_mail(subject, message, None, [user.email], fail_silently=False)
+            from .email_templates import build_email
+            enqueue_once(
+                dedupe_key('password_reset', user.pk),
+                lambda: build_email('password_reset', user.email, {'confirm_url': confirm_url}),
+            )
         except Exception:
-            logging.exception('Failed to send password reset email')
+            logging.exception('Failed to queue password reset email')
             return Response({"detail": "Failed to send reset email. Please try again later."}, status=502)
         return Response({"detail": "Password reset link sent to your email."})
 
 
 class PasswordResetConfirmView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [AuthScopedRateThrottle]
+    throttle_scope = 'auth_password'
 
+    @limit_password_hashing
     def post(self, request):
         uidb64 = request.data.get('uid') or ''
         token = request.data.get('token') or ''
@@ -1296,8 +1636,7 @@ class DashboardView(APIView):
             }, status=403)
         
         # Require email verification only
-        has_email_verified = EmailOTP.objects.filter(user=request.user, is_verified=True).exists()
-        if not has_email_verified:
+        if not request.user.is_email_verified:
             return Response({"detail": "Verification required", "needs_otp": True}, status=403)
         
         enterprises_count = Enterprise.objects.filter(owner=request.user).count()
@@ -1425,7 +1764,6 @@ class MyAssessmentSessionsView(APIView):
 from django.utils import timezone
 from datetime import timedelta
 import random
-from django.core.mail import send_mail
 from django.conf import settings
 import requests
 import os
@@ -1443,30 +1781,29 @@ class SendEmailOTPView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        # If already verified by email or phone, do not resend
-        already_verified = (
-            EmailOTP.objects.filter(user=request.user, is_verified=True).exists() or
-            PhoneOTP.objects.filter(user=request.user, is_verified=True).exists()
-        )
-        if already_verified:
+        # If already verified, do not resend
+        if request.user.is_email_verified:
             return Response({"detail": "Phone/email already verified."})
         # generate 6-digit code
         code = f"{random.randint(0,999999):06d}"
         expires = timezone.now() + timedelta(minutes=10)
-        otp = EmailOTP.objects.create(user=request.user, code=code, expires_at=expires)
-        # Send email using configured backend
-        try:
-            send_mail(
-                subject='Your verification code',
-                message=f'Your verification code is {code}. It expires in 10 minutes.',
-                from_email=None,
-                recipient_list=[request.user.email],
-                fail_silently=False,
+        from .email_templates import build_email
+
+        def create_otp():
+            EmailOTP.objects.create(user=request.user, code=code, expires_at=expires)
+            return build_email('email_otp', request.user.email, {'code': code, 'expires_minutes': 10})
+
+        # The code and its email are committed together; the outbox worker delivers it.
+        # A repeat request within the dedupe window creates no new code.
+        if enqueue_once(dedupe_key('email_otp', request.user.pk), create_otp) is None:
+            latest = (
+                EmailOTP.objects
+                .filter(user=request.user, is_verified=False, expires_at__gte=timezone.now())
+                .order_by('-created_at')
+                .first()
             )
-            delivery = 'email'
-        except Exception as e:
-            print('Email send failed:', e)
-            delivery = 'console'
+            if latest:
+                expires = latest.expires_at
         resp = {"detail": "OTP sent to your email.", "expires_at": expires}
         return Response(resp)
 
@@ -1477,9 +1814,8 @@ class VerifyEmailOTPView(APIView):
     def post(self, request):
         code = request.data.get('code', '')
         now = timezone.now()
-        # If already verified by email or phone
-        if EmailOTP.objects.filter(user=request.user, is_verified=True).exists() or \
-           PhoneOTP.objects.filter(user=request.user, is_verified=True).exists():
+        # If already verified
+        if request.user.is_email_verified:
             return Response({"detail": "Phone/email already verified."})
         otp = (
             EmailOTP.objects
@@ -1489,8 +1825,10 @@ class VerifyEmailOTPView(APIView):
         )
         if not otp:
             return Response({"detail": "Invalid or expired code"}, status=400)
-        otp.is_verified = True
-        otp.save(update_fields=['is_verified', 'updated_at'])
+        with transaction.atomic():
+            otp.is_verified = True
+            otp.save(update_fields=['is_verified', 'updated_at'])
+            request.user.mark_email_verified()
         # Redirect to login with next=dashboard to complete the flow
         from django.shortcuts import redirect
         return redirect('/login?verified=1')
@@ -1543,7 +1881,7 @@ class VerifyEmailLinkView(APIView):
             )
         
         if not otp:
-            if EmailOTP.objects.filter(user=user, is_verified=True).exists():
+            if user.is_email_verified:
                 logger.info(f"User {user.email} already verified")
                 # Redirect to verification status page with success message
                 return redirect(f"{frontend_url}/verification-status?verification=success&message=already_verified")
@@ -1558,13 +1896,11 @@ class VerifyEmailLinkView(APIView):
             return redirect(f"{frontend_url}/verification-status?verification=error&message=expired_link")
         
         # Mark as verified
-        otp.is_verified = True
-        otp.is_used = True
-        otp.save(update_fields=['is_verified', 'is_used', 'updated_at'])
-        
-        if hasattr(user, 'email_verified') and not user.email_verified:
-            user.email_verified = True
-            user.save(update_fields=['email_verified', 'updated_at'])
+        with transaction.atomic():
+            otp.is_verified = True
+            otp.is_used = True
+            otp.save(update_fields=['is_verified', 'is_used', 'updated_at'])
+            user.mark_email_verified()
         
         logger.info(f"Successfully verified email for user: {user.email}")
         
@@ -1574,7 +1910,7 @@ class AuthStatusView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        has_email_verified = EmailOTP.objects.filter(user=request.user, is_verified=True).exists()
+        has_email_verified = request.user.is_email_verified
         user_phone = ''
         try:
             user_phone = request.user.phone
@@ -1659,6 +1995,9 @@ class EnterpriseReportView(APIView):
         if is_team_member_only(request.user):
             return Response({"detail": "Team members should use the Team Portal."}, status=403)
         
+        if request.query_params.get('assemble') == 'db':
+            return self._get_db_assembled(request, pk)
+
         try:
             e = Enterprise.objects.get(pk=pk, owner=request.user)
         except Enterprise.DoesNotExist:
@@ -1675,6 +2014,61 @@ class EnterpriseReportView(APIView):
             'updated_at': getattr(summary, 'updated_at', None),
         })
 
+    def _get_db_assembled(self, request, pk):
+        from django.http import HttpResponse
+        from .payloads import fetch_report_json
+
+        row = fetch_report_json(pk, request.user.id)
+        if row is None:
+            return Response({"detail": "Not found"}, status=404)
+        has_summary, payload = row
+        if not has_summary:
+            e = Enterprise.objects.get(pk=pk)
+            if recompute_and_store_summary(e):
+                has_summary, payload = fetch_report_json(pk, request.user.id)
+        return HttpResponse(payload, content_type='application/json')
+
+
+class EnterpriseReportDocumentView(APIView):
+    """
+    Printable HTML or PDF version of the enterprise report.
+
+    Reports are rendered by the ``render_reports`` worker and cached per
+    ScoreSummary version (see diagnostic.reports): answers 202 while the
+    current version is being rendered, then a signed URL to the stored file.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk: int, fmt: str):
+        from .media import signed_media_url
+        from .models import EnterpriseReport
+        from .reports import request_report, retry_after
+
+        if fmt not in ('html', 'pdf'):
+            return Response({"detail": "Format must be html or pdf"}, status=404)
+        if is_team_member_only(request.user):
+            return Response({"detail": "Team members should use the Team Portal."}, status=403)
+        try:
+            e = Enterprise.objects.get(pk=pk, owner=request.user)
+        except Enterprise.DoesNotExist:
+            return Response({"detail": "Not found"}, status=404)
+        summary = ScoreSummary.objects.filter(enterprise=e).first() or recompute_and_store_summary(e)
+
+        report = request_report(e, summary.version)
+        if report.status == EnterpriseReport.STATUS_FAILED:
+            response = Response({"detail": "Report could not be generated, try again later", "status": report.status}, status=503)
+            response['Retry-After'] = str(retry_after(report))
+            return response
+        if report.status == EnterpriseReport.STATUS_PENDING:
+            response = Response({"status": report.status, "version": report.version}, status=202)
+            response['Retry-After'] = '2'
+            return response
+        return Response({
+            "status": report.status,
+            "version": report.version,
+            "url": signed_media_url(request, getattr(report, fmt)),
+        })
+
 # API Views Only - Template views have been removed as they're now handled by the frontend
 
 class ResendVerificationEmail(APIView):
@@ -1696,8 +2090,7 @@ class ResendVerificationEmail(APIView):
             logger.info(f"Found user: {user.id} for email: {email}")
             
             # Check if already verified
-            from .models import EmailOTP
-            if EmailOTP.objects.filter(user=user, is_verified=True).exists():
+            if user.is_email_verified:
                 logger.info(f"User {user.id} already verified, skipping resend")
                 return Response({"detail": "Email is already verified"}, status=400)
                 
@@ -1783,8 +2176,9 @@ class TestNotificationView(APIView):
         Send a test notification email to the current user.
         Respects the user's email_notifications preference.
         """
-        from django.core.mail import send_mail
         from .models import NotificationPreference
+        from .email_templates import build_email
+        from .outbox import enqueue_email
         
         user = request.user
         pref, _ = NotificationPreference.objects.get_or_create(user=user)
@@ -1798,74 +2192,15 @@ class TestNotificationView(APIView):
         
         # Send test email
         try:
-            subject = 'Test Notification from Kigali Business Lab'
-            message = f"""
-Hello {user.get_full_name() or user.email},
-
-This is a test notification to verify that your email notifications are working correctly.
-
-If you received this email, it means:
-✅ Your email notifications are enabled
-✅ The email system is configured correctly
-✅ You will receive notifications for important updates
-
-You can manage your notification preferences in your account settings.
-
-Best regards,
-Kigali Business Lab Team
-            """.strip()
-            
-            html_message = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #334155; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background: linear-gradient(135deg, #01497f 0%, #0277bd 100%); padding: 30px; text-align: center; border-radius: 12px 12px 0 0; }}
-        .header h1 {{ color: white; margin: 0; font-size: 24px; }}
-        .content {{ background: white; padding: 30px; border: 1px solid #e2e8f0; border-top: none; border-radius: 0 0 12px 12px; }}
-        .success {{ background: #f0fdf4; border-left: 4px solid #10b981; padding: 16px; margin: 20px 0; border-radius: 4px; }}
-        .footer {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid #e2e8f0; text-align: center; color: #94a3b8; font-size: 12px; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>Test Notification</h1>
-        </div>
-        <div class="content">
-            <p>Hello <strong>{user.get_full_name() or user.email}</strong>,</p>
-            <p>This is a test notification to verify that your email notifications are working correctly.</p>
-            <div class="success">
-                <strong>✅ Success!</strong> If you received this email, it means:
-                <ul>
-                    <li>Your email notifications are enabled</li>
-                    <li>The email system is configured correctly</li>
-                    <li>You will receive notifications for important updates</li>
-                </ul>
-            </div>
-            <p>You can manage your notification preferences in your account settings.</p>
-            <div class="footer">
-                <p>Kigali Business Lab Team</p>
-            </div>
-        </div>
-    </div>
-</body>
-</html>
-            """.strip()
-            
-            send_mail(
-                subject=subject,
-                message=message,
+            enqueue_email(**build_email(
+                'test_notification',
+                user.email,
+                {'name': user.get_full_name() or user.email},
                 from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            ))
             
             return Response({
-                'detail': 'Test notification sent successfully! Check your email inbox.',
+                'detail': 'Test notification sent successfully! Check your email inbox in a moment.',
                 'email': user.email,
                 'email_notifications_enabled': True
             })
@@ -1908,13 +2243,15 @@ class TeamMemberPortalView(APIView):
             })
         
         # Get all enterprises where this user is a team member (but NOT the owner)
-        memberships = TeamMember.objects.filter(
-            user=user, 
-            status=TeamMember.STATUS_ACTIVE
-        ).select_related('enterprise').exclude(enterprise__owner=user)
+        memberships = list(
+            TeamMember.objects.filter(
+                user=user,
+                status=TeamMember.STATUS_ACTIVE
+            ).select_related('enterprise').exclude(enterprise__owner=user)
+        )
         
         # If user has no enterprises and no team memberships, they're a new owner (not a team member)
-        if not memberships.exists():
+        if not memberships:
             return Response({
                 'detail': 'You are not a team member. New users should create an enterprise profile.',
                 'is_owner': False,  # Not an owner yet, but not a team member either
@@ -1928,24 +2265,17 @@ class TeamMemberPortalView(APIView):
                 'total_enterprises': 0
             }, status=403)
         
-        enterprises_data = []
-        for membership in memberships:
-            enterprise = membership.enterprise
-            
-            # Double-check: skip if user is the owner
-            if enterprise.owner == user:
-                continue
-            
-            # Get action items assigned to this user for this enterprise
-            # Check both assigned_to_user (new) and assigned_to (legacy) fields
-            assigned_items = ActionItem.objects.filter(
-                enterprise=enterprise
-            ).filter(
-                models.Q(assigned_to_user=user) | 
-                models.Q(assigned_to__iexact=user.email)
-            ).order_by('status', '-priority', 'due_date')
-            
-            items_data = [{
+        # Fetch the assigned items for every membership in one query and
+        # group them per enterprise. Legacy email-only assignments are linked
+        # to assigned_to_user by backfill_action_item_assignees and on
+        # invitation acceptance; note/document counts are denormalized.
+        items_by_enterprise = {}
+        assigned_items = ActionItem.objects.filter(
+            enterprise_id__in=[m.enterprise_id for m in memberships],
+            assigned_to_user=user,
+        ).order_by('status', '-priority', 'due_date')
+        for item in assigned_items:
+            items_by_enterprise.setdefault(item.enterprise_id, []).append({
                 'id': item.id,
                 'title': item.title,
                 'description': item.description,
@@ -1955,10 +2285,19 @@ class TeamMemberPortalView(APIView):
                 'due_date': item.due_date.isoformat() if item.due_date else None,
                 'progress_percentage': item.progress_percentage,
                 'created_at': item.created_at.isoformat(),
-                'notes_count': item.notes.count(),
-                'documents_count': item.documents.count()
-            } for item in assigned_items]
+                'notes_count': item.notes_count,
+                'documents_count': item.documents_count
+            })
+        
+        enterprises_data = []
+        for membership in memberships:
+            enterprise = membership.enterprise
             
+            # Double-check: skip if user is the owner
+            if enterprise.owner_id == user.id:
+                continue
+            
+            items_data = items_by_enterprise.get(enterprise.id, [])
             enterprises_data.append({
                 'enterprise_id': enterprise.id,
                 'enterprise_name': enterprise.name,
@@ -1989,54 +2328,80 @@ class TeamMemberPortalView(APIView):
         })
 
 
+def _can_access_action_item(item, user) -> bool:
+    """Owner, assignee, or an active team member of the item's enterprise."""
+    if item.owner_id == user.id or item.assigned_to_user_id == user.id:
+        return True
+    return TeamMember.objects.filter(
+        enterprise_id=item.enterprise_id,
+        user=user,
+        status=TeamMember.STATUS_ACTIVE
+    ).exists()
+
+
+def _action_note_data(note):
+    return {
+        'id': note.id,
+        'content': note.content,
+        'progress_update': note.progress_update,
+        'author': {
+            'id': note.author.id,
+            'email': note.author.email,
+            'name': f"{note.author.first_name} {note.author.last_name}".strip() or note.author.email
+        },
+        'created_at': note.created_at.isoformat()
+    }
+
+
+def _action_document_data(doc, request):
+    return {
+        'id': doc.id,
+        'filename': doc.filename,
+        'file_type': doc.file_type,
+        'file_size': doc.file_size,
+        'description': doc.description,
+        'file_url': signed_media_url(request, doc.file),
+        'uploaded_by': {
+            'id': doc.uploaded_by.id,
+            'name': f"{doc.uploaded_by.first_name} {doc.uploaded_by.last_name}".strip() or doc.uploaded_by.email
+        },
+        'created_at': doc.created_at.isoformat()
+    }
+
+
+class ActionItemActivityPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
 class ActionItemDetailView(APIView):
-    """Get/update a single action item with notes and documents."""
+    """Get/update a single action item with its most recent notes and documents.
+    Full histories are paged through the notes/ and documents/ sub-endpoints.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    recent_activity_limit = 10
 
     def get(self, request, pk):
-        from .models import ActionItem, ActionItemNote, ActionItemDocument
+        from .models import ActionItem
         
         try:
             item = ActionItem.objects.select_related(
                 'owner', 'enterprise', 'assigned_to_user', 'completed_by'
-            ).prefetch_related('notes__author', 'documents__uploaded_by').get(pk=pk)
+            ).get(pk=pk)
             
             # Check permission - owner, assigned user, or team member of enterprise
-            if item.owner != request.user and item.assigned_to_user != request.user:
-                from .models import TeamMember
-                is_team_member = TeamMember.objects.filter(
-                    enterprise=item.enterprise,
-                    user=request.user,
-                    status=TeamMember.STATUS_ACTIVE
-                ).exists()
-                if not is_team_member:
-                    return Response({'detail': 'Permission denied'}, status=403)
-            
-            notes_data = [{
-                'id': note.id,
-                'content': note.content,
-                'progress_update': note.progress_update,
-                'author': {
-                    'id': note.author.id,
-                    'email': note.author.email,
-                    'name': f"{note.author.first_name} {note.author.last_name}".strip() or note.author.email
-                },
-                'created_at': note.created_at.isoformat()
-            } for note in item.notes.all()]
-            
-            docs_data = [{
-                'id': doc.id,
-                'filename': doc.filename,
-                'file_type': doc.file_type,
-                'file_size': doc.file_size,
-                'description': doc.description,
-                'file_url': request.build_absolute_uri(doc.file.url) if doc.file else None,
-                'uploaded_by': {
-                    'id': doc.uploaded_by.id,
-                    'name': f"{doc.uploaded_by.first_name} {doc.uploaded_by.last_name}".strip() or doc.uploaded_by.email
-                },
-                'created_at': doc.created_at.isoformat()
-            } for doc in item.documents.all()]
+            if not _can_access_action_item(item, request.user):
+                return Response({'detail': 'Permission denied'}, status=403)
+            
+            notes_data = [
+                _action_note_data(note)
+                for note in item.notes.select_related('author')[:self.recent_activity_limit]
+            ]
+            docs_data = [
+                _action_document_data(doc, request)
+                for doc in item.documents.select_related('uploaded_by')[:self.recent_activity_limit]
+            ]
             
             return Response({
                 'id': item.id,
@@ -2050,6 +2415,7 @@ class ActionItemDetailView(APIView):
                 'created_at': item.created_at.isoformat(),
                 'updated_at': item.updated_at.isoformat(),
                 'completed_at': item.completed_at.isoformat() if item.completed_at else None,
+                'last_activity_at': item.last_activity_at.isoformat() if item.last_activity_at else None,
                 'owner': {
                     'id': item.owner.id,
                     'email': item.owner.email,
@@ -2071,7 +2437,9 @@ class ActionItemDetailView(APIView):
                              or item.completed_by.email) if item.completed_by else None
                 },
                 'notes': notes_data,
-                'documents': docs_data
+                'notes_count': item.notes_count,
+                'documents': docs_data,
+                'documents_count': item.documents_count,
             })
         except ActionItem.DoesNotExist:
             return Response({'detail': 'Action item not found'}, status=404)
@@ -2107,17 +2475,7 @@ class ActionItemUpdateProgressView(APIView):
                 item.progress_percentage = min(100, max(0, int(progress)))
             
             if new_status and new_status in [s[0] for s in ActionItem.STATUS_CHOICES]:
-                old_status = item.status
-                item.status = new_status
-                
-                # If marking as completed
-                if new_status == ActionItem.STATUS_COMPLETED and old_status != ActionItem.STATUS_COMPLETED:
-                    item.completed_at = timezone.now()
-                    item.completed_by = request.user
-                    item.progress_percentage = 100
-                elif new_status != ActionItem.STATUS_COMPLETED:
-                    item.completed_at = None
-                    item.completed_by = None
+                item.set_status(new_status, request.user)
             
             item.save()
             
@@ -2142,9 +2500,17 @@ class ActionItemUpdateProgressView(APIView):
 
 
 class ActionItemAddNoteView(APIView):
-    """Add a note to an action item."""
+    """List (paginated, newest first) or add notes on an action item."""
     permission_classes = [permissions.IsAuthenticated]
 
+    def get(self, request, pk):
+        item = get_object_or_404(ActionItem, pk=pk)
+        if not _can_access_action_item(item, request.user):
+            return Response({'detail': 'Permission denied'}, status=403)
+        paginator = ActionItemActivityPagination()
+        page = paginator.paginate_queryset(item.notes.select_related('author'), request, view=self)
+        return paginator.get_paginated_response([_action_note_data(note) for note in page])
+
     def post(self, request, pk):
         from .models import ActionItem, ActionItemNote
         
@@ -2195,10 +2561,18 @@ class ActionItemAddNoteView(APIView):
 
 
 class ActionItemUploadDocumentView(APIView):
-    """Upload a document to an action item."""
+    """List (paginated, newest first) or upload documents on an action item."""
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
+    def get(self, request, pk):
+        item = get_object_or_404(ActionItem, pk=pk)
+        if not _can_access_action_item(item, request.user):
+            return Response({'detail': 'Permission denied'}, status=403)
+        paginator = ActionItemActivityPagination()
+        page = paginator.paginate_queryset(item.documents.select_related('uploaded_by'), request, view=self)
+        return paginator.get_paginated_response([_action_document_data(doc, request) for doc in page])
+
     def post(self, request, pk):
         from .models import ActionItem, ActionItemDocument
         
@@ -2239,13 +2613,125 @@ class ActionItemUploadDocumentView(APIView):
                 'filename': doc.filename,
                 'file_type': doc.file_type,
                 'file_size': doc.file_size,
-                'file_url': request.build_absolute_uri(doc.file.url),
+                'file_url': signed_media_url(request, doc.file),
                 'created_at': doc.created_at.isoformat()
             }, status=201)
         except ActionItem.DoesNotExist:
             return Response({'detail': 'Action item not found'}, status=404)
 
 
+def _upload_result_data(session, created, request):
+    from .models import UploadSession
+
+    if session.target == UploadSession.TARGET_ATTACHMENT:
+        return AttachmentSerializer(created, context={'request': request}).data
+    return _action_document_data(created, request)
+
+
+class UploadSessionCreateView(APIView):
+    """Start a resumable chunked upload of an evidence attachment or action document."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        from .models import UploadSession
+        from .uploads import UploadError, create_session, session_data
+
+        target = request.data.get('target')
+        try:
+            parent_id = int(request.data.get('response' if target == UploadSession.TARGET_ATTACHMENT else 'action_item'))
+        except (TypeError, ValueError):
+            parent_id = None
+        fields = {
+            'content_type': (request.data.get('content_type') or '')[:100],
+            'sha256': request.data.get('sha256') or '',
+        }
+        if target == UploadSession.TARGET_ATTACHMENT:
+            fields['response'] = get_object_or_404(
+                QuestionResponse, pk=parent_id, enterprise__owner=request.user,
+            )
+        elif target == UploadSession.TARGET_ACTION_DOCUMENT:
+            item = get_object_or_404(ActionItem, pk=parent_id)
+            if not _can_access_action_item(item, request.user):
+                return Response({'detail': 'Permission denied'}, status=403)
+            fields['action_item'] = item
+            fields['description'] = request.data.get('description', '')
+        else:
+            return Response({'detail': "target must be 'attachment' or 'action_document'"}, status=400)
+
+        try:
+            session, created = create_session(
+                request.user, target, request.data.get('filename'), request.data.get('size'),
+                request.data.get('chunk_size'), **fields,
+            )
+        except UploadError as e:
+            return Response({'detail': e.detail}, status=e.status)
+        data = session_data(session)
+        if created is not None:
+            # Identical content is already stored: nothing to upload
+            data['result'] = _upload_result_data(session, created, request)
+        return Response(data, status=201)
+
+
+class UploadSessionDetailView(APIView):
+    """Progress of an upload (which chunks arrived), or abort it."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        from .models import UploadSession
+        from .uploads import session_data
+
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        return Response(session_data(session))
+
+    def delete(self, request, pk):
+        from .models import UploadSession
+        from .uploads import discard_session
+
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user, status=UploadSession.STATUS_OPEN)
+        discard_session(session)
+        return Response(status=204)
+
+
+class UploadChunkView(APIView):
+    """
+    PUT the raw bytes of one chunk (``Content-Type: application/octet-stream``).
+
+    The body is copied from the request stream, never parsed or buffered. An
+    optional ``X-Chunk-SHA256`` header is checked against the bytes received.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def put(self, request, pk, index):
+        from .models import UploadSession
+        from .uploads import UploadError, session_data, write_chunk
+
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        try:
+            session = write_chunk(
+                session, index, request._request, request.META.get('CONTENT_LENGTH'),
+                expected_sha256=request.META.get('HTTP_X_CHUNK_SHA256'),
+            )
+        except UploadError as e:
+            return Response({'detail': e.detail}, status=e.status)
+        return Response(session_data(session))
+
+
+class UploadCompleteView(APIView):
+    """Verify the whole-file checksum and create the attachment or document."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        from .models import UploadSession
+        from .uploads import UploadError, complete_session
+
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        try:
+            created = complete_session(session, sha256=request.data.get('sha256'))
+        except UploadError as e:
+            return Response({'detail': e.detail}, status=e.status)
+        return Response(_upload_result_data(session, created, request), status=201)
+
+
 class EnterpriseActionItemsView(APIView):
     """Get all action items for an enterprise (for admin/owner view)."""
     permission_classes = [permissions.IsAuthenticated]
@@ -2296,8 +2782,8 @@ class EnterpriseActionItemsView(APIView):
                     'id': item.completed_by.id,
                     'name': f"{item.completed_by.first_name} {item.completed_by.last_name}".strip() or item.completed_by.email
                 } if item.completed_by else None,
-                'notes_count': item.notes.count(),
-                'documents_count': item.documents.count()
+                'notes_count': item.notes_count,
+                'documents_count': item.documents_count
             } for item in items]
             
             # Summary stats
@@ -2376,15 +2862,50 @@ class AssignActionItemView(APIView):
             return Response({'detail': 'Action item not found'}, status=404)
 
 
+class EnterpriseEvidenceExportView(APIView):
+    """
+    Download all of an enterprise's evidence attachments and action item
+    documents as one ZIP, streamed as it is built (see diagnostic.exports).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, enterprise_id):
+        from django.http import StreamingHttpResponse
+        from django.utils.text import slugify
+        from .exports import iter_evidence_zip
+
+        enterprise = get_object_or_404(Enterprise, pk=enterprise_id)
+        if not (
+            request.user.is_staff
+            or enterprise.owner_id == request.user.id
+            or TeamMember.objects.filter(
+                enterprise=enterprise,
+                user=request.user,
+                status=TeamMember.STATUS_ACTIVE,
+                role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_MANAGER],
+            ).exists()
+        ):
+            return Response({'detail': 'Permission denied'}, status=403)
+
+        filename = f"{slugify(enterprise.name) or 'enterprise'}-evidence-{timezone.localdate():%Y%m%d}.zip"
+        response = StreamingHttpResponse(iter_evidence_zip(enterprise), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # Let nginx pass pieces on as they are produced instead of buffering the archive
+        response['X-Accel-Buffering'] = 'no'
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+
 class EnterpriseTeamMembersView(APIView):
     """Get team members for an enterprise (for assigning action items)."""
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, enterprise_id):
+        from .avatars import avatar_url
         from .models import Enterprise, TeamMember
         
         try:
-            enterprise = Enterprise.objects.get(pk=enterprise_id)
+            enterprise = Enterprise.objects.select_related('owner').get(pk=enterprise_id)
             
             # Check permission
             if enterprise.owner != request.user:
@@ -2410,7 +2931,8 @@ class EnterpriseTeamMembersView(APIView):
                     'email': enterprise.owner.email,
                     'name': f"{enterprise.owner.first_name} {enterprise.owner.last_name}".strip() or enterprise.owner.email,
                     'role': 'OWNER',
-                    'is_owner': True
+                    'is_owner': True,
+                    'avatar_url': avatar_url(request, enterprise.owner, 64),
                 })
             
             # Add team members
@@ -2421,7 +2943,8 @@ class EnterpriseTeamMembersView(APIView):
                         'email': member.user.email,
                         'name': f"{member.user.first_name} {member.user.last_name}".strip() or member.user.email,
                         'role': member.role,
-                        'is_owner': False
+                        'is_owner': False,
+                        'avatar_url': avatar_url(request, member.user, 64),
                     })
             
             return Response({
@@ -60,10 +60,59 @@ echo ""
 echo "Collecting static files..."
 python manage.py collectstatic --noinput || echo "⚠ Static files collection failed (non-critical)"
 
+# Run a command in the background and restart it whenever it exits, with its
+# output prefixed by name so it can be told apart from gunicorn's in the logs
+supervise() {
+    local name=$1
+    shift
+    (
+        set -o pipefail
+        while true; do
+            echo "[$name] starting"
+            status=0
+            "$@" 2>&1 | sed -u "s/^/[$name] /" || status=$?
+            echo "[$name] exited with status $status, restarting in 5s"
+            sleep 5
+        done
+    ) &
+}
+
+# Avatar thumbnails and rendered reports are written to this service's media
+# disk (render.yaml mounts it at /app/media; Render disks cannot be shared
+# between services), so their workers run alongside gunicorn
+echo ""
+echo "Starting avatar thumbnail worker..."
+supervise process_avatars python manage.py process_avatars
+
+echo ""
+echo "Starting report rendering worker..."
+supervise render_reports python manage.py render_reports
+
+# Media housekeeping, daily, in the container that has the media disk:
+# expired upload sessions, and orphaned files once a week on Sundays
+media_jobs() {
+    while true; do
+        python manage.py sweep_uploads || echo "⚠ Upload session sweep failed"
+        if [ "$(date +%u)" = "7" ]; then
+            # Report only; run with --delete by hand after reviewing the report
+            python manage.py gc_media || echo "⚠ Media garbage collection failed"
+        fi
+        sleep 86400
+    done
+}
+
+echo ""
+echo "Starting media housekeeping..."
+supervise media_jobs media_jobs
+
 # Start server
 echo ""
 echo "=========================================="
 echo "Starting Gunicorn server..."
 echo "=========================================="
-exec gunicorn config.wsgi:application --bind 0.0.0.0:${PORT:-8000} --workers 3 --timeout 120
+# Threaded workers: --timeout only fires when a worker process stops
+# responding, not when one request runs long, so streaming exports such as
+# the evidence ZIP are not killed at 120s the way sync workers kill them
+exec gunicorn config.wsgi:application --bind 0.0.0.0:${PORT:-8000} \
+    --workers 3 --worker-class gthread --threads ${GUNICORN_THREADS:-4} --timeout 120
 